@@ -0,0 +1,245 @@
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from datetime import date
+from concurrent.futures import ProcessPoolExecutor
+
+from downloader import TokenBucket
+from photos_api import DailyQuota
+from album_cache import AlbumCache, CACHE_FILE as ALBUM_CACHE_FILE
+from sync_state import STATE_DIR_NAME, QuotaLedger
+
+# Budgets are per Google Cloud project and per machine, so accounts cannot override them
+BUDGET_KEYS = ("bandwidth_limit_kbps", "bandwidth_schedule", "daily_api_quota", "daily_media_quota")
+
+# Worker processes are spawned, not forked: the coordinator already runs threads
+_context = multiprocessing.get_context("spawn")
+
+_ledgers = {}  # local_folder -> QuotaLedger, one per process
+
+
+def expand_accounts(config):
+    """
+    One config per account: each `accounts` entry laid over the top-level
+    config (minus the shared budgets). Without `accounts`, the top-level
+    config is the only account. Raises ValueError unless every entry has a
+    local_folder of its own: the manifest, album list and metrics of an
+    account live in its folder, so two accounts cannot share one.
+    """
+    entries = config.get("accounts") or []
+    base = {key: value for key, value in config.items() if key != "accounts"}
+    if not entries:
+        return [dict(base, name=base.get("name") or "default")]
+    accounts, folders = [], {}
+    for index, entry in enumerate(entries):
+        account = dict(base)
+        account.update({key: value for key, value in entry.items() if key not in BUDGET_KEYS})
+        account.setdefault("name", f"account-{index + 1}")
+        if not entry.get("local_folder"):
+            raise ValueError(f"Account {account['name']!r} needs its own local_folder")
+        folder = os.path.normcase(os.path.abspath(entry["local_folder"]))
+        if folder in folders:
+            raise ValueError(f"Accounts {folders[folder]!r} and {account['name']!r} share local_folder {entry['local_folder']}")
+        folders[folder] = account["name"]
+        accounts.append(account)
+    return accounts
+
+
+def album_sizes(account):
+    """{title: item count} from the account's persisted album list; empty before its first sync."""
+    path = os.path.join(account.get("local_folder", ""), STATE_DIR_NAME, ALBUM_CACHE_FILE)
+    if not os.path.exists(path):
+        return {}
+    cache = AlbumCache(path, fetch=None)
+    return {title: albums[0].get("items_count", 0) for title, albums in cache.by_title.items()}
+
+
+def plan_shards(accounts):
+    """
+    Splits each account's selected albums into its `shards` (default 1)
+    groups, placing the largest albums first on the lightest shard.
+    Returns {key: (account, shard, titles, weight)}, heaviest first, so the
+    pool starts the longest work early and the short shards fill in behind.
+    """
+    shards = []
+    for account in accounts:
+        titles = list(account.get("selected_albums") or [])
+        count = max(1, min(int(account.get("shards") or 1), len(titles) or 1))
+        sizes = album_sizes(account)
+        groups = [[0, []] for _ in range(count)]
+        # Unknown albums (not listed yet) count as one item
+        for title in sorted(titles, key=lambda t: -max(1, sizes.get(t, 0))):
+            lightest = min(groups, key=lambda g: g[0])
+            lightest[0] += max(1, sizes.get(title, 0))
+            lightest[1].append(title)
+        for shard, (weight, group) in enumerate(groups):
+            key = account["name"] if count == 1 else f"{account['name']} #{shard + 1}/{count}"
+            shards.append((key, (account, shard if count > 1 else None, group, weight)))
+    shards.sort(key=lambda item: -item[1][3])
+    return dict(shards)
+
+
+class SharedBudget:
+    """
+    Bandwidth and daily-quota counters in shared memory. The coordinator
+    creates one and every worker process builds its limiter and quotas from
+    it, so a dozen accounts together stay within one budget. With a
+    `ledger_folder`, the daily counts are also kept in that folder's
+    sync-state database, so they survive restarts.
+    """
+    def __init__(self, ledger_folder=None):
+        self.ledger_folder = ledger_folder
+        self.bandwidth_lock = _context.Lock()
+        self.tokens = _context.RawValue('d', 0.0)
+        self.stamp = _context.RawValue('d', time.monotonic())
+        self.quota_lock = _context.Lock()
+        self.used = {name: _context.RawValue('q', 0) for name in ("api", "media")}
+        self.day = {name: _context.RawValue('q', 0) for name in ("api", "media")}
+        self.stop = _context.Event()  # set to stop queueing new downloads in every worker
+
+    def token_bucket(self, rate_fn):
+        return SharedTokenBucket(self, rate_fn)
+
+    def quota(self, name, limit):
+        ledger = None
+        if self.ledger_folder:
+            if self.ledger_folder not in _ledgers:
+                _ledgers[self.ledger_folder] = QuotaLedger(self.ledger_folder)
+            ledger = _ledgers[self.ledger_folder]
+        return SharedDailyQuota(self, name, limit, ledger)
+
+
+class SharedTokenBucket(TokenBucket):
+    """TokenBucket whose tokens and clock live in a SharedBudget; the rate is re-read per process."""
+    def __init__(self, budget, rate_fn):
+        self.rate = 0
+        self.rate_fn = rate_fn
+        self._rate_checked = 0.0
+        self._budget = budget
+        self._lock = budget.bandwidth_lock
+
+    @property
+    def tokens(self):
+        return self._budget.tokens.value
+
+    @tokens.setter
+    def tokens(self, value):
+        self._budget.tokens.value = value
+
+    @property
+    def _stamp(self):
+        return self._budget.stamp.value
+
+    @_stamp.setter
+    def _stamp(self, value):
+        self._budget.stamp.value = value
+
+
+class SharedDailyQuota(DailyQuota):
+    """DailyQuota counted in a SharedBudget, so every process draws on the same daily limit."""
+    def __init__(self, budget, name, limit, ledger=None):
+        self.name = name
+        self.limit = int(limit or 0)
+        self._used = budget.used[name]
+        self._ordinal = budget.day[name]
+        self._lock = budget.quota_lock
+        self.ledger = ledger
+        if ledger is not None:
+            with self._lock:
+                self._day, self.used = ledger.load(name)
+
+    @property
+    def used(self):
+        return self._used.value
+
+    @used.setter
+    def used(self, value):
+        self._used.value = value
+
+    @property
+    def _day(self):
+        return date.fromordinal(self._ordinal.value) if self._ordinal.value else None
+
+    @_day.setter
+    def _day(self, value):
+        self._ordinal.value = value.toordinal() if value else 0
+
+
+class SyncCoordinator:
+    """
+    Runs account (or album-shard) syncs in a pool of worker processes.
+    `run_shard(account, shard, titles)` runs in a worker and returns
+    (items queued, ok); `initializer(budget)` prepares each worker. Due
+    shards come from `scheduler`, keyed by shard, and are rescheduled by
+    whether they found changes. A shard is never run twice at once.
+    """
+    def __init__(self, run_shard, initializer, scheduler, workers=None, ledger_folder=None):
+        self.run_shard = run_shard
+        self.scheduler = scheduler
+        self.workers = max(1, int(workers or os.cpu_count() or 1))
+        self.budget = SharedBudget(ledger_folder)
+        self.shards = {}
+        self.results = {}  # key -> (items queued, ok) of its last finished run
+        self._running = {}  # key -> Future
+        self._lock = threading.Lock()
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=_context,
+                                         initializer=initializer, initargs=(self.budget,))
+
+    def set_shards(self, shards):
+        """Replaces the shard plan (see plan_shards); new shards are due immediately."""
+        with self._lock:
+            self.shards = dict(shards)
+        self.scheduler.set_albums(list(self.shards))
+
+    def dispatch(self):
+        """Submits every due shard that is not already running."""
+        with self._lock:
+            due = [key for key in self.scheduler.due() if key in self.shards and key not in self._running]
+            for key in due:
+                account, shard, titles, weight = self.shards[key]
+                logging.info(f"Starting {key}: {len(titles)} album(s)")
+                future = self._pool.submit(self.run_shard, account, shard, titles)
+                self._running[key] = future
+                future.add_done_callback(lambda f, key=key: self._finished(key, f))
+        return len(due)
+
+    def _finished(self, key, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            logging.error(f"Sync of {key} failed: {e}")
+            result = (0, False)
+        with self._lock:
+            self._running.pop(key, None)
+            self.results[key] = result
+        self.scheduler.record(key, changed=result[0] > 0)
+        self.scheduler.wake()
+
+    def seconds_until_due(self):
+        with self._lock:
+            running = set(self._running)
+        return self.scheduler.seconds_until_due(exclude=running)
+
+    def run_once(self):
+        """Runs every shard once and waits. Returns True if all of them succeeded."""
+        self.scheduler.reset()
+        self.dispatch()
+        self.wait()
+        with self._lock:
+            return all(ok for _, ok in self.results.values())
+
+    def wait(self):
+        with self._lock:
+            futures = list(self._running.values())
+        for future in futures:
+            try:
+                future.result()
+            except Exception:
+                pass  # logged by _finished
+
+    def close(self, wait=True):
+        """Stops the workers; running shards stop queueing and finish their in-flight downloads."""
+        self.budget.stop.set()
+        self._pool.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,138 @@
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+import time
+
+DEFAULT_TTL = 15 * 60  # seconds before a background refresh is triggered
+CACHE_FILE = "album_cache.json"
+
+
+def token_fingerprint(token):
+    """Short hash that tells tokens apart without storing them; None for no token."""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()[:16] if token else None
+
+
+class AlbumCache:
+    """
+    Persisted album list with a TTL. Reads are answered from memory; once the
+    list is older than `ttl` it is served stale while a background refresh
+    runs. Albums are indexed by id and by title for O(1) lookup.
+    `fetch` is a callable returning (albums_list, error_message).
+    `owner` identifies whose albums these are (see token_fingerprint); a
+    list saved for another owner is never served. None accepts any list.
+    """
+    def __init__(self, path, fetch, ttl=DEFAULT_TTL, owner=None):
+        self.path = path
+        self.fetch = fetch
+        self.ttl = ttl
+        self.owner = owner
+        self.fetched_at = 0.0
+        self.by_id = {}
+        self.by_title = {}
+        self._albums = []
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            if self.owner is not None and data.get("owner") != self.owner:
+                return  # another account's (or token's) albums
+            self._index(data.get("albums", []), data.get("fetched_at", 0.0))
+        except Exception as e:
+            logging.error(f"Failed to load album cache: {e}")
+
+    def _save(self):
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(self.path))
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({"fetched_at": self.fetched_at, "owner": self.owner, "albums": self._albums}, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logging.error(f"Failed to save album cache: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _index(self, albums, fetched_at):
+        by_id, by_title = {}, {}
+        for album in albums:
+            by_id[album['id']] = album
+            by_title.setdefault(album['title'], []).append(album)
+        with self._lock:
+            self._albums = albums
+            self.by_id = by_id
+            self.by_title = by_title
+            self.fetched_at = fetched_at
+        for title, ids in self.duplicates().items():
+            logging.warning(f"Duplicate album title '{title}' ({len(ids)} albums); syncing the first one")
+
+    @property
+    def age(self):
+        return time.time() - self.fetched_at
+
+    @property
+    def stale(self):
+        return self.age >= self.ttl
+
+    def set_owner(self, owner):
+        """Switches to another owner's albums: the current list is dropped, so the next read fetches."""
+        if owner == self.owner:
+            return
+        self.owner = owner
+        self._index([], 0.0)
+
+    def refresh(self):
+        """Fetches the album list now. Returns (albums_list, error_message)."""
+        owner = self.owner
+        albums, err = self.fetch()
+        # A list fetched for an owner that was switched out meanwhile is not kept
+        if not err and owner == self.owner:
+            self._index(albums, time.time())
+            self._save()
+        return albums, err
+
+    def refresh_async(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def albums(self, force=False):
+        """
+        Returns (albums_list, error_message). Hits the network only when
+        forced or when nothing is cached; a stale list triggers a background refresh.
+        """
+        if force or not self.fetched_at:
+            return self.refresh()
+        if self.stale:
+            self.refresh_async()
+        with self._lock:
+            return list(self._albums), None
+
+    def find(self, title):
+        """The album with this title (the first one if the title is duplicated), or None."""
+        with self._lock:
+            matches = self.by_title.get(title)
+        return matches[0] if matches else None
+
+    def duplicates(self):
+        """{title: [album ids]} for every title shared by more than one album."""
+        with self._lock:
+            return {title: [a['id'] for a in albums]
+                    for title, albums in self.by_title.items() if len(albums) > 1}
@@ -0,0 +1,301 @@
+"""
+Local stand-in for the Google Photos Library API, for benchmarks.
+
+Serves GET /v1/albums, POST /v1/mediaItems:search (paginated),
+GET /v1/mediaItems:batchGet and the `<baseUrl>=d` media downloads (with
+Range support; `=wN-hN` previews are a quarter of the size), all generated
+deterministically from the album and item counts. Latency, 5xx failures and 429 throttling can be injected to
+exercise the retry paths, and --url-ttl makes baseUrls expire (403) like
+Google's do after about an hour.
+
+    python bench/fake_photos_server.py --albums 2 --items 10000 --latency-ms 20 --throttle-rate 0.01
+"""
+import sys
+import json
+import time
+import re
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+DEFAULT_PORT = 8765
+DEFAULT_ITEM_SIZE = 4096
+ALBUMS_MAX_PAGE = 50
+ITEMS_MAX_PAGE = 100
+BATCH_GET_MAX = 50
+PREVIEW_VARIANT = re.compile(r"w\d+-h\d+")
+
+
+class FakeLibrary:
+    """Deterministic albums and media items; nothing is stored per item."""
+    def __init__(self, albums=1, items_per_album=1000, item_size=DEFAULT_ITEM_SIZE, url_ttl=0.0, video_every=0):
+        self.albums = albums
+        self.items_per_album = items_per_album
+        self.item_size = item_size
+        self.url_ttl = url_ttl  # seconds a baseUrl stays valid; 0 = forever
+        self.video_every = video_every  # every Nth item is a video; 0 = photos only
+        self._block = hashlib.sha256(b"gemini-bench").digest() * (item_size // 32 + 1)
+
+    def album(self, index):
+        return {"id": f"album-{index}", "title": f"Bench Album {index}",
+                "mediaItemsCount": str(self.items_per_album)}
+
+    def media_item(self, base, album_index, index):
+        media_id = f"m{album_index}-{index}"
+        created = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(1600000000 + index * 60))
+        video = bool(self.video_every) and index % self.video_every == self.video_every - 1
+        return {
+            "id": media_id,
+            "filename": f"VID_{index:06d}.mp4" if video else f"IMG_{index:06d}.jpg",
+            "mimeType": "video/mp4" if video else "image/jpeg",
+            # The issue time is part of the url, so expiry needs no per-item state
+            "baseUrl": f"{base}/media/{time.time():.3f}/{media_id}",
+            "mediaMetadata": {"creationTime": created, "width": "4032", "height": "3024",
+                              "video" if video else "photo": {"cameraMake": "Bench", "cameraModel": "Fake 1"}},
+        }
+
+    def item_by_id(self, base, media_id):
+        """The media item for an id handed out by media_item(), or None."""
+        try:
+            album_index, index = (int(n) for n in media_id[1:].split('-'))
+        except ValueError:
+            return None
+        if media_id[:1] != 'm' or not (0 <= album_index < self.albums and 0 <= index < self.items_per_album):
+            return None
+        return self.media_item(base, album_index, index)
+
+    def expired(self, issued):
+        return bool(self.url_ttl) and time.time() - float(issued) > self.url_ttl
+
+    def content(self, media_id, preview=False):
+        # Unique prefix so blobs differ; the rest is shared filler
+        head = (media_id + ("~preview" if preview else "")).encode().ljust(32, b'\0')
+        return (head + self._block)[:max(32, self.item_size // 4) if preview else self.item_size]
+
+
+class FaultInjector:
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, failure_rate=0.0, throttle_rate=0.0,
+                 retry_after=0.05, seed=1):
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.failure_rate = failure_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counts = {"requests": 0, "failed": 0, "throttled": 0}
+
+    def decide(self):
+        """Sleeps the injected latency; returns 500, 429 or None."""
+        with self._lock:
+            roll = self._random.random()
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            self.counts["requests"] += 1
+            outcome = None
+            if roll < self.throttle_rate:
+                outcome = 429
+                self.counts["throttled"] += 1
+            elif roll < self.throttle_rate + self.failure_rate:
+                outcome = 500
+                self.counts["failed"] += 1
+        if delay:
+            time.sleep(delay)
+        return outcome
+
+
+class FakePhotosHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate small writes; with Nagle on, keep-alive
+    # clients stall ~40ms per request on delayed ACKs and the numbers mean nothing
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def base(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if status == 429:
+            self.send_header('Retry-After', str(self.server.faults.retry_after))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def injected(self):
+        status = self.server.faults.decide()
+        if status:
+            self.send_json(status, {"error": {"code": status, "message": "injected by fake server"}})
+            return True
+        return False
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if self.injected():
+            return
+        if url.path == '/v1/albums':
+            self.list_albums(parse_qs(url.query))
+        elif url.path == '/v1/mediaItems:batchGet':
+            self.batch_get(parse_qs(url.query).get('mediaItemIds', []))
+        elif url.path.startswith('/media/') and '=' in url.path:
+            path, _, variant = url.path.rpartition('=')
+            issued, _, media_id = path[len('/media/'):].partition('/')
+            preview = bool(PREVIEW_VARIANT.fullmatch(variant))
+            if variant != 'd' and not preview:
+                self.send_json(400, {"error": {"code": 400, "message": f"unsupported variant {variant}"}})
+            elif self.server.library.expired(issued):
+                self.send_json(403, {"error": {"code": 403, "message": "baseUrl expired"}})
+            else:
+                self.send_media(media_id, preview)
+        else:
+            self.send_json(404, {"error": {"code": 404, "message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}')
+        if self.injected():
+            return
+        if self.path == '/v1/mediaItems:search':
+            self.search(body)
+        else:
+            self.send_json(404, {"error": {"code": 404, "message": "not found"}})
+
+    def list_albums(self, query):
+        library = self.server.library
+        size = min(int(query.get('pageSize', [20])[0]), ALBUMS_MAX_PAGE)
+        start = int(query.get('pageToken', [0])[0])
+        end = min(start + size, library.albums)
+        page = {"albums": [library.album(i) for i in range(start, end)]}
+        if end < library.albums:
+            page["nextPageToken"] = str(end)
+        self.send_json(200, page)
+
+    def search(self, body):
+        library = self.server.library
+        album_id = body.get('albumId', '')
+        if not album_id.startswith('album-'):
+            self.send_json(400, {"error": {"code": 400, "message": "albumId required"}})
+            return
+        album_index = int(album_id[len('album-'):])
+        size = min(int(body.get('pageSize', 25)), ITEMS_MAX_PAGE)
+        start = int(body.get('pageToken', 0))
+        end = min(start + size, library.items_per_album)
+        page = {"mediaItems": [library.media_item(self.base, album_index, i) for i in range(start, end)]}
+        if end < library.items_per_album:
+            page["nextPageToken"] = str(end)
+        self.send_json(200, page)
+
+    def batch_get(self, ids):
+        if not 0 < len(ids) <= BATCH_GET_MAX:
+            self.send_json(400, {"error": {"code": 400, "message": f"1 to {BATCH_GET_MAX} mediaItemIds required"}})
+            return
+        self.server.batch_gets += 1
+        results = []
+        for media_id in ids:
+            media_item = self.server.library.item_by_id(self.base, media_id)
+            if media_item:
+                results.append({"mediaItem": media_item})
+            else:
+                results.append({"status": {"code": 5, "message": "NOT_FOUND"}})
+        self.send_json(200, {"mediaItemResults": results})
+
+    def send_media(self, media_id, preview=False):
+        data = self.server.library.content(media_id, preview)
+        start, status = 0, 200
+        header = self.headers.get('Range')
+        if header and header.startswith('bytes=') and header.endswith('-'):
+            start = int(header[len('bytes='):-1])
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(data)}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            status = 206
+        self.send_response(status)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(data) - start))
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{len(data) - 1}/{len(data)}')
+        self.end_headers()
+        self.wfile.write(data[start:])
+
+
+class FakePhotosServer:
+    """Runs the fake API on a background thread; `base_url` is the value for GEMINI_PHOTOS_API_BASE."""
+    def __init__(self, library, faults=None, port=0):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), FakePhotosHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.library = library
+        self.httpd.faults = faults or FaultInjector()
+        self.httpd.batch_gets = 0
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def counts(self):
+        return dict(self.httpd.faults.counts, batch_gets=self.httpd.batch_gets)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def add_library_arguments(parser):
+    parser.add_argument('--albums', type=int, default=1)
+    parser.add_argument('--item-size', type=int, default=DEFAULT_ITEM_SIZE, help="bytes per media item")
+    parser.add_argument('--url-ttl', type=float, default=0.0, help="seconds before a baseUrl expires (0 = never)")
+    parser.add_argument('--video-every', type=int, default=0, help="make every Nth item a video (0 = none)")
+
+
+def add_fault_arguments(parser):
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="added to every request")
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help="random extra latency, 0..N ms")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="fraction of requests answered 500")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="fraction of requests answered 429")
+    parser.add_argument('--retry-after', type=float, default=0.05, help="Retry-After seconds sent with 429s")
+    parser.add_argument('--seed', type=int, default=1)
+
+
+def faults_from_args(args):
+    return FaultInjector(args.latency_ms, args.jitter_ms, args.failure_rate, args.throttle_rate,
+                         args.retry_after, args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Google Photos Library API")
+    add_library_arguments(parser)
+    add_fault_arguments(parser)
+    parser.add_argument('--items', type=int, default=1000, help="media items per album")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+    server = FakePhotosServer(FakeLibrary(args.albums, args.items, args.item_size, args.url_ttl, args.video_every),
+                              faults_from_args(args), port=args.port)
+    print(f"Fake Photos API at {server.base_url} (set GEMINI_PHOTOS_API_BASE to this)", file=sys.stderr)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
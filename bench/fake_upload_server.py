@@ -0,0 +1,218 @@
+"""
+Local stand-in for the web app's upload endpoints, for testing run_app.py's
+upload pipeline without a deployed app.
+
+    POST /api/uploads/batch           multipart: a JSON "manifest" part plus one part per file
+    POST /api/uploads/sessions        {"name", "path", "size", "sha1", ...} -> {"upload_id", "offset"}
+    GET  /api/uploads/sessions/<id>   -> {"offset", "status"}
+    PUT  /api/uploads/sessions/<id>   one chunk, with Content-Range: bytes start-end/total
+
+Received files are checked against their SHA-1 and written under --out.
+Latency, 5xx failures and 429s can be injected as for the fake Photos server.
+
+    python bench/fake_upload_server.py --out /tmp/received --failure-rate 0.05
+    # then set "web_app_url": "http://127.0.0.1:8766" in sync_config.json
+"""
+import os
+import sys
+import json
+import uuid
+import hashlib
+import argparse
+import threading
+import email.parser
+import email.policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_photos_server import FaultInjector, add_fault_arguments, faults_from_args
+
+DEFAULT_PORT = 8766
+BATCH_PATH = "/api/uploads/batch"
+SESSIONS_PATH = "/api/uploads/sessions"
+
+
+def parse_multipart(content_type, body):
+    """[(name, filename, bytes)] for each part of a multipart/form-data body."""
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body)
+    return [(part.get_param('name', header='content-disposition'), part.get_filename(),
+             part.get_payload(decode=True)) for part in message.iter_parts()]
+
+
+class UploadStore:
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        self.sessions = {}  # upload_id -> {"meta", "offset", "status", "tmp"}
+        self.files = 0
+        self.bytes = 0
+        self.lock = threading.Lock()
+        os.makedirs(out_dir, exist_ok=True)
+
+    def target(self, rel):
+        path = os.path.normpath(os.path.join(self.out_dir, rel))
+        if not path.startswith(os.path.abspath(self.out_dir)):
+            raise ValueError("path escapes the upload folder")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def received(self, size):
+        with self.lock:
+            self.files += 1
+            self.bytes += size
+
+
+class FakeUploadHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def store(self):
+        return self.server.store
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if status == 429:
+            self.send_header('Retry-After', str(self.server.faults.retry_after))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def injected(self):
+        status = self.server.faults.decide()
+        if status:
+            self.send_json(status, {"error": "injected by fake server"})
+            return True
+        return False
+
+    def session_id(self):
+        return self.path[len(SESSIONS_PATH) + 1:] if self.path.startswith(SESSIONS_PATH + '/') else None
+
+    def do_GET(self):
+        session = self.store.sessions.get(self.session_id())
+        if session is None:
+            self.send_json(404, {"error": "unknown session"})
+        else:
+            self.send_json(200, {"offset": session["offset"], "status": session["status"]})
+
+    def do_POST(self):
+        body = self.read_body()  # always drain, so keep-alive stays in sync
+        if self.injected():
+            return
+        if self.path == BATCH_PATH:
+            self.receive_batch(body)
+        elif self.path == SESSIONS_PATH:
+            meta = json.loads(body)
+            upload_id = uuid.uuid4().hex
+            tmp = self.store.target(os.path.join('.sessions', upload_id))
+            open(tmp, 'wb').close()
+            self.store.sessions[upload_id] = {"meta": meta, "offset": 0, "status": "active", "tmp": tmp}
+            self.send_json(200, {"upload_id": upload_id, "offset": 0})
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def receive_batch(self, body):
+        parts = parse_multipart(self.headers.get('Content-Type', ''), body)
+        manifest = json.loads(next(data for name, _, data in parts if name == 'manifest'))
+        blobs = [data for name, _, data in parts if name != 'manifest']
+        results = []
+        for meta, data in zip(manifest, blobs):
+            ok = hashlib.sha1(data).hexdigest() == meta["sha1"] and len(data) == meta["size"]
+            if ok:
+                with open(self.store.target(meta["path"]), 'wb') as f:
+                    f.write(data)
+                self.store.received(len(data))
+            results.append({"path": meta["path"], "status": "ok" if ok else "checksum_mismatch"})
+        self.send_json(200, {"results": results})
+
+    def do_PUT(self):
+        body = self.read_body()
+        session = self.store.sessions.get(self.session_id())
+        if session is None:
+            self.send_json(404, {"error": "unknown session"})
+            return
+        if self.injected():
+            return
+        spec = self.headers.get('Content-Range', '')[len('bytes '):]
+        span, _, total = spec.partition('/')
+        start = int(span.split('-')[0])
+        if start != session["offset"]:
+            self.send_json(409, {"offset": session["offset"]})
+            return
+        with open(session["tmp"], 'ab') as f:
+            f.write(body)
+        session["offset"] += len(body)
+        if session["offset"] >= int(total):
+            meta = session["meta"]
+            digest = hashlib.sha1()
+            with open(session["tmp"], 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(block)
+            if digest.hexdigest() != meta["sha1"]:
+                os.remove(session["tmp"])
+                del self.store.sessions[self.session_id()]
+                self.send_json(422, {"error": "checksum mismatch"})
+                return
+            os.replace(session["tmp"], self.store.target(meta["path"]))
+            session["status"] = "complete"
+            self.store.received(session["offset"])
+        self.send_json(200, {"offset": session["offset"], "status": session["status"]})
+
+
+class FakeUploadServer:
+    """Runs the fake upload endpoints on a background thread; `base_url` is the value for web_app_url."""
+    def __init__(self, out_dir, faults=None, port=0):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), FakeUploadHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.store = UploadStore(out_dir)
+        self.httpd.faults = faults or FaultInjector()
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def store(self):
+        return self.httpd.store
+
+    @property
+    def counts(self):
+        return dict(self.httpd.faults.counts)
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake web app upload endpoints")
+    add_fault_arguments(parser)
+    parser.add_argument('--out', required=True, help="folder to store received files in")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+    server = FakeUploadServer(args.out, faults_from_args(args), port=args.port)
+    print(f"Fake upload server at {server.base_url} (set web_app_url to this)", file=sys.stderr)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Startup benchmark: launches headless one-shot runs (--once) of
+run_cloud_sync.py and run_app.py the way cron would, against the fake
+servers, and checks the startup time each client reports against
+headless.STARTUP_BUDGET. Wall time covers the whole run, sync included.
+
+    python bench/startup_benchmark.py
+    python bench/startup_benchmark.py --runs 10 --items 50
+"""
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+from fake_photos_server import FakeLibrary, FakePhotosServer
+from fake_upload_server import FakeUploadServer
+from headless import STARTUP_BUDGET
+
+STARTUP_LINE = re.compile(r"(?:started in|took) (\d+) ms")
+
+
+def launch(script, workdir, env):
+    """Runs one --once client; returns (exit code, wall seconds, reported startup seconds)."""
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, os.path.join(ROOT_DIR, script), '--once'], cwd=workdir, env=env,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    wall = time.perf_counter() - started
+    match = STARTUP_LINE.search(proc.stderr)
+    if proc.returncode != 0 or not match:
+        sys.stderr.write(proc.stderr[-2000:])
+    return proc.returncode, wall, int(match.group(1)) / 1000 if match else None
+
+
+def bench_client(name, script, config, runs, env=None):
+    workdir = tempfile.mkdtemp(prefix=f"gemini-startup-{name}-")
+    try:
+        with open(os.path.join(workdir, "sync_config.json"), 'w', encoding='utf-8') as f:
+            json.dump(config, f)
+        # The first run syncs everything; the rest are the steady-state no-op runs cron sees
+        results = [launch(script, workdir, dict(os.environ, **(env or {}))) for _ in range(runs)]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {"client": name,
+            "failed_runs": sum(1 for code, _, _ in results if code != 0),
+            "startup": [s for _, _, s in results if s is not None],
+            "wall": [w for _, w, _ in results]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure headless startup of the sync clients")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--items', type=int, default=20, help="photos in the fake album / local folder")
+    parser.add_argument('--budget', type=float, default=STARTUP_BUDGET, help="seconds")
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="gemini-startup-")
+    photos = FakePhotosServer(FakeLibrary(1, args.items)).start()
+    uploads = FakeUploadServer(os.path.join(work, "received")).start()
+    try:
+        watched = os.path.join(work, "watched")
+        os.makedirs(watched)
+        for i in range(args.items):
+            with open(os.path.join(watched, f"IMG_{i:04d}.jpg"), 'wb') as f:
+                f.write(os.urandom(4096))
+        results = [
+            bench_client("cloud_sync", "run_cloud_sync.py", {
+                "local_folder": os.path.join(work, "downloads"), "api_key": "bench-token",
+                "selected_albums": [FakeLibrary().album(0)["title"]], "generate_thumbnails": False,
+            }, args.runs, env={"GEMINI_PHOTOS_API_BASE": photos.base_url}),
+            bench_client("app", "run_app.py", {
+                "local_folder": watched, "web_app_url": uploads.base_url, "generate_thumbnails": False,
+            }, args.runs),
+        ]
+    finally:
+        photos.stop()
+        uploads.stop()
+        shutil.rmtree(work, ignore_errors=True)
+
+    print(f"\n{'client':>10} {'runs':>5} {'failed':>7} {'startup p50 ms':>15} {'startup max ms':>15} "
+          f"{'wall p50 ms':>12} {'wall max ms':>12}")
+    over = []
+    for r in results:
+        startup = r["startup"] or [float('nan')]
+        print(f"{r['client']:>10} {args.runs:>5} {r['failed_runs']:>7} "
+              f"{statistics.median(startup) * 1000:>15.0f} {max(startup) * 1000:>15.0f} "
+              f"{statistics.median(r['wall']) * 1000:>12.0f} {max(r['wall']) * 1000:>12.0f}")
+        if r["failed_runs"] or max(startup) > args.budget:
+            over.append(r["client"])
+    if over:
+        print(f"Over the {args.budget * 1000:.0f} ms startup budget or failed: {', '.join(over)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
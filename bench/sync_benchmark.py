@@ -0,0 +1,251 @@
+"""
+Sync benchmark: runs the real run_cloud_sync pipeline (album listing,
+manifest diff, download engine, blob store, album links) against the fake
+Photos server and reports throughput, per-item latency, peak RSS and CPU.
+
+    python bench/sync_benchmark.py                         # 1k, 10k and 100k items
+    python bench/sync_benchmark.py --items 10000 --latency-ms 30 --throttle-rate 0.02
+    python bench/sync_benchmark.py --items 1000 10000 --json results.json
+    python bench/sync_benchmark.py --items 10000 --baseline results.json   # exit 1 on regression
+    python bench/sync_benchmark.py --items 20000 --accounts 4 --latency-ms 20   # 4 accounts, one process each
+    python bench/sync_benchmark.py --items 2000 --item-size 1000000 --bandwidth-kbps 20000 \
+        --url-ttl 30 --base-url-max-age 20   # baseUrls expire mid-sync; batchGet must keep up
+
+Each size runs in a fresh subprocess so RSS and CPU figures are its own;
+the fake server runs in this process. Every run syncs twice: a cold sync
+that downloads everything, then a no-op resync of the unchanged library.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+from fake_photos_server import (FakeLibrary, FakePhotosServer, add_library_arguments, add_fault_arguments,
+                                faults_from_args)
+from photos_api import DEFAULT_BASE_URL_MAX_AGE
+from priority import SYNC_ORDERS, DEFAULT_SYNC_ORDER
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+DEFAULT_MAX_REGRESSION = 0.2  # fail if items/s drops more than 20% below the baseline
+
+
+def percentile(samples, q):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def usage():
+    if resource is None:
+        return None, None
+    ru = resource.getrusage(resource.RUSAGE_SELF)
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = ru.ru_maxrss if sys.platform == 'darwin' else ru.ru_maxrss * 1024
+    return rss, ru.ru_utime + ru.ru_stime
+
+
+def run_child(args):
+    """Runs inside the subprocess: one cold sync plus one resync of args.run items."""
+    import downloader
+    import run_cloud_sync as sync
+
+    latencies = []
+    timed = downloader.download_file
+
+    def download_file(*a, **kw):
+        started = time.perf_counter()
+        try:
+            return timed(*a, **kw)
+        finally:
+            latencies.append(time.perf_counter() - started)
+    downloader.download_file = download_file
+
+    previews_done = []  # when the last preview pass ended, in progressive mode
+    sync_album = sync.sync_album_content
+
+    def sync_album_content(*a, **kw):
+        try:
+            return sync_album(*a, **kw)
+        finally:
+            if kw.get("preview"):
+                previews_done.append(time.perf_counter())
+    sync.sync_album_content = sync_album_content
+
+    folder = tempfile.mkdtemp(prefix="gemini-bench-")
+    try:
+        full = args.full_pipeline
+        sync.config.update({
+            "local_folder": folder,
+            "api_key": "bench-token",
+            "download_workers": args.workers,
+            "max_connections_per_host": args.workers,
+            "daily_api_quota": 0,
+            "daily_media_quota": 0,
+            "bandwidth_limit_kbps": args.bandwidth_kbps,
+            "base_url_max_age": args.base_url_max_age,
+            "bandwidth_schedule": [],
+            "generate_thumbnails": full,
+            "detect_duplicates": full,
+            "index_metadata": full,
+            "sync_order": args.sync_order,
+            "progressive_sync": args.progressive,
+        })
+        if args.accounts:
+            # One album per account, each synced by its own worker process
+            sync.config["accounts"] = [{"name": f"bench-{i}", "local_folder": os.path.join(folder, f"account-{i}"),
+                                        "selected_albums": [FakeLibrary().album(i)["title"]]}
+                                       for i in range(args.accounts)]
+            sync.config["account_workers"] = args.accounts
+        headers = sync.get_headers()
+        result = {"items": args.run}
+
+        for phase in ("cold", "resync"):
+            latencies.clear()
+            previews_done.clear()
+            started = time.perf_counter()
+            if args.accounts:
+                # Downloads happen in the worker processes, so no per-item latencies here
+                if not sync.sync_once():
+                    raise SystemExit("Multi-account sync failed")
+                queued = sum(result[0] for result in sync.coordinator.results.values())
+            else:
+                albums, err = sync.get_album_cache().refresh()
+                if err:
+                    raise SystemExit(f"Album listing failed: {err}")
+                results = sync.sync_listed_albums(albums, headers)
+                queued = sum(result[0] for result in results.values())
+            elapsed = time.perf_counter() - started
+            result[phase] = {
+                "seconds": round(elapsed, 3),
+                "items_per_second": round(args.run / elapsed, 1),
+                "downloaded": queued,
+                "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+                "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+            }
+            if previews_done:
+                result[phase]["previews_seconds"] = round(previews_done[-1] - started, 3)
+        result["mb_per_second"] = round(args.run * args.item_size / result["cold"]["seconds"] / 1e6, 2)
+        rss, cpu = usage()
+        result["peak_rss_mb"] = round(rss / (1024 * 1024), 1) if rss else None
+        result["cpu_seconds"] = round(cpu, 2) if cpu is not None else None
+        print(json.dumps(result))
+    finally:
+        if sync.download_engine is not None:
+            sync.download_engine.close()
+        if sync.coordinator is not None:
+            sync.coordinator.close()
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def run_size(args, items):
+    albums = max(args.albums, args.accounts)
+    per_album = max(1, items // albums)
+    server = FakePhotosServer(FakeLibrary(albums, per_album, args.item_size, args.url_ttl, args.video_every),
+                              faults_from_args(args)).start()
+    try:
+        env = dict(os.environ, GEMINI_PHOTOS_API_BASE=server.base_url)
+        cmd = [sys.executable, os.path.abspath(__file__), '--run', str(per_album * albums),
+               '--workers', str(args.workers), '--item-size', str(args.item_size),
+               '--bandwidth-kbps', str(args.bandwidth_kbps), '--base-url-max-age', str(args.base_url_max_age),
+               '--accounts', str(args.accounts), '--sync-order', args.sync_order]
+        if args.full_pipeline:
+            cmd.append('--full-pipeline')
+        if args.progressive:
+            cmd.append('--progressive')
+        proc = subprocess.run(cmd, env=env, cwd=ROOT_DIR, stdout=subprocess.PIPE, text=True)
+        if proc.returncode != 0:
+            raise SystemExit(f"Benchmark run for {items} items failed (exit {proc.returncode})")
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        result["server"] = server.counts
+        return result
+    finally:
+        server.stop()
+
+
+def report(results):
+    print(f"\n{'items':>8} {'cold s':>8} {'items/s':>9} {'MB/s':>7} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'previews s':>10} {'resync s':>9} {'RSS MB':>7} {'CPU s':>7} {'429s':>5} {'5xx':>5} {'batchGet':>8}")
+    for r in results:
+        cold = r["cold"]
+        print(f"{r['items']:>8} {cold['seconds']:>8.2f} {cold['items_per_second']:>9.0f} "
+              f"{r['mb_per_second']:>7.1f} {cold['p50_ms']:>8.2f} {cold['p99_ms']:>8.2f} "
+              f"{cold.get('previews_seconds', 0):>10.2f} {r['resync']['seconds']:>9.2f} {r['peak_rss_mb'] or 0:>7.0f} {r['cpu_seconds'] or 0:>7.1f} "
+              f"{r['server']['throttled']:>5} {r['server']['failed']:>5} {r['server']['batch_gets']:>8}")
+
+
+def regressions(results, baseline_path, tolerance):
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {r["items"]: r for r in json.load(f)["results"]}
+    problems = []
+    for r in results:
+        old = baseline.get(r["items"])
+        if not old:
+            continue
+        for phase in ("cold", "resync"):
+            before, after = old[phase]["items_per_second"], r[phase]["items_per_second"]
+            if after < before * (1 - tolerance):
+                problems.append(f"{r['items']} items, {phase}: {after:.0f} items/s vs {before:.0f} baseline")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark run_cloud_sync against a fake Photos API")
+    add_library_arguments(parser)
+    add_fault_arguments(parser)
+    parser.add_argument('--items', type=int, nargs='+', default=list(DEFAULT_SIZES))
+    parser.add_argument('--workers', type=int, default=8, help="download_workers for the sync")
+    parser.add_argument('--bandwidth-kbps', type=int, default=0, help="bandwidth_limit_kbps for the sync")
+    parser.add_argument('--base-url-max-age', type=float, default=DEFAULT_BASE_URL_MAX_AGE,
+                        help="base_url_max_age for the sync")
+    parser.add_argument('--accounts', type=int, default=0,
+                        help="sync this many accounts (one album each) through the multi-account coordinator")
+    parser.add_argument('--sync-order', choices=SYNC_ORDERS, default=DEFAULT_SYNC_ORDER, help="sync_order for the sync")
+    parser.add_argument('--progressive', action='store_true',
+                        help="progressive_sync: previews first, then originals (reports when the previews were done)")
+    parser.add_argument('--full-pipeline', action='store_true',
+                        help="also run thumbnails, duplicate detection and metadata indexing")
+    parser.add_argument('--json', help="write results to this file")
+    parser.add_argument('--baseline', help="earlier --json output to compare against")
+    parser.add_argument('--max-regression', type=float, default=DEFAULT_MAX_REGRESSION)
+    parser.add_argument('--run', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_child(args)
+        return
+
+    results = []
+    for items in args.items:
+        print(f"Benchmarking {items} items...", file=sys.stderr)
+        results.append(run_size(args, items))
+    report(results)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"args": {k: v for k, v in vars(args).items() if k not in ('run', 'json', 'baseline')},
+                       "results": results}, f, indent=2)
+    if args.baseline:
+        problems = regressions(results, args.baseline, args.max_regression)
+        for p in problems:
+            print(f"REGRESSION: {p}", file=sys.stderr)
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
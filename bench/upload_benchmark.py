@@ -0,0 +1,104 @@
+"""
+Upload benchmark: feeds a synthetic phone dump (many photos, a few videos)
+through run_app's UploadPipeline into the fake upload server and reports
+files/minute and MB/s. With --restart-after the pipeline is stopped part
+way and a fresh one resumes from the persistent outbox, as after a crash.
+
+    python bench/upload_benchmark.py --photos 500 --videos 5
+    python bench/upload_benchmark.py --photos 500 --videos 5 --failure-rate 0.05 --restart-after 200
+"""
+import os
+import sys
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+import threading
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from fake_photos_server import add_fault_arguments, faults_from_args
+from fake_upload_server import FakeUploadServer
+from uploader import UploadPipeline, DEFAULT_UPLOAD_WORKERS
+
+
+def make_dump(folder, photos, videos, photo_size, video_size):
+    """Writes distinct files into DCIM-like album folders; returns their paths."""
+    paths = []
+    for i in range(photos + videos):
+        video = i >= photos
+        album = os.path.join(folder, "Camera" if not video else "Videos")
+        os.makedirs(album, exist_ok=True)
+        path = os.path.join(album, f"{'VID' if video else 'IMG'}_{i:05d}.{'mp4' if video else 'jpg'}")
+        size = video_size if video else photo_size
+        seed = hashlib.sha256(str(i).encode()).digest()
+        with open(path, 'wb') as f:
+            f.write((seed * (size // len(seed) + 1))[:size])
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the run_app upload pipeline")
+    add_fault_arguments(parser)
+    parser.add_argument('--photos', type=int, default=500)
+    parser.add_argument('--videos', type=int, default=5)
+    parser.add_argument('--photo-size', type=int, default=3 * 1024 * 1024)
+    parser.add_argument('--video-size', type=int, default=60 * 1024 * 1024)
+    parser.add_argument('--workers', type=int, default=DEFAULT_UPLOAD_WORKERS)
+    parser.add_argument('--restart-after', type=int, default=0,
+                        help="stop the pipeline after this many uploads and resume with a new one")
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="gemini-upload-bench-")
+    source, received = os.path.join(work, "phone"), os.path.join(work, "received")
+    try:
+        paths = make_dump(source, args.photos, args.videos, args.photo_size, args.video_size)
+        total_bytes = sum(os.path.getsize(p) for p in paths)
+        server = FakeUploadServer(received, faults_from_args(args)).start()
+
+        done = threading.Event()
+        uploaded = set()
+        lock = threading.Lock()
+
+        def on_uploaded(path):
+            with lock:
+                uploaded.add(path)
+                if len(uploaded) == len(paths) or len(uploaded) == args.restart_after:
+                    done.set()
+
+        started = time.perf_counter()
+        pipeline = UploadPipeline(source, server.base_url, workers=args.workers, on_uploaded=on_uploaded)
+        for path in paths:
+            pipeline.enqueue(path)
+        if args.restart_after:
+            done.wait()
+            pipeline.stop(wait=False)
+            print(f"Stopped after {len(uploaded)} uploads; resuming from the outbox", file=sys.stderr)
+            done.clear()
+            # A fresh pipeline picks the remaining work up from the outbox alone
+            pipeline = UploadPipeline(source, server.base_url, workers=args.workers, on_uploaded=on_uploaded)
+            if len(uploaded) == len(paths):
+                done.set()
+        done.wait()
+        elapsed = time.perf_counter() - started
+        pipeline.stop()
+        server.stop()
+
+        missing = [p for p in paths if not os.path.exists(
+            os.path.join(received, os.path.relpath(p, source)))]
+        print(f"\n{len(paths)} files ({total_bytes / 1e6:.0f} MB) in {elapsed:.1f}s: "
+              f"{len(paths) / elapsed * 60:.0f} files/min, {total_bytes / elapsed / 1e6:.1f} MB/s")
+        print(f"Server: {server.store.files} files received, {server.counts['failed']} 5xx and "
+              f"{server.counts['throttled']} 429s injected; {len(missing)} missing")
+        if missing:
+            sys.exit(1)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import os
+import hashlib
+import logging
+import shutil
+
+from sync_state import state_dir
+
+BLOBS_DIR = "blobs"
+
+
+class BlobStore:
+    """
+    Stores each media item once under <local_folder>/.gemini_sync/blobs,
+    addressed by its mediaItem id. Album folders hold hardlinks to the blobs,
+    falling back to symlinks and then copies where the filesystem refuses.
+    """
+    def __init__(self, local_folder):
+        self.root = os.path.join(state_dir(local_folder), BLOBS_DIR)
+
+    def path_for(self, media_id):
+        digest = hashlib.sha1(media_id.encode('utf-8')).hexdigest()
+        return os.path.join(self.root, digest[:2], digest)
+
+    def adopt(self, media_id, existing_path):
+        """
+        Moves a file downloaded before the blob store existed into it, so it is
+        not fetched again. Returns True if the blob is now present.
+        """
+        blob = self.path_for(media_id)
+        if os.path.exists(blob):
+            return True
+        if not os.path.isfile(existing_path) or os.path.islink(existing_path):
+            return False
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        try:
+            os.link(existing_path, blob)
+        except OSError:
+            shutil.copy2(existing_path, blob)
+        return True
+
+    def link(self, media_id, dest):
+        """Places the blob at `dest`. Returns how: 'existing', 'hardlink', 'symlink' or 'copy'."""
+        blob = self.path_for(media_id)
+        try:
+            if os.path.exists(dest) and os.path.samefile(blob, dest):
+                return 'existing'
+        except OSError:
+            pass
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp = dest + '.link'
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        try:
+            os.link(blob, tmp)
+            how = 'hardlink'
+        except OSError:
+            try:
+                os.symlink(blob, tmp)
+                how = 'symlink'
+            except OSError:
+                shutil.copy2(blob, tmp)
+                how = 'copy'
+        os.replace(tmp, dest)
+        if how != 'hardlink':
+            logging.debug(f"Hardlink not possible for {dest}; used {how}")
+        return how
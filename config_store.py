@@ -0,0 +1,158 @@
+import os
+import json
+import copy
+import logging
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+WATCH_INTERVAL = 1.0  # seconds between mtime checks while someone is subscribed
+
+
+@contextmanager
+def file_lock(lock_path):
+    """Exclusive cross-process lock held for the duration of the block."""
+    with open(lock_path, 'a+') as fh:
+        if os.name == 'nt':
+            import msvcrt
+            fh.seek(0)
+            msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+class ConfigStore:
+    """
+    sync_config.json shared by run_cloud_sync.py, run_app.py and run_local_host.py.
+    Reads are served from memory and only re-parse the file when its mtime or
+    size changes. Writes go through a temp file + os.replace under a
+    cross-process lock, and subscribers are called whenever the content changes,
+    whichever process wrote it.
+    """
+    def __init__(self, path, defaults=None):
+        self.path = os.path.abspath(path)
+        self.defaults = copy.deepcopy(defaults or {})
+        self._lock = threading.RLock()
+        self._stamp = None
+        self._stored = None   # what is on disk
+        self._bytes = None    # serialized form of _stored, for HTTP responses
+        self._subscribers = []
+        self._watcher = None
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _refresh(self):
+        """Re-reads the file if it changed; returns True when the content was reloaded."""
+        stamp = self._file_stamp()
+        if stamp == self._stamp and self._stored is not None:
+            return False
+        stored = {}
+        if stamp is not None:
+            try:
+                with open(self.path, 'r') as f:
+                    stored = json.load(f)
+            except Exception as e:
+                logging.error(f"Failed to load config: {e}")
+                if self._stored is not None:
+                    return False
+        self._stamp = stamp
+        self._set(stored)
+        return True
+
+    def _set(self, stored):
+        self._stored = stored
+        self._bytes = json.dumps(stored, indent=4).encode('utf-8')
+
+    def get(self):
+        """Current config merged over the defaults (a private copy)."""
+        with self._lock:
+            self._refresh()
+            merged = copy.deepcopy(self.defaults)
+            merged.update(copy.deepcopy(self._stored))
+            return merged
+
+    def get_bytes(self):
+        """The on-disk config as JSON bytes, cached between changes."""
+        with self._lock:
+            self._refresh()
+            return self._bytes
+
+    def save(self, data):
+        """Replaces the whole file with `data`."""
+        with self._lock, file_lock(self.path + '.lock'):
+            self._write(dict(data))
+        self._notify()
+
+    def update(self, changes):
+        """
+        Read-modify-write of selected keys under the lock, so concurrent
+        updates from threads or other processes never overwrite each other.
+        Returns the stored config after the update.
+        """
+        with self._lock, file_lock(self.path + '.lock'):
+            self._stamp = None
+            self._refresh()
+            stored = copy.deepcopy(self._stored)
+            stored.update(changes)
+            self._write(stored)
+            result = copy.deepcopy(stored)
+        self._notify()
+        return result
+
+    def _write(self, stored):
+        folder = os.path.dirname(self.path)
+        fd, tmp_path = tempfile.mkstemp(prefix='.sync_config.', suffix='.tmp', dir=folder)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(stored, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._stamp = self._file_stamp()
+        self._set(stored)
+
+    # --- Change subscriptions ---
+    def subscribe(self, callback):
+        """Calls `callback(config)` after every change; starts the mtime watcher on first use."""
+        with self._lock:
+            self._refresh()
+            self._subscribers.append(callback)
+            if self._watcher is None:
+                self._watcher = threading.Thread(target=self._watch, daemon=True)
+                self._watcher.start()
+
+    def _notify(self):
+        config = self.get()
+        for callback in list(self._subscribers):
+            try:
+                callback(config)
+            except Exception as e:
+                logging.error(f"Config subscriber failed: {e}")
+
+    def _watch(self):
+        while True:
+            time.sleep(WATCH_INTERVAL)
+            with self._lock:
+                changed = self._refresh()
+            if changed:
+                self._notify()
@@ -0,0 +1,282 @@
+import os
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from sync_state import open_db
+
+DEFAULT_MAX_DISTANCE = 8   # Hamming distance (of 64 bits) still counted as a near-duplicate
+HASH_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.gif', '.tif', '.tiff', '.heic')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS perceptual_hashes (
+    item_key TEXT PRIMARY KEY,     -- media id for synced items
+    path     TEXT NOT NULL,
+    size     INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    dhash    INTEGER,              -- NULL when the file could not be decoded
+    phash    INTEGER
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS near_duplicates (
+    key_a    TEXT NOT NULL,
+    key_b    TEXT NOT NULL,
+    distance INTEGER NOT NULL,
+    PRIMARY KEY (key_a, key_b)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_near_duplicates_b ON near_duplicates(key_b);
+"""
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+def to_signed(h):
+    """SQLite integers are signed 64-bit."""
+    return h - (1 << 64) if h >= 1 << 63 else h
+
+
+def to_unsigned(h):
+    return h + (1 << 64) if h < 0 else h
+
+
+def _bits_to_int(bits):
+    value = 0
+    for bit in bits.ravel():
+        value = (value << 1) | int(bit)
+    return value
+
+
+_DCT_CACHE = {}
+
+
+def _dct_matrix(n):
+    if n not in _DCT_CACHE:
+        import numpy as np
+        k = np.arange(n)[:, None]
+        m = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n))
+        m[0] *= 1 / np.sqrt(2)
+        _DCT_CACHE[n] = m * np.sqrt(2 / n)
+    return _DCT_CACHE[n]
+
+
+def compute_hashes(path):
+    """
+    Process-pool worker: 64-bit dHash (row gradients of a 9x8 thumbnail) and
+    pHash (signs of the low 8x8 DCT coefficients of a 32x32 thumbnail).
+    """
+    import numpy as np
+    from PIL import Image
+    with Image.open(path) as img:
+        img.draft('L', (64, 64))
+        gray = img.convert('L')
+        small = np.asarray(gray.resize((9, 8), Image.LANCZOS), dtype=np.int16)
+        dhash = _bits_to_int(small[:, 1:] > small[:, :-1])
+        pixels = np.asarray(gray.resize((32, 32), Image.LANCZOS), dtype=np.float64)
+    dct = _dct_matrix(32)
+    low = (dct @ pixels @ dct.T)[:8, :8]
+    phash = _bits_to_int(low > np.median(low.ravel()[1:]))
+    return dhash, phash
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over 64-bit hashes with Hamming distance. A radius
+    query only descends into children whose edge distance lies within
+    [d - r, d + r], so lookups touch a small fraction of the nodes.
+    """
+    def __init__(self):
+        self.root = None  # [hash, keys, {distance: child}]
+        self.size = 0
+
+    def add(self, value, key):
+        self.size += 1
+        if self.root is None:
+            self.root = [value, {key}, {}]
+            return
+        node = self.root
+        while True:
+            d = hamming(value, node[0])
+            if d == 0:
+                node[1].add(key)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [value, {key}, {}]
+                return
+            node = child
+
+    def remove(self, value, key):
+        """Drops `key` from the node for `value`; empty nodes stay as routing points."""
+        node = self.root
+        while node is not None:
+            d = hamming(value, node[0])
+            if d == 0:
+                if key in node[1]:
+                    node[1].discard(key)
+                    self.size -= 1
+                return
+            node = node[2].get(d)
+
+    def search(self, value, radius):
+        """Yields (key, distance) for every stored hash within `radius`."""
+        if self.root is None:
+            return
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            d = hamming(value, node[0])
+            if d <= radius:
+                for key in node[1]:
+                    yield key, d
+            for edge, child in node[2].items():
+                if d - radius <= edge <= d + radius:
+                    stack.append(child)
+
+
+class DuplicateIndex:
+    """
+    Near-duplicate detector for synced photos. Hashes are computed in a
+    process pool and persisted in the sync-state database; each new photo is
+    matched against a BK-tree of the existing pHashes and confirmed with its
+    dHash, and matching pairs are stored so results accumulate incrementally.
+    """
+    def __init__(self, local_folder, workers=None, max_distance=DEFAULT_MAX_DISTANCE):
+        self.local_folder = local_folder
+        self.max_distance = max_distance
+        self.db = open_db(local_folder)
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self.workers = workers
+        self._pool = None
+        self._in_flight = set()
+        self._drained = threading.Condition(self.lock)
+
+        self.tree = BKTree()
+        self.hashes = {}  # item_key -> (dhash, phash)
+        for key, dhash, phash in self.db.execute(
+                "SELECT item_key, dhash, phash FROM perceptual_hashes WHERE phash IS NOT NULL"):
+            entry = (to_unsigned(dhash), to_unsigned(phash))
+            self.hashes[key] = entry
+            self.tree.add(entry[1], key)
+        logging.info(f"Duplicate index: {len(self.hashes)} photo hashes loaded")
+
+    def submit(self, key, path):
+        """Queues `path` (stored under `key`) unless its hashes are already current."""
+        if not path.lower().endswith(HASH_EXTENSIONS):
+            return
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        with self.lock:
+            row = self.db.execute(
+                "SELECT size, mtime_ns FROM perceptual_hashes WHERE item_key = ?", (key,)).fetchone()
+            if (row and row[0] == st.st_size and row[1] == st.st_mtime_ns) or key in self._in_flight:
+                return
+            self._in_flight.add(key)
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            pool = self._pool
+        try:
+            future = pool.submit(compute_hashes, path)
+        except RuntimeError:
+            with self.lock:
+                self._in_flight.discard(key)  # pool already shut down
+                self._drained.notify_all()
+            return
+        future.add_done_callback(lambda f: self._done(key, path, st, f))
+
+    def _done(self, key, path, st, future):
+        # Cancelled or lost with a dead worker: the file is hashed again next time, so nothing is recorded
+        if future.cancelled():
+            self._settle(key)
+            return
+        try:
+            dhash, phash = future.result()
+        except BrokenProcessPool as e:
+            logging.debug(f"Perceptual hash of {path} not computed: {e}")
+            self._settle(key)
+            return
+        except Exception as e:
+            logging.debug(f"No perceptual hash for {path}: {e}")
+            dhash = phash = None
+        with self.lock:
+            self._in_flight.discard(key)
+            self._drained.notify_all()
+            old = self.hashes.pop(key, None)
+            if old:
+                self.tree.remove(old[1], key)
+                self.db.execute("DELETE FROM near_duplicates WHERE key_a = ? OR key_b = ?", (key, key))
+            matches = []
+            if phash is not None:
+                for other, distance in self.tree.search(phash, self.max_distance):
+                    # pHash finds candidates; the dHash must agree too
+                    if hamming(dhash, self.hashes[other][0]) <= self.max_distance * 2:
+                        matches.append((min(key, other), max(key, other), distance))
+                self.hashes[key] = (dhash, phash)
+                self.tree.add(phash, key)
+            self.db.execute("INSERT OR REPLACE INTO perceptual_hashes VALUES (?, ?, ?, ?, ?, ?)",
+                            (key, path, st.st_size, st.st_mtime_ns,
+                             None if dhash is None else to_signed(dhash),
+                             None if phash is None else to_signed(phash)))
+            self.db.executemany("INSERT OR REPLACE INTO near_duplicates VALUES (?, ?, ?)", matches)
+            self.db.commit()
+        if matches:
+            logging.info(f"Near-duplicates of {os.path.basename(path)}: {len(matches)}")
+
+    def _settle(self, key):
+        with self.lock:
+            self._in_flight.discard(key)
+            self._drained.notify_all()
+
+    def forget(self, keys):
+        with self.lock:
+            for key in keys:
+                old = self.hashes.pop(key, None)
+                if old:
+                    self.tree.remove(old[1], key)
+            self.db.executemany("DELETE FROM perceptual_hashes WHERE item_key = ?", ((k,) for k in keys))
+            self.db.executemany("DELETE FROM near_duplicates WHERE key_a = ? OR key_b = ?",
+                                ((k, k) for k in keys))
+            self.db.commit()
+
+    def duplicates_of(self, key):
+        """[(other_key, distance)] for one item, closest first."""
+        with self.lock:
+            return self.db.execute(
+                "SELECT key_b, distance FROM near_duplicates WHERE key_a = ? "
+                "UNION ALL SELECT key_a, distance FROM near_duplicates WHERE key_b = ? "
+                "ORDER BY distance", (key, key)).fetchall()
+
+    def groups(self):
+        """Clusters of near-duplicate keys (connected components of the stored pairs)."""
+        with self.lock:
+            pairs = self.db.execute("SELECT key_a, key_b FROM near_duplicates").fetchall()
+        parent = {}
+
+        def find(x):
+            parent.setdefault(x, x)
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        for a, b in pairs:
+            parent[find(a)] = find(b)
+        clusters = {}
+        for key in parent:
+            clusters.setdefault(find(key), []).append(key)
+        return sorted((sorted(c) for c in clusters.values()), key=len, reverse=True)
+
+    def close(self, wait=False):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=not wait)
+        # Running hashes still finish; their callbacks need the database
+        with self.lock:
+            while self._in_flight:
+                self._drained.wait()
+            self.db.close()
@@ -0,0 +1,363 @@
+import os
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from photos_api import ApiClient, DailyQuota
+
+DEFAULT_WORKERS = 8
+DEFAULT_PER_HOST = 8
+PROGRESS_INTERVAL = 5.0  # seconds between progress log lines
+PART_SUFFIX = ".part"
+
+# baseUrl suffixes: the original file, or a downscaled preview for progressive sync
+ORIGINAL = "=d"
+PREVIEW_SIZE = 2048
+PREVIEW = f"=w{PREVIEW_SIZE}-h{PREVIEW_SIZE}"
+
+# Streaming: chunk size adapts between these bounds, aiming for one read per ~0.25s.
+MIN_CHUNK = 256 * 1024
+MAX_CHUNK = 4 * 1024 * 1024
+CHUNK_TARGET_SECONDS = 0.25
+RATE_RECHECK_SECONDS = 30.0
+
+DOWNLOADS = metrics.counter("gemini_downloads_total", "Finished downloads by result (downloaded, skipped, failed).")
+DOWNLOAD_BYTES = metrics.counter("gemini_download_bytes_total", "Bytes written by downloads.")
+DOWNLOAD_RATE = metrics.gauge("gemini_download_bytes_per_second", "Average throughput of the current download batch.")
+IN_FLIGHT = metrics.gauge("gemini_downloads_in_flight", "Downloads queued or running in the engine.")
+
+_buffers = threading.local()
+
+
+def _thread_buffer():
+    """One reusable MAX_CHUNK buffer per worker thread."""
+    buf = getattr(_buffers, "buf", None)
+    if buf is None:
+        buf = _buffers.buf = bytearray(MAX_CHUNK)
+    return buf
+
+
+def _minutes(hhmm):
+    hours, minutes = hhmm.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def scheduled_rate(config, now=None):
+    """
+    Bandwidth cap in bytes/sec for the current time, 0 meaning unlimited.
+    `bandwidth_schedule` entries ({"start": "09:00", "end": "18:00", "limit_kbps": 2048})
+    override the flat `bandwidth_limit_kbps`; windows may wrap past midnight.
+    """
+    now = now or time.localtime()
+    minute = now.tm_hour * 60 + now.tm_min
+    for window in config.get("bandwidth_schedule") or []:
+        try:
+            start, end = _minutes(window["start"]), _minutes(window["end"])
+        except (KeyError, ValueError):
+            continue
+        inside = start <= minute < end if start <= end else (minute >= start or minute < end)
+        if inside:
+            return int(window.get("limit_kbps", 0)) * 1024
+    return int(config.get("bandwidth_limit_kbps", 0) or 0) * 1024
+
+
+class TokenBucket:
+    """
+    Global bandwidth limiter shared by every download worker.
+    Workers take tokens after each read and sleep off any debt, so the
+    aggregate rate converges on `rate` bytes/sec with up to one second of burst.
+    `rate_fn`, when given, is re-evaluated periodically (e.g. for schedules).
+    """
+    def __init__(self, rate=0, rate_fn=None):
+        self.rate = rate
+        self.rate_fn = rate_fn
+        self.tokens = 0.0
+        self._stamp = time.monotonic()
+        self._rate_checked = 0.0
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate):
+        with self._lock:
+            self.rate = rate
+            self.tokens = min(self.tokens, rate)
+
+    def consume(self, n):
+        with self._lock:
+            now = time.monotonic()
+            if self.rate_fn and now - self._rate_checked >= RATE_RECHECK_SECONDS:
+                self._rate_checked = now
+                self.rate = self.rate_fn()
+            if not self.rate:
+                self._stamp = now
+                return
+            self.tokens = min(self.rate, self.tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+            self.tokens -= n
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0
+        if delay:
+            time.sleep(delay)
+
+
+def stream_to_file(response, f, limiter=None):
+    """
+    Copies a streamed response body into `f` through a reused per-thread
+    buffer, growing the read size on fast links and shrinking it on slow ones.
+    Returns the number of bytes written.
+    """
+    raw = response.raw
+    raw.decode_content = True
+    view = memoryview(_thread_buffer())
+    chunk = MIN_CHUNK
+    written = 0
+    while True:
+        started = time.monotonic()
+        n = raw.readinto(view[:chunk])
+        if not n:
+            break
+        elapsed = time.monotonic() - started
+        f.write(view[:n])
+        written += n
+        if limiter:
+            limiter.consume(n)
+        if elapsed < CHUNK_TARGET_SECONDS / 2 and chunk < MAX_CHUNK:
+            chunk *= 2
+        elif elapsed > CHUNK_TARGET_SECONDS and chunk > MIN_CHUNK:
+            chunk //= 2
+    return written
+
+
+def build_session(pool_size):
+    """A requests Session whose per-host pool can keep `pool_size` connections alive."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class IncompleteDownload(Exception):
+    """The transfer ended before the advertised length; the .part file is kept for resume."""
+
+
+def _content_range(header):
+    """Parses 'bytes start-end/total' (or 'bytes */total') into (start, total)."""
+    try:
+        unit, spec = header.split(" ", 1)
+        span, total = spec.split("/", 1)
+        start = None if span == "*" else int(span.split("-", 1)[0])
+        return start, (None if total == "*" else int(total))
+    except (AttributeError, ValueError):
+        return None, None
+
+
+def download_file(client, url, full_path, overwrite=False, limiter=None, part_suffix=PART_SUFFIX,
+                  variant=ORIGINAL):
+    """
+    Downloads `url` (a Google baseUrl) to full_path, as the original or,
+    with `variant=PREVIEW`, as a downscaled preview.
+    Data goes to full_path + '.part' and is renamed into place only once its
+    length checks out, so a crash never leaves a truncated file behind. A
+    leftover .part file is resumed with an HTTP Range request. Processes that
+    may fetch the same file at once pass distinct `part_suffix`es.
+    Returns the number of bytes transferred, 0 if the file was already present.
+    """
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    if not overwrite and os.path.exists(full_path):
+        return 0
+    # A preview's partial download must never be resumed as the original, or vice versa
+    part_path = full_path + ("" if variant == ORIGINAL else ".preview") + part_suffix
+    download_url = f"{url}{variant}"
+
+    for _ in range(2):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        written = 0
+        # The host's connection slot is held until the body has been streamed
+        with client.stream('GET', download_url, headers=headers) as r:
+            if r.status_code == 416 and offset:
+                # Either the .part is already complete or it is stale; check the total.
+                _, total = _content_range(r.headers.get("Content-Range"))
+                if total == offset:
+                    break
+                os.remove(part_path)
+                continue
+            r.raise_for_status()
+
+            if r.status_code == 206:
+                start, expected = _content_range(r.headers.get("Content-Range"))
+                if start != offset:
+                    raise IncompleteDownload(f"server resumed at {start}, expected {offset}")
+                mode = 'ab'
+            else:
+                # Server ignored the Range header: start over from zero.
+                offset, mode = 0, 'wb'
+                length = r.headers.get("Content-Length")
+                encoded = r.headers.get("Content-Encoding", "identity") != "identity"
+                expected = int(length) if length and not encoded else None
+
+            with open(part_path, mode) as f:
+                written = stream_to_file(r, f, limiter)
+                with metrics.span("fsync"):
+                    f.flush()
+                    os.fsync(f.fileno())
+
+        size = offset + written
+        if expected is not None and size != expected:
+            raise IncompleteDownload(f"got {size} of {expected} bytes")
+        break
+    else:
+        raise IncompleteDownload("could not resume partial download")
+
+    os.replace(part_path, full_path)
+    return written
+
+
+class DownloadBatch:
+    """Tracks one group of submitted downloads (e.g. one album) and its progress."""
+    def __init__(self, name):
+        self.name = name
+        self.submitted = 0
+        self.downloaded = 0
+        self.skipped = 0
+        self.failed = 0
+        self.bytes = 0
+        self.error = None  # set when listing stopped early, e.g. an API error
+        self.deferred = 0  # items left for a later pass (originals behind progressive previews)
+        self.started = time.monotonic()
+        self._last_report = self.started
+        self._cond = threading.Condition()
+
+    @property
+    def done(self):
+        return self.downloaded + self.skipped + self.failed
+
+    def _add(self):
+        with self._cond:
+            self.submitted += 1
+
+    def _finish(self, written, error):
+        with self._cond:
+            if error is not None:
+                self.failed += 1
+                DOWNLOADS.inc(result="failed")
+            elif written:
+                self.downloaded += 1
+                self.bytes += written
+                DOWNLOADS.inc(result="downloaded")
+                DOWNLOAD_BYTES.inc(written)
+            else:
+                self.skipped += 1
+                DOWNLOADS.inc(result="skipped")
+            now = time.monotonic()
+            report = now - self._last_report >= PROGRESS_INTERVAL
+            if report:
+                self._last_report = now
+                DOWNLOAD_RATE.set(self.bytes / max(now - self.started, 1e-6))
+            self._cond.notify_all()
+        if report:
+            logging.info(self.summary())
+
+    def wait(self):
+        with self._cond:
+            while self.done < self.submitted:
+                self._cond.wait()
+
+    def summary(self):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        rate = self.bytes / elapsed / (1024 * 1024)
+        return (f"{self.name}: {self.done}/{self.submitted} done "
+                f"({self.downloaded} downloaded, {self.skipped} skipped, {self.failed} failed), "
+                f"{self.bytes / (1024 * 1024):.1f} MB at {rate:.1f} MB/s")
+
+
+class DownloadEngine:
+    """
+    Bounded thread pool sharing one pooled HTTP session.
+    `submit` blocks once `workers * 2` downloads are in flight, so a lazy
+    listing upstream never runs far ahead of the downloads. Per-host
+    concurrency starts at `per_host` and shrinks when the server pushes back.
+    With a BaseUrlRefresher as `urls`, items whose baseUrl has gone stale in
+    the queue are refreshed just before their download starts.
+    """
+    def __init__(self, workers=DEFAULT_WORKERS, per_host=DEFAULT_PER_HOST, limiter=None, quota=None, urls=None,
+                 part_suffix=PART_SUFFIX):
+        self.workers = max(1, int(workers))
+        self.per_host = max(1, int(per_host))
+        self.limiter = limiter
+        self.urls = urls
+        self.part_suffix = part_suffix
+        self.session = build_session(self.per_host)
+        self.client = ApiClient(self.session, quota or DailyQuota("media", 0), concurrency=self.per_host)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="download")
+        self._slots = threading.BoundedSemaphore(self.workers * 2)
+
+    def submit(self, batch, url, full_path, overwrite=False, on_done=None, item=None, variant=ORIGINAL, name=None):
+        """
+        Queues one download. `on_done(bytes_written)` runs on the worker thread
+        after the file is in place (bytes_written is 0 if it already existed).
+        `item` is the listed media item behind `url`, which lets the refresher
+        swap in a fresh baseUrl if this one expires before it is used.
+        `variant` picks the original (ORIGINAL) or a preview (PREVIEW).
+        `name` is shown in logs and trace spans instead of the file name of
+        full_path (e.g. the album file behind a content-addressed blob).
+        """
+        self._slots.acquire()
+        media_id = item['id'] if item is not None and self.urls is not None else None
+        if media_id is not None:
+            self.urls.track(item)
+        IN_FLIGHT.inc()
+        batch._add()
+        try:
+            self._executor.submit(self._run, batch, url, full_path, overwrite, on_done, media_id, variant,
+                                  name or os.path.basename(full_path))
+        except Exception:
+            self._slots.release()
+            IN_FLIGHT.dec()
+            if media_id is not None:
+                self.urls.forget(media_id)
+            batch._finish(0, RuntimeError("engine closed"))
+            raise
+
+    def _download(self, url, full_path, overwrite, media_id, variant):
+        if media_id is None:
+            return download_file(self.client, url, full_path, overwrite, self.limiter, self.part_suffix, variant)
+        if not overwrite and os.path.exists(full_path):
+            return 0  # fetched for another album; no url needed
+        url = self.urls.resolve(media_id)
+        try:
+            return download_file(self.client, url, full_path, overwrite, self.limiter, self.part_suffix, variant)
+        except requests.HTTPError as e:
+            if e.response is None or e.response.status_code != 403:
+                raise
+        # Expired anyway (e.g. mid-transfer); any .part file is resumed from the new url
+        url = self.urls.resolve(media_id, expired=True)
+        return download_file(self.client, url, full_path, overwrite, self.limiter, self.part_suffix, variant)
+
+    def _run(self, batch, url, full_path, overwrite, on_done, media_id, variant, filename):
+        written, error = 0, None
+        try:
+            with metrics.span("download", file=filename):
+                written = self._download(url, full_path, overwrite, media_id, variant)
+            if on_done:
+                with metrics.span("finalize", file=filename):
+                    on_done(written)
+            if written:
+                logging.info(f"Downloaded: {filename}")
+        except Exception as e:
+            error = e
+            logging.error(f"Failed to download {filename}: {e}")
+        finally:
+            if media_id is not None:
+                self.urls.forget(media_id)
+            self._slots.release()
+            IN_FLIGHT.dec()
+            batch._finish(written, error)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.session.close()
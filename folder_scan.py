@@ -0,0 +1,110 @@
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from sync_state import STATE_DIR_NAME, open_db
+
+DEFAULT_SCAN_WORKERS = 8
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scan_snapshot (
+    path     TEXT PRIMARY KEY,
+    size     INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode    INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def _scan_dir(path, include, skip_dirs):
+    files, dirs = [], []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in skip_dirs:
+                            dirs.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False) and include(entry.name):
+                        st = entry.stat(follow_symlinks=False)
+                        files.append((entry.path, st.st_size, st.st_mtime_ns, st.st_ino))
+                except OSError as e:
+                    logging.warning(f"Skipping {entry.path}: {e}")
+    except OSError as e:
+        logging.warning(f"Cannot scan {path}: {e}")
+    return files, dirs
+
+
+def scan_tree(root, include=lambda name: True, workers=DEFAULT_SCAN_WORKERS, skip_dirs=(STATE_DIR_NAME,)):
+    """
+    Walks `root` with os.scandir, one directory per task across a thread pool.
+    Yields (path, size, mtime_ns, inode) for every file whose name passes `include`.
+    """
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scan") as pool:
+        running = {pool.submit(_scan_dir, root, include, skip_dirs)}
+        while running:
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, dirs = future.result()
+                for d in dirs:
+                    running.add(pool.submit(_scan_dir, d, include, skip_dirs))
+                yield from files
+
+
+class ScanSnapshot:
+    """
+    Last known state (path, size, mtime, inode) of every synced local file,
+    kept in the sync-state database. Diffing a fresh scan against it is a
+    pair of SQL joins, so memory stays flat however large the folder is.
+    """
+    def __init__(self, local_folder):
+        self.local_folder = local_folder
+        self.db = open_db(local_folder)
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def diff(self, entries):
+        """
+        Compares scanned `entries` with the snapshot.
+        Returns (added, modified, deleted) as lists of paths.
+        """
+        with self.lock:
+            db = self.db
+            db.execute("CREATE TEMP TABLE IF NOT EXISTS scan_current "
+                       "(path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER) WITHOUT ROWID")
+            db.execute("DELETE FROM scan_current")
+            db.executemany("INSERT OR REPLACE INTO scan_current VALUES (?, ?, ?, ?)", entries)
+            added = [r[0] for r in db.execute(
+                "SELECT c.path FROM scan_current c LEFT JOIN scan_snapshot s ON s.path = c.path "
+                "WHERE s.path IS NULL")]
+            modified = [r[0] for r in db.execute(
+                "SELECT c.path FROM scan_current c JOIN scan_snapshot s ON s.path = c.path "
+                "WHERE s.size != c.size OR s.mtime_ns != c.mtime_ns OR s.inode != c.inode")]
+            deleted = [r[0] for r in db.execute(
+                "SELECT s.path FROM scan_snapshot s LEFT JOIN scan_current c ON c.path = s.path "
+                "WHERE c.path IS NULL")]
+            db.execute("DELETE FROM scan_current")
+            db.commit()
+        return added, modified, deleted
+
+    def record(self, path):
+        """Marks `path` as synced in its current on-disk state."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            self.forget([path])
+            return
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO scan_snapshot VALUES (?, ?, ?, ?)",
+                            (path, st.st_size, st.st_mtime_ns, st.st_ino))
+            self.db.commit()
+
+    def forget(self, paths):
+        with self.lock:
+            self.db.executemany("DELETE FROM scan_snapshot WHERE path = ?", ((p,) for p in paths))
+            self.db.commit()
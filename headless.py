@@ -0,0 +1,46 @@
+import time
+import logging
+import argparse
+import signal
+import threading
+
+# Cron-driven one-shot runs should be syncing well inside a second of launch
+STARTUP_BUDGET = 0.5  # seconds from module load to the first sync work
+
+
+def parse_args(description, argv=None):
+    """
+    Command line shared by the sync clients. With neither flag the client
+    runs as before: tray icon plus settings window.
+    """
+    parser = argparse.ArgumentParser(description=description)
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--daemon', action='store_true',
+                      help="run headless until SIGTERM/SIGINT; no tray icon or windows")
+    mode.add_argument('--once', action='store_true',
+                      help="sync once, headless, and exit (non-zero if anything is left to retry)")
+    return parser.parse_args(argv)
+
+
+def report_startup(name, started, budget=STARTUP_BUDGET):
+    """Logs the time since `started` (a perf_counter stamp); warns when over budget."""
+    elapsed = time.perf_counter() - started
+    if elapsed > budget:
+        logging.warning(f"{name} took {elapsed * 1000:.0f} ms to start (budget {budget * 1000:.0f} ms)")
+    else:
+        logging.info(f"{name} started in {elapsed * 1000:.0f} ms")
+    return elapsed
+
+
+def wait_for_signal():
+    """Blocks the main thread until SIGTERM or SIGINT (e.g. from systemd or Ctrl+C)."""
+    stop = threading.Event()
+
+    def handler(signum, frame):
+        logging.info(f"Received {signal.Signals(signum).name}; shutting down...")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, handler)
+    signal.signal(signal.SIGINT, handler)
+    while not stop.wait(1):
+        pass
@@ -0,0 +1,297 @@
+import os
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from sync_state import open_db
+
+DEFAULT_EXIF_WORKERS = 4
+DEFAULT_SEARCH_LIMIT = 100
+MAX_SEARCH_LIMIT = 500
+EXIF_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.tif', '.tiff', '.heic')
+
+# Columns filled from Google's mediaMetadata and/or the file's own EXIF
+FIELDS = ('media_id', 'filename', 'album', 'description', 'taken_at', 'width', 'height',
+          'camera_make', 'camera_model', 'lens', 'focal_length', 'aperture', 'iso', 'exposure')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS photo_metadata (
+    id           INTEGER PRIMARY KEY,  -- rowid of the photo's photo_text entry
+    path         TEXT NOT NULL UNIQUE,
+    media_id     TEXT,
+    filename     TEXT,
+    album        TEXT,
+    description  TEXT,
+    taken_at     TEXT,        -- 'YYYY-MM-DDTHH:MM:SS'
+    width        INTEGER,
+    height       INTEGER,
+    camera_make  TEXT,
+    camera_model TEXT,
+    lens         TEXT,
+    focal_length REAL,
+    aperture     REAL,
+    iso          INTEGER,
+    exposure     REAL,
+    size         INTEGER,     -- file state when EXIF was read; NULL until then
+    mtime_ns     INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_metadata_taken ON photo_metadata(taken_at);
+CREATE INDEX IF NOT EXISTS idx_metadata_camera ON photo_metadata(camera_make, camera_model, taken_at);
+CREATE INDEX IF NOT EXISTS idx_metadata_media ON photo_metadata(media_id);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS photo_text USING fts5(
+    filename, album, camera, description,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+
+
+def _exif_date(value):
+    """'2023:07:14 18:02:11' -> '2023-07-14T18:02:11'."""
+    if not value or len(value) < 19:
+        return None
+    value = value.strip('\x00 ')
+    return value[:10].replace(':', '-') + 'T' + value[11:19]
+
+
+def remote_metadata(item, album):
+    """Fields from a Library API mediaItem (creationTime is UTC)."""
+    meta = item.get('mediaMetadata', {})
+    photo = meta.get('photo') or {}
+    created = meta.get('creationTime')
+    return {
+        'media_id': item.get('id'),
+        'filename': item.get('filename'),
+        'album': album,
+        'description': item.get('description'),
+        'taken_at': created[:19] if created else None,
+        'width': int(meta['width']) if meta.get('width') else None,
+        'height': int(meta['height']) if meta.get('height') else None,
+        'camera_make': photo.get('cameraMake'),
+        'camera_model': photo.get('cameraModel'),
+        'focal_length': _number(photo.get('focalLength')),
+        'aperture': _number(photo.get('apertureFNumber')),
+        'iso': photo.get('isoEquivalent'),
+        'exposure': _number((photo.get('exposureTime') or '').rstrip('s')),
+    }
+
+
+def extract_exif(path):
+    """
+    Reads dimensions and EXIF tags. Pillow only parses the header here, so
+    the pixel data is never decoded.
+    """
+    from PIL import Image
+    with Image.open(path) as img:
+        width, height = img.size
+        exif = img.getexif()
+        sub = exif.get_ifd(0x8769)  # Exif IFD
+    return {
+        'filename': os.path.basename(path),
+        'taken_at': _exif_date(sub.get(36867) or exif.get(306)),  # DateTimeOriginal / DateTime
+        'width': width,
+        'height': height,
+        'camera_make': (exif.get(271) or '').strip('\x00 ') or None,
+        'camera_model': (exif.get(272) or '').strip('\x00 ') or None,
+        'lens': (sub.get(42036) or '').strip('\x00 ') or None,
+        'focal_length': _number(sub.get(37386)),
+        'aperture': _number(sub.get(33437)),
+        'iso': sub.get(34855) if isinstance(sub.get(34855), int) else None,
+        'exposure': _number(sub.get(33434)),
+    }
+
+
+class MetadataIndex:
+    """
+    Searchable photo metadata in the sync-state database: Google's
+    mediaMetadata for synced items merged with EXIF read locally by a thread
+    pool. Date and camera filters use B-tree indexes and text goes through
+    FTS5, so queries never open the photos themselves.
+    """
+    def __init__(self, local_folder, workers=DEFAULT_EXIF_WORKERS):
+        self.local_folder = local_folder
+        self.db = open_db(local_folder)
+        self.db.executescript(SCHEMA)
+        try:
+            self.db.executescript(FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError:
+            logging.warning("SQLite was built without FTS5; text search falls back to LIKE")
+            self.fts = False
+        self.lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="exif")
+        self._in_flight = set()
+        self._drained = threading.Condition(self.lock)  # notified as each queued read's callback finishes
+
+    def close(self, wait=False):
+        """
+        Stops the pool; with `wait`, queued reads finish first. Otherwise
+        they are cancelled and only reads already running are waited for,
+        so their results are recorded before the database closes.
+        """
+        self._pool.shutdown(wait=wait, cancel_futures=not wait)
+        with self.lock:
+            while self._in_flight:
+                self._drained.wait()
+            self.db.close()
+
+    def _upsert(self, path, fields, prefer_new, size=None, mtime_ns=None):
+        """Merges `fields` into the row for `path`; missing values never erase known ones."""
+        values = [fields.get(f) for f in FIELDS]
+        merge = ", ".join(
+            f"{f} = COALESCE(excluded.{f}, {f})" if prefer_new else f"{f} = COALESCE({f}, excluded.{f})"
+            for f in FIELDS)
+        if size is not None:
+            merge += ", size = excluded.size, mtime_ns = excluded.mtime_ns"
+        self.db.execute(
+            f"INSERT INTO photo_metadata (path, {', '.join(FIELDS)}, size, mtime_ns) "
+            f"VALUES ({', '.join('?' * (len(FIELDS) + 3))}) "
+            f"ON CONFLICT(path) DO UPDATE SET {merge}",
+            (path, *values, size, mtime_ns))
+        if self.fts:
+            # Keyed by photo_metadata.id, so replacing the entry is a rowid lookup rather than a scan
+            self.db.execute("DELETE FROM photo_text WHERE rowid = (SELECT id FROM photo_metadata WHERE path = ?)",
+                            (path,))
+            self.db.execute(
+                "INSERT INTO photo_text (rowid, filename, album, camera, description) "
+                "SELECT id, filename, album, "
+                "TRIM(COALESCE(camera_make, '') || ' ' || COALESCE(camera_model, '') || ' ' || COALESCE(lens, '')), "
+                "description FROM photo_metadata WHERE path = ?", (path,))
+
+    def record_remote(self, item, album, path):
+        """Stores the mediaMetadata the Library API returned for a synced item."""
+        with self.lock:
+            self._upsert(path, remote_metadata(item, album), prefer_new=True)
+            self.db.commit()
+
+    def submit(self, path):
+        """Queues EXIF extraction for `path` unless the stored copy is current."""
+        if not path.lower().endswith(EXIF_EXTENSIONS):
+            return
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        with self.lock:
+            row = self.db.execute(
+                "SELECT size, mtime_ns FROM photo_metadata WHERE path = ?", (path,)).fetchone()
+            if (row and row[0] == st.st_size and row[1] == st.st_mtime_ns) or path in self._in_flight:
+                return
+            self._in_flight.add(path)
+        try:
+            future = self._pool.submit(self._extract, path)
+        except RuntimeError:
+            with self.lock:
+                self._in_flight.discard(path)  # pool already shut down
+                self._drained.notify_all()
+            return
+        future.add_done_callback(lambda f: self._done(path, st, f))
+
+    def _extract(self, path):
+        try:
+            fields = extract_exif(path)
+        except Exception as e:
+            logging.debug(f"No EXIF for {path}: {e}")
+            fields = {'filename': os.path.basename(path)}
+        folder = os.path.dirname(os.path.relpath(path, self.local_folder))
+        fields['album'] = folder.replace(os.sep, '/') or None
+        return fields
+
+    def _done(self, path, st, future):
+        # Cancelled by close(): nothing was read, so nothing is recorded
+        fields = None
+        if not future.cancelled():
+            try:
+                fields = future.result()
+            except Exception as e:
+                logging.error(f"Metadata for {path} not indexed: {e}")
+        with self.lock:
+            self._in_flight.discard(path)
+            if fields is not None:
+                self._upsert(path, fields, prefer_new=False, size=st.st_size, mtime_ns=st.st_mtime_ns)
+                self.db.commit()
+            self._drained.notify_all()
+
+    def sync_paths(self, entries):
+        """
+        Reconciles the index with a folder listing of (path, size, mtime_ns):
+        rows for vanished files are dropped and new or changed files queued.
+        """
+        entries = list(entries)
+        with self.lock:
+            db = self.db
+            db.execute("CREATE TEMP TABLE IF NOT EXISTS metadata_scan "
+                       "(path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER) WITHOUT ROWID")
+            db.execute("DELETE FROM metadata_scan")
+            db.executemany("INSERT OR REPLACE INTO metadata_scan VALUES (?, ?, ?)", entries)
+            gone = db.execute(
+                "SELECT m.id FROM photo_metadata m LEFT JOIN metadata_scan s ON s.path = m.path "
+                "WHERE s.path IS NULL").fetchall()
+            stale = [r[0] for r in db.execute(
+                "SELECT s.path FROM metadata_scan s LEFT JOIN photo_metadata m ON m.path = s.path "
+                "WHERE m.size IS NULL OR m.size != s.size OR m.mtime_ns != s.mtime_ns")]
+            db.executemany("DELETE FROM photo_metadata WHERE id = ?", gone)
+            if self.fts:
+                db.executemany("DELETE FROM photo_text WHERE rowid = ?", gone)
+            db.execute("DELETE FROM metadata_scan")
+            db.commit()
+        for path in stale:
+            self.submit(path)
+        return len(stale)
+
+    def search(self, text=None, start=None, end=None, camera=None, album=None,
+               limit=DEFAULT_SEARCH_LIMIT, offset=0):
+        """
+        Photos matching every given filter, newest first. `start`/`end` are
+        ISO dates or datetimes (inclusive); `camera` matches make or model.
+        Returns a list of dicts with 'path', 'size', 'mtime_ns' and the metadata fields.
+        """
+        limit = max(1, min(int(limit), MAX_SEARCH_LIMIT))
+        where, params = [], []
+        if text:
+            if self.fts:
+                # Each word is matched as a prefix, quoted so FTS syntax in user input is inert
+                query = ' '.join('"' + word.replace('"', '""') + '"*' for word in text.split())
+                where.append("m.id IN (SELECT rowid FROM photo_text WHERE photo_text MATCH ?)")
+                params.append(query)
+            else:
+                for word in text.split():
+                    where.append("(m.filename LIKE ? OR m.album LIKE ? OR m.description LIKE ? "
+                                 "OR m.camera_make LIKE ? OR m.camera_model LIKE ?)")
+                    params.extend([f"%{word}%"] * 5)
+        if start:
+            where.append("m.taken_at >= ?")
+            params.append(start)
+        if end:
+            where.append("m.taken_at <= ?")
+            params.append(end if 'T' in end else end + 'T23:59:59')
+        if camera:
+            where.append("(m.camera_make = ? COLLATE NOCASE OR m.camera_model = ? COLLATE NOCASE)")
+            params.extend([camera, camera])
+        if album:
+            where.append("m.album = ?")
+            params.append(album)
+        sql = (f"SELECT m.path, {', '.join('m.' + f for f in FIELDS)}, m.size, m.mtime_ns FROM photo_metadata m"
+               + (" WHERE " + " AND ".join(where) if where else "")
+               + " ORDER BY m.taken_at DESC LIMIT ? OFFSET ?")
+        with self.lock:
+            rows = self.db.execute(sql, (*params, limit, int(offset))).fetchall()
+        return [dict(zip(('path',) + FIELDS + ('size', 'mtime_ns'), row)) for row in rows]
+
+    def cameras(self):
+        """[(make, model, count)] over the whole index."""
+        with self.lock:
+            return self.db.execute(
+                "SELECT camera_make, camera_model, COUNT(*) FROM photo_metadata "
+                "WHERE camera_model IS NOT NULL GROUP BY camera_make, camera_model "
+                "ORDER BY COUNT(*) DESC").fetchall()
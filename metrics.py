@@ -0,0 +1,265 @@
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+METRICS_DIR = "metrics"
+DEFAULT_DUMP_INTERVAL = 10.0   # seconds between snapshots written for /metrics
+STALE_AFTER = 300.0            # snapshots older than this belong to a process that exited
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}  # sorted label pairs -> value
+        self._lock = threading.Lock()
+
+    def render(self, extra=()):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(tuple(extra) + key)} {_number(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def render(self, extra=()):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                labels = tuple(extra) + key
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_labels(labels + (('le', _number(bound)),))} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(labels)} {total!r}")
+                lines.append(f"{self.name}_count{_labels(labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, **kwargs):
+        with self._lock:
+            if name not in self.metrics:
+                self.metrics[name] = cls(name, help_text, **kwargs)
+            return self.metrics[name]
+
+    def reset(self):
+        """Zeroes every metric, keeping the declarations."""
+        for metric in list(self.metrics.values()):
+            with metric._lock:
+                metric._values.clear()
+
+    def render(self, extra=()):
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render(extra))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help_text):
+    return REGISTRY._get(Counter, name, help_text)
+
+
+def gauge(name, help_text):
+    return REGISTRY._get(Gauge, name, help_text)
+
+
+def histogram(name, help_text, buckets=DEFAULT_BUCKETS):
+    return REGISTRY._get(Histogram, name, help_text, buckets=buckets)
+
+
+def reset():
+    REGISTRY.reset()
+
+
+PHASE_SECONDS = histogram("gemini_phase_seconds", "Time spent in each sync phase.")
+
+# --- Tracing ---
+_trace_file = None
+_trace_lock = threading.Lock()
+_dumping = set()
+
+
+def enable_tracing(path):
+    """Appends spans to `path` in Chrome trace-event format (chrome://tracing, Perfetto); None disables."""
+    global _trace_file
+    with _trace_lock:
+        if _trace_file is not None and _trace_file.name == path:
+            return
+        if _trace_file is not None:
+            _trace_file.close()
+            _trace_file = None
+        if path:
+            fresh = not os.path.exists(path) or os.path.getsize(path) == 0
+            _trace_file = open(path, 'a', encoding='utf-8')
+            if fresh:
+                _trace_file.write('[\n')  # the viewers accept an unterminated array
+            logging.info(f"Tracing sync phases to {path}")
+
+
+@contextmanager
+def span(phase, **args):
+    """Times a block into gemini_phase_seconds{phase=...} and, if tracing, the trace file."""
+    started = time.time()
+    start_clock = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start_clock
+        PHASE_SECONDS.observe(elapsed, phase=phase)
+        if _trace_file is not None:
+            event = {"name": phase, "ph": "X", "ts": int(started * 1e6), "dur": int(elapsed * 1e6),
+                     "pid": os.getpid(), "tid": threading.get_ident(), "args": args}
+            with _trace_lock:
+                if _trace_file is not None:
+                    _trace_file.write(json.dumps(event) + ',\n')
+                    _trace_file.flush()
+
+
+# --- Cross-process exposition ---
+def metrics_dir(local_folder):
+    from sync_state import state_dir  # deferred: sync_state itself records metrics
+    path = os.path.join(state_dir(local_folder), METRICS_DIR)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def dump(local_folder, process):
+    """Writes this process's metrics to .gemini_sync/metrics/<process>.prom."""
+    path = os.path.join(metrics_dir(local_folder), f"{process}.prom")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(REGISTRY.render(extra=(('process', process),)))
+    os.replace(tmp, path)
+
+
+def start_dumping(process, folder_fn, interval=DEFAULT_DUMP_INTERVAL):
+    """Background thread that dumps metrics for the folder `folder_fn()` returns; started once per process name."""
+    with _trace_lock:
+        if process in _dumping:
+            return
+        _dumping.add(process)
+
+    def run():
+        while True:
+            time.sleep(interval)
+            folder = folder_fn()
+            if folder and os.path.isdir(folder):
+                try:
+                    dump(folder, process)
+                except OSError as e:
+                    logging.debug(f"Could not write metrics: {e}")
+    threading.Thread(target=run, daemon=True, name="metrics").start()
+
+
+def collect(local_folder, process=None):
+    """
+    Prometheus text for every process sharing `local_folder` (plus this one,
+    if `process` is given), with each metric family declared once.
+    """
+    sources = []
+    if process:
+        sources.append(REGISTRY.render(extra=(('process', process),)))
+    folder = metrics_dir(local_folder) if local_folder and os.path.isdir(local_folder) else None
+    for name in sorted(os.listdir(folder)) if folder else []:
+        path = os.path.join(folder, name)
+        if not name.endswith('.prom') or name == f"{process}.prom":
+            continue
+        try:
+            if time.time() - os.path.getmtime(path) > STALE_AFTER:
+                continue
+            with open(path, encoding='utf-8') as f:
+                sources.append(f.read())
+        except OSError:
+            continue
+
+    families = {}  # name -> [help, type, samples]
+    current = None
+    for text in sources:
+        for line in text.splitlines():
+            if line.startswith('# HELP '):
+                name, _, help_text = line[7:].partition(' ')
+                current = families.setdefault(name, [help_text, 'untyped', []])
+            elif line.startswith('# TYPE '):
+                name, _, kind = line[7:].partition(' ')
+                current = families.setdefault(name, ['', kind, []])
+                current[1] = kind
+            elif line and current is not None:
+                current[2].append(line)
+    out = []
+    for name, (help_text, kind, samples) in families.items():
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} {kind}")
+        out.extend(samples)
+    return '\n'.join(out) + '\n'
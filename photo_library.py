@@ -0,0 +1,144 @@
+import os
+import base64
+import hashlib
+import logging
+import threading
+import time
+
+from folder_scan import scan_tree
+from sync_state import open_db
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.gif', '.tif', '.tiff', '.heic')
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.m4v', '.webm', '.avi', '.3gp', '.mkv')
+MEDIA_EXTENSIONS = IMAGE_EXTENSIONS + VIDEO_EXTENSIONS
+DEFAULT_REFRESH_INTERVAL = 300  # seconds between background rescans
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS library (
+    photo_id TEXT PRIMARY KEY,
+    path     TEXT NOT NULL,
+    size     INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_library_recent ON library(mtime_ns DESC, photo_id DESC);
+"""
+
+
+def photo_id_for(local_folder, path):
+    """Stable id derived from the path relative to the library root."""
+    rel = os.path.relpath(path, local_folder).replace(os.sep, '/')
+    return hashlib.sha1(rel.encode('utf-8')).hexdigest()[:16]
+
+
+def encode_cursor(mtime_ns, photo_id):
+    return base64.urlsafe_b64encode(f"{mtime_ns}:{photo_id}".encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    mtime_ns, photo_id = base64.urlsafe_b64decode(padded.encode()).decode().split(':', 1)
+    return int(mtime_ns), photo_id
+
+
+class PhotoLibrary:
+    """
+    Index of the photos and videos under local_folder, kept in the sync-state
+    database and refreshed by a background scan. Listing pages newest-first
+    with a keyset cursor, so every page is one indexed query.
+    """
+    def __init__(self, local_folder):
+        self.local_folder = local_folder
+        self.db = open_db(local_folder)
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def close(self):
+        self._stop.set()
+        with self.lock:
+            self.db.close()
+
+    def refresh(self):
+        started = time.monotonic()
+        folder = self.local_folder
+        # Walked before taking the lock, so pages and media keep being served during the scan
+        rows = [(photo_id_for(folder, path), path, size, mtime_ns)
+                for path, size, mtime_ns, _ in scan_tree(
+                    folder, include=lambda name: name.lower().endswith(MEDIA_EXTENSIONS))]
+        with self.lock:
+            db = self.db
+            db.execute("CREATE TEMP TABLE IF NOT EXISTS library_scan "
+                       "(photo_id TEXT PRIMARY KEY, path TEXT, size INTEGER, mtime_ns INTEGER) WITHOUT ROWID")
+            db.execute("DELETE FROM library_scan")
+            db.executemany("INSERT OR REPLACE INTO library_scan VALUES (?, ?, ?, ?)", rows)
+            db.execute("DELETE FROM library WHERE photo_id NOT IN (SELECT photo_id FROM library_scan)")
+            db.execute("INSERT OR REPLACE INTO library "
+                       "SELECT c.* FROM library_scan c LEFT JOIN library l ON l.photo_id = c.photo_id "
+                       "WHERE l.photo_id IS NULL OR l.size != c.size OR l.mtime_ns != c.mtime_ns")
+            db.execute("DELETE FROM library_scan")
+            db.commit()
+            total = db.execute("SELECT COUNT(*) FROM library").fetchone()[0]
+        logging.info(f"Photo library indexed: {total} files in {time.monotonic() - started:.1f}s")
+
+    def start_background_refresh(self, interval=DEFAULT_REFRESH_INTERVAL, on_refresh=None):
+        def run():
+            while not self._stop.is_set():
+                try:
+                    self.refresh()
+                    if on_refresh:
+                        on_refresh(self)
+                except Exception as e:
+                    logging.error(f"Library refresh failed: {e}")
+                self._stop.wait(interval)
+        threading.Thread(target=run, daemon=True).start()
+
+    def page(self, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        """Returns (rows, next_cursor); rows are (photo_id, path, size, mtime_ns), newest first."""
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        with self.lock:
+            if cursor:
+                mtime_ns, photo_id = decode_cursor(cursor)
+                rows = self.db.execute(
+                    "SELECT photo_id, path, size, mtime_ns FROM library "
+                    "WHERE mtime_ns < ? OR (mtime_ns = ? AND photo_id < ?) "
+                    "ORDER BY mtime_ns DESC, photo_id DESC LIMIT ?",
+                    (mtime_ns, mtime_ns, photo_id, limit + 1)).fetchall()
+            else:
+                rows = self.db.execute(
+                    "SELECT photo_id, path, size, mtime_ns FROM library "
+                    "ORDER BY mtime_ns DESC, photo_id DESC LIMIT ?", (limit + 1,)).fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1][3], rows[-1][0])
+        return rows, next_cursor
+
+    def entries(self):
+        """(path, size, mtime_ns) for every indexed file."""
+        with self.lock:
+            return self.db.execute("SELECT path, size, mtime_ns FROM library").fetchall()
+
+    def get(self, photo_id):
+        """(photo_id, path, size, mtime_ns) or None."""
+        with self.lock:
+            return self.db.execute(
+                "SELECT photo_id, path, size, mtime_ns FROM library WHERE photo_id = ?", (photo_id,)
+            ).fetchone()
+
+    def describe(self, row):
+        """JSON-friendly view of a library row for the web app."""
+        photo_id, path, size, mtime_ns = row
+        rel = os.path.relpath(path, self.local_folder)
+        album = os.path.dirname(rel).replace(os.sep, '/')
+        return {
+            "id": photo_id,
+            "name": os.path.basename(path),
+            "album": album,
+            "size": size,
+            "modified": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(mtime_ns / 1e9)),
+            "type": "video" if path.lower().endswith(VIDEO_EXTENSIONS) else "image",
+            "url": f"/media/{photo_id}",
+            "thumbnail": f"/thumb/{photo_id}",
+        }
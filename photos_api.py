@@ -0,0 +1,405 @@
+import os
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+
+import metrics
+
+# Google Photos Library API
+# Overridable so benchmarks can point the client at a local stand-in server
+API_BASE = os.environ.get("GEMINI_PHOTOS_API_BASE", "https://photoslibrary.googleapis.com/v1")
+ALBUMS_PAGE_SIZE = 50        # API maximum for albums.list
+MEDIA_ITEMS_PAGE_SIZE = 100  # API maximum for mediaItems:search
+BATCH_GET_SIZE = 50          # API maximum for mediaItems:batchGet
+
+# baseUrls stop working about 60 minutes after they are handed out
+FETCHED_AT = "_fetchedAt"           # added to listed items: time.monotonic() when their page arrived
+DEFAULT_BASE_URL_MAX_AGE = 45 * 60  # seconds before a queued baseUrl is re-fetched ahead of use
+
+API_REQUESTS = metrics.counter("gemini_http_requests_total", "Requests to Google Photos by client and status.")
+API_LATENCY = metrics.histogram("gemini_http_request_seconds", "Time until Google Photos response headers arrive.")
+API_RETRIES = metrics.counter("gemini_http_retries_total", "Google Photos requests retried after 429, 5xx or connection errors.")
+URL_REFRESHES = metrics.counter("gemini_base_url_refreshes_total", "baseUrls re-fetched with mediaItems:batchGet, by reason (stale, expired, ahead).")
+
+# Retry policy
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 6
+BACKOFF_BASE = 1.0   # seconds
+BACKOFF_CAP = 64.0   # seconds
+
+# Default daily budgets (Library API requests / media byte requests)
+DEFAULT_API_QUOTA = 10000
+DEFAULT_MEDIA_QUOTA = 75000
+
+
+class PhotosApiError(Exception):
+    """Raised when the Photos Library API returns a non-200 response."""
+    def __init__(self, status_code, message):
+        super().__init__(f"Google API Error ({status_code}):\n{message}")
+        self.status_code = status_code
+        self.message = message
+
+
+class QuotaExceeded(PhotosApiError):
+    """Raised locally, without a request, once the configured daily quota is spent."""
+    def __init__(self, name, limit):
+        super().__init__(429, f"Daily {name} quota of {limit} requests used up")
+
+
+def error_from_response(response):
+    try:
+        message = response.json().get('error', {}).get('message', response.text)
+    except Exception:
+        message = response.text or f"HTTP Error {response.status_code}"
+    return PhotosApiError(response.status_code, message)
+
+
+def retry_after_seconds(value):
+    """Parses a Retry-After header given either as seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+        return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff."""
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+
+
+class DailyQuota:
+    """
+    Counts requests against a per-UTC-day budget; a limit of 0 disables the
+    check. With a `ledger` (sync_state.QuotaLedger) the count is kept in the
+    sync-state database, so restarts and --once runs keep counting.
+    """
+    def __init__(self, name, limit, ledger=None):
+        self.name = name
+        self.limit = int(limit or 0)
+        self.used = 0
+        self._day = None
+        self._lock = threading.Lock()
+        self.ledger = ledger
+        if ledger is not None:
+            self._day, self.used = ledger.load(name)
+
+    def take(self):
+        with self._lock:
+            today = datetime.now(timezone.utc).date()
+            if today != self._day:
+                self._day, self.used = today, 0
+            if self.limit and self.used >= self.limit:
+                raise QuotaExceeded(self.name, self.limit)
+            if self.ledger is not None:
+                # Counted in the database, so other processes' requests are included
+                self.used = self.ledger.add(self.name, today)
+            else:
+                self.used += 1
+
+    @property
+    def exhausted(self):
+        with self._lock:
+            today = datetime.now(timezone.utc).date()
+            return bool(self.limit) and today == self._day and self.used >= self.limit
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit that halves whenever the server pushes back (429) and
+    creeps back up by one after a full window of successful requests.
+    """
+    def __init__(self, limit, minimum=1):
+        self.max_limit = max(minimum, int(limit))
+        self.minimum = minimum
+        self.limit = self.max_limit
+        self.active = 0
+        self._successes = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.active >= self.limit:
+                self._cond.wait()
+            self.active += 1
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def success(self):
+        with self._cond:
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.max_limit:
+                self.limit += 1
+                self._successes = 0
+                self._cond.notify()
+
+    def backoff(self):
+        with self._cond:
+            new_limit = max(self.minimum, self.limit // 2)
+            if new_limit < self.limit:
+                logging.warning(f"Server pushback: concurrency {self.limit} -> {new_limit}")
+            self.limit = new_limit
+            self._successes = 0
+
+
+class ApiClient:
+    """
+    Shared HTTP layer for every Photos request: retries 429/5xx and connection
+    errors with jittered exponential backoff (honouring Retry-After), counts
+    requests against a daily quota and adapts per-host concurrency.
+    """
+    def __init__(self, session=None, quota=None, concurrency=8, max_retries=MAX_RETRIES):
+        self.session = session or requests.Session()
+        self.quota = quota or DailyQuota("api", 0)
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.retries = 0
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def limiter_for(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._limiters:
+                self._limiters[host] = AdaptiveLimiter(self.concurrency)
+            return self._limiters[host]
+
+    def request(self, method, url, **kwargs):
+        return self._send(method, url, kwargs, hold=False)
+
+    @contextmanager
+    def stream(self, method, url, **kwargs):
+        """
+        request() with stream=True, for downloads: the per-host slot stays
+        taken until the block exits, so the body transfer (not just the
+        headers) counts against the host's concurrency limit.
+        """
+        limiter = self.limiter_for(url)
+        response = self._send(method, url, dict(kwargs, stream=True), hold=True)
+        try:
+            yield response
+        finally:
+            response.close()
+            limiter.release()
+
+    def _send(self, method, url, kwargs, hold):
+        """Sends with retries; with `hold`, the returned response still holds its limiter slot."""
+        limiter = self.limiter_for(url)
+        client = self.quota.name
+        for attempt in range(self.max_retries + 1):
+            self.quota.take()
+            limiter.acquire()
+            try:
+                started = time.perf_counter()
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                limiter.release()
+                API_REQUESTS.inc(client=client, status="error")
+                if attempt == self.max_retries:
+                    raise
+                delay = backoff_delay(attempt)
+                logging.warning(f"{method} {urlsplit(url).path} failed ({e}); retrying in {delay:.1f}s")
+                self._count_retry()
+                time.sleep(delay)
+                continue
+            except BaseException:
+                limiter.release()
+                raise
+            API_LATENCY.observe(time.perf_counter() - started, client=client)
+            API_REQUESTS.inc(client=client, status=response.status_code)
+
+            retry = response.status_code in RETRY_STATUSES
+            if not retry:
+                limiter.success()
+            elif response.status_code == 429:
+                limiter.backoff()
+            if not retry or attempt == self.max_retries:
+                if not hold:
+                    limiter.release()
+                return response
+            limiter.release()
+
+            delay = retry_after_seconds(response.headers.get("Retry-After"))
+            if delay is None:
+                delay = backoff_delay(attempt)
+            response.close()
+            logging.warning(f"{method} {urlsplit(url).path} -> {response.status_code}; "
+                            f"retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+            self._count_retry()
+            time.sleep(delay)
+
+    def _count_retry(self):
+        API_RETRIES.inc(client=self.quota.name)
+        with self._lock:
+            self.retries += 1
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+
+def iter_pages(client, method, url, headers, params=None, payload=None):
+    """
+    Walks a paginated endpoint lazily, following nextPageToken.
+    Yields one decoded page at a time so callers never hold more than a page.
+    """
+    params = dict(params or {})
+    payload = dict(payload or {})
+    while True:
+        if method == 'GET':
+            response = client.get(url, headers=headers, params=params)
+        else:
+            response = client.post(url, headers=headers, json=payload)
+
+        if response.status_code != 200:
+            raise error_from_response(response)
+
+        data = response.json()
+        yield data
+
+        token = data.get('nextPageToken')
+        if not token:
+            return
+        if method == 'GET':
+            params['pageToken'] = token
+        else:
+            payload['pageToken'] = token
+
+
+def iter_albums(client, headers):
+    """Yields every album in the library, across all pages."""
+    params = {"pageSize": ALBUMS_PAGE_SIZE}
+    for page in iter_pages(client, 'GET', f"{API_BASE}/albums", headers, params=params):
+        for album in page.get('albums', []):
+            yield album
+
+
+def iter_media_items(client, album_id, headers):
+    """
+    Yields every media item in an album as its page arrives, stamped with
+    FETCHED_AT so the age of its baseUrl is known when it is finally used.
+    """
+    payload = {"albumId": album_id, "pageSize": MEDIA_ITEMS_PAGE_SIZE}
+    pages = 0
+    for page in iter_pages(client, 'POST', f"{API_BASE}/mediaItems:search", headers, payload=payload):
+        pages += 1
+        fetched_at = time.monotonic()
+        for media_item in page.get('mediaItems', []):
+            media_item[FETCHED_AT] = fetched_at
+            yield media_item
+    logging.debug(f"Listed album {album_id} in {pages} page(s)")
+
+
+def batch_get_media_items(client, ids, headers):
+    """
+    Fetches up to BATCH_GET_SIZE media items in one mediaItems:batchGet call.
+    Returns {id: mediaItem}; ids the API could not return are left out.
+    """
+    ids = list(ids)
+    if len(ids) > BATCH_GET_SIZE:
+        raise ValueError(f"mediaItems:batchGet takes at most {BATCH_GET_SIZE} ids")
+    response = client.get(f"{API_BASE}/mediaItems:batchGet", headers=headers,
+                          params=[("mediaItemIds", media_id) for media_id in ids])
+    if response.status_code != 200:
+        raise error_from_response(response)
+    items = {}
+    for result in response.json().get('mediaItemResults', []):
+        media_item = result.get('mediaItem')
+        if media_item:
+            items[media_item['id']] = media_item
+    return items
+
+
+class BaseUrlRefresher:
+    """
+    Keeps the baseUrls of queued downloads usable on long syncs.
+    `track` remembers each queued item's baseUrl and when it was listed;
+    `resolve` hands it back unchanged while it is young, and otherwise
+    re-fetches it with mediaItems:batchGet, topping the call up to
+    BATCH_GET_SIZE ids with the oldest other queued urls so a long queue
+    costs one call per 50 items rather than one per item.
+    """
+    def __init__(self, client, headers_fn, max_age=DEFAULT_BASE_URL_MAX_AGE):
+        self.client = client
+        self.headers_fn = headers_fn
+        self.max_age = max_age
+        self.calls = 0
+        self._urls = {}  # media id -> (baseUrl, fetched_at), in queueing order
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def track(self, item):
+        with self._lock:
+            self._urls[item['id']] = (item['baseUrl'], item.get(FETCHED_AT, time.monotonic()))
+
+    def forget(self, media_id):
+        with self._lock:
+            self._urls.pop(media_id, None)
+
+    def _age(self, media_id):
+        with self._lock:
+            url, fetched_at = self._urls[media_id]
+        return url, time.monotonic() - fetched_at
+
+    def resolve(self, media_id, expired=False):
+        """
+        The baseUrl to use for `media_id` now. `expired` forces a refresh,
+        for when the server has already rejected the url.
+        """
+        url, age = self._age(media_id)
+        if not expired and age < self.max_age:
+            return url
+        with self._refresh_lock:
+            # Another worker's batch may have refreshed this one meanwhile
+            url, age = self._age(media_id)
+            if not expired and age < self.max_age:
+                return url
+            with self._lock:
+                oldest = sorted((fetched_at, other) for other, (_, fetched_at) in self._urls.items()
+                                if other != media_id)
+            ids = [media_id] + [other for _, other in oldest[:BATCH_GET_SIZE - 1]]
+            headers = self.headers_fn()
+            if not headers:
+                return url
+            fetched_at = time.monotonic()
+            try:
+                items = batch_get_media_items(self.client, ids, headers)
+            except (PhotosApiError, requests.RequestException) as e:
+                logging.warning(f"Could not refresh {len(ids)} baseUrl(s): {e}")
+                return url
+            self.calls += 1
+            needed = int(media_id in items)
+            URL_REFRESHES.inc(needed, reason="expired" if expired else "stale")
+            URL_REFRESHES.inc(len(items) - needed, reason="ahead")
+            with self._lock:
+                for other, media_item in items.items():
+                    # Skip items that finished while the call was in flight
+                    if other in self._urls:
+                        self._urls[other] = (media_item['baseUrl'], fetched_at)
+            logging.info(f"Refreshed {len(items)} baseUrl(s) with mediaItems:batchGet")
+        return self._age(media_id)[0]
@@ -0,0 +1,30 @@
+import logging
+
+# "listed" keeps the API's order (and streams it: nothing is buffered)
+SYNC_ORDERS = ("listed", "newest", "oldest")
+DEFAULT_SYNC_ORDER = "listed"
+
+
+def _created(item):
+    # RFC 3339 with optional fractional seconds; the first 19 characters sort chronologically
+    return (item.get('mediaMetadata', {}).get('creationTime') or "")[:19]
+
+
+def order_items(pending, order=DEFAULT_SYNC_ORDER):
+    """
+    Orders the (item, previous_path) pairs of one album for downloading.
+    "newest" and "oldest" sort by creationTime, which means the album's
+    pending items are collected before the first download is queued.
+    """
+    if order not in SYNC_ORDERS:
+        logging.warning(f"Unknown sync_order {order!r}; using {DEFAULT_SYNC_ORDER!r}")
+        order = DEFAULT_SYNC_ORDER
+    if order == "listed":
+        return pending
+    return sorted(pending, key=lambda pair: _created(pair[0]), reverse=order == "newest")
+
+
+def order_albums(albums, pinned=(), title=lambda album: album):
+    """Pinned albums first, in the order they were pinned; the rest keep their order."""
+    rank = {name: index for index, name in enumerate(pinned or ())}
+    return sorted(albums, key=lambda album: rank.get(title(album), len(rank)))
@@ -4,23 +4,40 @@ import threading
 import webbrowser
 import logging
 import time
-import json
-import tkinter as tk
-from tkinter import filedialog, messagebox, ttk
-from PIL import Image, ImageDraw
+
+STARTED = time.perf_counter()
 
 # Third-party imports
-from pystray import Icon, MenuItem as item, Menu
+# (tkinter, pystray and PIL are imported where they are used, so --daemon
+# and --once runs never load them and work without a display)
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
+# Local modules
+from config_store import ConfigStore
+from sync_state import STATE_DIR_NAME
+from folder_scan import ScanSnapshot, scan_tree, DEFAULT_SCAN_WORKERS
+from thumbnails import ThumbnailPipeline
+from watch_queue import CoalescingQueue, DEFAULT_DEBOUNCE, DEFAULT_WORKERS as DEFAULT_WATCH_WORKERS
+from uploader import UploadPipeline, DEFAULT_UPLOAD_WORKERS
+from headless import parse_args, report_startup, wait_for_signal
+import metrics
+
 # Configuration
 CONFIG_FILE = "sync_config.json"
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.bmp', '.heic')
 DEFAULT_CONFIG = {
     "web_app_url": "http://localhost:3000", 
     "local_folder": "",
     "auto_sync": False,
-    "api_key": ""
+    "api_key": "",
+    "watch_debounce_seconds": DEFAULT_DEBOUNCE, # quiet period before a changed file is synced
+    "watch_workers": DEFAULT_WATCH_WORKERS, # files synced in parallel
+    "upload_workers": DEFAULT_UPLOAD_WORKERS, # concurrent upload requests to web_app_url
+    "scan_workers": DEFAULT_SCAN_WORKERS, # threads for the startup folder scan
+    "generate_thumbnails": True,
+    "thumbnail_workers": None, # processes; None = one per CPU
+    "trace_file": "" # optional path; per-phase timing spans are appended here
 }
 
 # Setup Logging
@@ -31,54 +48,178 @@ logging.basicConfig(
 )
 
 # Global State
+config_store = ConfigStore(CONFIG_FILE, DEFAULT_CONFIG)
 config = DEFAULT_CONFIG.copy()
 observer = None
+work_queue = None
+snapshot = None
+thumbnailer = None
+uploader = None
+snapshot_lock = threading.Lock()
 tray_icon = None
 
+WATCH_QUEUE = metrics.gauge("gemini_watch_queue_depth", "Files waiting in the watcher queue by state (pending, queued, running).")
+
 def load_config():
     global config
-    if os.path.exists(CONFIG_FILE):
-        try:
-            with open(CONFIG_FILE, 'r') as f:
-                config = json.load(f)
-        except Exception as e:
-            logging.error(f"Failed to load config: {e}")
+    # Served from the in-memory cache unless the file changed on disk
+    config = config_store.get()
+    metrics.enable_tracing(config.get("trace_file") or None)
 
-def save_config():
+def save_config(changes):
+    """Writes only `changes` (locked read-modify-write), so keys another process just saved survive."""
+    config.update(changes)
     try:
-        with open(CONFIG_FILE, 'w') as f:
-            json.dump(config, f, indent=4)
+        config_store.update(changes)
     except Exception as e:
         logging.error(f"Failed to save config: {e}")
 
+def on_config_changed(new_config):
+    """Restarts the watcher when the folder or auto-sync flag changes elsewhere."""
+    global config
+    watched = (config.get("local_folder"), config.get("auto_sync"))
+    config = new_config
+    metrics.enable_tracing(config.get("trace_file") or None)
+    if (config.get("local_folder"), config.get("auto_sync")) != watched:
+        start_watching()
+
 # --- Real-time File Watcher (OneDrive-like) ---
 class GeminiSyncHandler(FileSystemEventHandler):
+    """
+    Runs on the watchdog observer thread, so it only records events; the
+    coalescing queue debounces them per path and processes them in parallel.
+    """
+    def __init__(self, queue):
+        super().__init__()
+        self.queue = queue
+
     def on_created(self, event):
         if not event.is_directory and self.is_image(event.src_path):
-            self.process_file(event.src_path, "Created")
+            self.queue.submit(event.src_path, "Created")
 
     def on_modified(self, event):
         if not event.is_directory and self.is_image(event.src_path):
-            self.process_file(event.src_path, "Modified")
+            self.queue.submit(event.src_path, "Modified")
+
+    def on_moved(self, event):
+        # Many copy tools write a temp file and rename it into place
+        if not event.is_directory and self.is_image(event.dest_path):
+            self.queue.submit(event.dest_path, "Created")
 
     def is_image(self, path):
-        return path.lower().endswith(('.png', '.jpg', '.jpeg', '.webp', '.bmp', '.heic'))
+        # Skip the cloud sync's own bookkeeping (blob store, state db)
+        if STATE_DIR_NAME in path.split(os.sep):
+            return False
+        return path.lower().endswith(IMAGE_EXTENSIONS)
 
-    def process_file(self, file_path, action):
-        logging.info(f"[{action}] Detected: {file_path}")
-        if tray_icon:
-            tray_icon.title = f"Syncing: {os.path.basename(file_path)}..."
-        
-        # Simulate Upload Delay
-        time.sleep(1)
-        
-        # In a real implementation:
-        # 1. Generate local embedding or description using Gemini API (Python SDK)
-        # 2. Upload to Web App via API
-        logging.info(f"✔ Synced: {file_path}")
-        
-        if tray_icon:
-            tray_icon.title = "Gemini Sync: Up to date"
+
+def process_file(file_path, action):
+    logging.info(f"[{action}] Detected: {file_path}")
+    # Persisted in the outbox first, so a restart mid-import loses nothing
+    pipeline = get_uploader()
+    if pipeline:
+        pipeline.enqueue(file_path, action)
+
+def file_uploaded(file_path):
+    logging.info(f"✔ Synced: {file_path}")
+    snapshot = get_snapshot()
+    if snapshot:
+        snapshot.record(file_path)
+    thumbnailer = get_thumbnailer()
+    if thumbnailer:
+        thumbnailer.submit(file_path)
+    update_tray_status(get_work_queue().stats())
+
+def update_tray_status(stats):
+    for state in ("pending", "queued", "running"):
+        WATCH_QUEUE.set(stats[state], state=state)
+    if not tray_icon:
+        return
+    remaining = stats["pending"] + stats["queued"] + stats["running"]
+    if uploader:
+        remaining += uploader.pending()
+    if remaining:
+        tray_icon.title = f"Syncing: {remaining} file(s) remaining..."
+    else:
+        tray_icon.title = "Gemini Sync: Up to date"
+        logging.info(f"Sync queue drained: {stats['processed']} processed, "
+                     f"{stats['coalesced']} duplicate events coalesced, peak depth {stats['max_depth']}")
+
+def get_work_queue():
+    global work_queue
+    if work_queue is None:
+        work_queue = CoalescingQueue(
+            process_file,
+            debounce=config.get("watch_debounce_seconds", DEFAULT_DEBOUNCE),
+            workers=config.get("watch_workers", DEFAULT_WATCH_WORKERS),
+            on_change=update_tray_status,
+        )
+    return work_queue
+
+def get_snapshot():
+    """Snapshot of the files already synced from the current local_folder."""
+    global snapshot
+    folder = config.get("local_folder")
+    if not folder or not os.path.exists(folder):
+        return None
+    with snapshot_lock:
+        if snapshot is None or snapshot.local_folder != folder:
+            if snapshot is not None:
+                snapshot.close()
+            snapshot = ScanSnapshot(folder)
+        return snapshot
+
+def get_thumbnailer():
+    """Thumbnail process pool for the current local_folder, or None if disabled."""
+    global thumbnailer
+    folder = config.get("local_folder")
+    if not config.get("generate_thumbnails", True) or not folder or not os.path.exists(folder):
+        return None
+    with snapshot_lock:
+        if thumbnailer is None or thumbnailer.local_folder != folder:
+            if thumbnailer is not None:
+                thumbnailer.close()
+            thumbnailer = ThumbnailPipeline(folder, workers=config.get("thumbnail_workers"))
+        return thumbnailer
+
+def get_uploader():
+    """Upload pipeline for the current local_folder and web_app_url; resumes the persisted outbox."""
+    global uploader
+    folder = config.get("local_folder")
+    url = config.get("web_app_url")
+    if not folder or not url or not os.path.exists(folder):
+        return None
+    with snapshot_lock:
+        if uploader is None or uploader.local_folder != folder or uploader.base_url != url.rstrip('/'):
+            if uploader is not None:
+                uploader.stop(wait=False)
+            uploader = UploadPipeline(folder, url, token=config.get("api_key") or None,
+                                      workers=config.get("upload_workers", DEFAULT_UPLOAD_WORKERS),
+                                      on_uploaded=file_uploaded)
+        return uploader
+
+def reconcile_folder(folder):
+    """
+    Picks up files added, changed or removed while the client was not running
+    by diffing a parallel scan against the persisted snapshot.
+    """
+    started = time.monotonic()
+    snap = get_snapshot()
+    if snap is None:
+        return
+    entries = scan_tree(folder, include=lambda name: name.lower().endswith(IMAGE_EXTENSIONS),
+                        workers=config.get("scan_workers", DEFAULT_SCAN_WORKERS))
+    with metrics.span("startup_scan", folder=folder):
+        added, modified, deleted = snap.diff(entries)
+    if deleted:
+        snap.forget(deleted)
+    queue = get_work_queue()
+    for path in added:
+        queue.submit(path, "Created")
+    for path in modified:
+        queue.submit(path, "Modified")
+    logging.info(f"Startup scan of {folder} took {time.monotonic() - started:.1f}s: "
+                 f"{len(added)} new, {len(modified)} changed, {len(deleted)} removed while offline")
 
 def start_watching():
     global observer
@@ -87,16 +228,58 @@ def start_watching():
         observer.join()
     
     if config["auto_sync"] and config["local_folder"] and os.path.exists(config["local_folder"]):
-        event_handler = GeminiSyncHandler()
+        event_handler = GeminiSyncHandler(get_work_queue())
         observer = Observer()
         observer.schedule(event_handler, config["local_folder"], recursive=True)
         observer.start()
         logging.info(f"Started watching: {config['local_folder']}")
+        get_uploader()  # picks up uploads left over from the last run
+        # Watch first, then scan: anything changing meanwhile is coalesced by the queue
+        threading.Thread(target=reconcile_folder, args=(config["local_folder"],), daemon=True).start()
     else:
         logging.info("Sync watcher not started (Check config or disabled).")
 
+def sync_once():
+    """
+    Uploads whatever was added or changed in local_folder since the last run.
+    Returns True if nothing is left waiting in the outbox and the web app
+    rejected nothing.
+    """
+    folder = config.get("local_folder")
+    if not folder or not os.path.exists(folder):
+        logging.error("Local folder is not set or does not exist; nothing to sync.")
+        return False
+    # Nothing is being written: hand files over as soon as the scan finds them
+    config["watch_debounce_seconds"] = 0
+    pipeline = get_uploader()
+    if pipeline is None:
+        logging.error("No web_app_url in the config; nothing to sync.")
+        return False
+    reconcile_folder(folder)
+    get_work_queue().join()
+    idle = pipeline.wait_idle()
+    rejected = pipeline.rejected()
+    if rejected:
+        logging.warning(f"{rejected} file(s) were rejected by the web app; they are retried once they change")
+    return idle and not rejected
+
+def shutdown(wait=False):
+    """Stops the watcher and pipelines; with `wait`, in-flight uploads and thumbnails finish first."""
+    if observer:
+        observer.stop()
+        observer.join()
+    if work_queue:
+        work_queue.stop(wait=wait)
+    if uploader:
+        uploader.stop(wait=wait)
+    if thumbnailer:
+        thumbnailer.close(wait=wait)
+
 # --- GUI Settings Window ---
 def open_settings_window(icon, item):
+    import tkinter as tk
+    from tkinter import filedialog, messagebox, ttk
+
     root = tk.Tk()
     root.title("Gemini Sync Settings")
     root.geometry("500x480")
@@ -123,11 +306,12 @@ def open_settings_window(icon, item):
             folder_var.set(folder_selected)
 
     def save_settings():
-        config["web_app_url"] = url_var.get()
-        config["local_folder"] = folder_var.get()
-        config["api_key"] = key_var.get()
-        config["auto_sync"] = auto_sync_var.get()
-        save_config()
+        save_config({
+            "web_app_url": url_var.get(),
+            "local_folder": folder_var.get(),
+            "api_key": key_var.get(),
+            "auto_sync": auto_sync_var.get(),
+        })
         
         # Restart Watcher
         start_watching()
@@ -165,6 +349,8 @@ def open_settings_window(icon, item):
 
 # --- System Tray ---
 def create_image():
+    from PIL import Image, ImageDraw
+
     # Generate a simple icon if file missing
     w, h = 64, 64
     image = Image.new('RGB', (w, h), color=(255, 255, 255))
@@ -179,16 +365,33 @@ def open_web(icon, item):
     webbrowser.open(config.get("web_app_url", "http://localhost:3000"))
 
 def quit_app(icon, item):
-    if observer:
-        observer.stop()
-        observer.join()
+    shutdown()
     icon.stop()
     sys.exit()
 
 def main():
     global tray_icon
+    args = parse_args("Watches the local folder and uploads new photos to the web app.")
     load_config()
+    if args.once:
+        report_startup("Sync client", STARTED)
+        ok = sync_once()
+        shutdown(wait=True)
+        if config.get("local_folder") and os.path.exists(config["local_folder"]):
+            metrics.dump(config["local_folder"], "app")
+        sys.exit(0 if ok else 1)
+
     start_watching()
+    config_store.subscribe(on_config_changed)
+    metrics.start_dumping("app", lambda: config.get("local_folder"))
+    report_startup("Sync client", STARTED)
+    if args.daemon:
+        wait_for_signal()
+        shutdown()
+        return
+
+    from pystray import Icon, MenuItem as item, Menu
+    from PIL import Image
 
     # Try to load icon file, fallback to generated
     icon_path = "public/icon.ico"
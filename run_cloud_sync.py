@@ -4,15 +4,32 @@ import threading
 import webbrowser
 import logging
 import time
-import json
-import tkinter as tk
-from tkinter import filedialog, messagebox, ttk
-import requests
+import signal
 from queue import Queue, Empty
 
-# Third-party imports
-from pystray import Icon, MenuItem as item, Menu
-from PIL import Image, ImageDraw
+STARTED = time.perf_counter()
+
+# GUI modules (tkinter, pystray, PIL) are imported where they are used,
+# so --daemon and --once runs never load them and work without a display.
+
+# Local modules
+from photos_api import (ApiClient, DailyQuota, PhotosApiError, BaseUrlRefresher, iter_albums, iter_media_items,
+                        DEFAULT_API_QUOTA, DEFAULT_MEDIA_QUOTA, DEFAULT_BASE_URL_MAX_AGE)
+from downloader import (DownloadEngine, DownloadBatch, TokenBucket, scheduled_rate,
+                        DEFAULT_WORKERS, DEFAULT_PER_HOST, PART_SUFFIX, ORIGINAL, PREVIEW)
+from sync_state import SyncState, QuotaLedger, state_dir
+from blob_store import BlobStore
+from thumbnails import ThumbnailPipeline
+from dedupe import DuplicateIndex, DEFAULT_MAX_DISTANCE
+from metadata_index import MetadataIndex, DEFAULT_EXIF_WORKERS
+from album_cache import (AlbumCache, token_fingerprint, CACHE_FILE as ALBUM_CACHE_FILE,
+                         DEFAULT_TTL as DEFAULT_ALBUM_TTL)
+from config_store import ConfigStore
+from scheduler import SyncScheduler, DEFAULT_MIN_INTERVAL, DEFAULT_MAX_INTERVAL
+from accounts import SyncCoordinator, expand_accounts, plan_shards
+from headless import parse_args, report_startup, wait_for_signal
+from priority import order_items, order_albums, DEFAULT_SYNC_ORDER
+import metrics
 
 # Configuration
 CONFIG_FILE = "sync_config.json"
@@ -20,13 +37,49 @@ DEFAULT_CONFIG = {
     "local_folder": os.path.join(os.path.expanduser("~"), "GeminiPhotos"),
     "selected_albums": [], 
     "auto_sync": False,
-    "api_key": "" # Google OAuth Access Token
+    "api_key": "", # Google OAuth Access Token
+    "download_workers": DEFAULT_WORKERS,
+    "max_connections_per_host": DEFAULT_PER_HOST,
+    "bandwidth_limit_kbps": 0, # 0 = unlimited
+    "bandwidth_schedule": [], # e.g. [{"start": "09:00", "end": "18:00", "limit_kbps": 2048}]
+    "daily_api_quota": DEFAULT_API_QUOTA, # Library API requests per day (0 = unlimited)
+    "daily_media_quota": DEFAULT_MEDIA_QUOTA, # Photo/video downloads per day (0 = unlimited)
+    "base_url_max_age": DEFAULT_BASE_URL_MAX_AGE, # seconds before a queued download's baseUrl is re-fetched
+    "min_sync_interval": DEFAULT_MIN_INTERVAL, # seconds between checks of an active album
+    "max_sync_interval": DEFAULT_MAX_INTERVAL, # seconds between checks of a quiet album
+    "album_cache_ttl": DEFAULT_ALBUM_TTL, # seconds before the album list is refreshed in the background
+    "sync_order": DEFAULT_SYNC_ORDER, # within an album: "listed" (API order), "newest" or "oldest" first
+    "pinned_albums": [], # selected albums synced before the rest, in this order
+    "progressive_sync": False, # fetch 2048px previews of every new photo first, then backfill the originals
+    "generate_thumbnails": True,
+    "thumbnail_workers": None, # processes; None = one per CPU
+    "detect_duplicates": True,
+    "duplicate_max_distance": DEFAULT_MAX_DISTANCE, # bits (of 64) two photos may differ by
+    "index_metadata": True,
+    "exif_workers": DEFAULT_EXIF_WORKERS,
+    "trace_file": "", # optional path; per-phase timing spans are appended here
+    "accounts": [], # e.g. [{"name": "mum", "api_key": "...", "local_folder": "...", "selected_albums": [...], "shards": 2}]
+    "account_workers": None # processes syncing accounts in parallel; None = one per CPU
 }
 
 # Global State
+config_store = ConfigStore(CONFIG_FILE, DEFAULT_CONFIG)
 config = DEFAULT_CONFIG.copy()
+config_changed = threading.Event()
 sync_thread_active = False
+api_client = None
+download_engine = None
+sync_state = None
+album_cache = None
+thumbnailer = None
+deduper = None
+metadata_index = None
+coordinator = None
+quota_ledger = None
+shared_budget = None # set in coordinator worker processes
+part_suffix = PART_SUFFIX # per album shard, so shards never write the same .part file
 stop_event = threading.Event()
+scheduler = SyncScheduler()
 
 # Thread Communication
 gui_queue = Queue()
@@ -35,22 +88,22 @@ gui_queue = Queue()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 def load_config():
-    global config
-    if os.path.exists(CONFIG_FILE):
-        try:
-            with open(CONFIG_FILE, 'r') as f:
-                loaded = json.load(f)
-                config.update(loaded)
-        except Exception as e:
-            logging.error(f"Failed to load config: {e}")
+    # Served from the in-memory cache unless the file changed on disk
+    config.update(config_store.get())
+    metrics.enable_tracing(config.get("trace_file") or None)
 
-def save_config():
+def save_config(changes):
+    """Writes only `changes` (locked read-modify-write), so keys another process just saved survive."""
+    config.update(changes)
     try:
-        with open(CONFIG_FILE, 'w') as f:
-            json.dump(config, f, indent=4)
+        config_store.update(changes)
     except Exception as e:
         logging.error(f"Failed to save config: {e}")
 
+def on_config_changed(new_config):
+    config_changed.set()
+    scheduler.wake()
+
 # --- REAL Google Photos API Logic ---
 def get_headers():
     token = config.get("api_key", "").strip()
@@ -61,6 +114,25 @@ def get_headers():
         "Content-Type": "application/json"
     }
 
+def get_api_client():
+    """Shared client for Library API calls: retries, backoff and the daily quota."""
+    global api_client
+    if api_client is None:
+        limit = config.get("daily_api_quota", DEFAULT_API_QUOTA)
+        api_client = ApiClient(quota=shared_budget.quota("api", limit) if shared_budget
+                               else DailyQuota("api", limit, get_quota_ledger()))
+    return api_client
+
+def get_quota_ledger():
+    """Persisted daily request counts for the local_folder, or None before one is set."""
+    global quota_ledger
+    folder = config.get("local_folder")
+    if not folder:
+        return None
+    if quota_ledger is None or quota_ledger.local_folder != folder:
+        quota_ledger = QuotaLedger(folder)
+    return quota_ledger
+
 def fetch_real_remote_albums():
     """
     Returns: (albums_list, error_message)
@@ -71,93 +143,249 @@ def fetch_real_remote_albums():
         
     try:
         logging.info("Fetching real albums from Google Photos API...")
-        response = requests.get('https://photoslibrary.googleapis.com/v1/albums?pageSize=50', headers=headers)
-        
-        # Handle Errors
-        if response.status_code != 200:
-            try:
-                err_data = response.json()
-                # Try to extract readable error
-                error_details = err_data.get('error', {}).get('message', response.text)
-                logging.error(f"API Error ({response.status_code}): {error_details}")
-                return [], f"Google API Error ({response.status_code}):\n{error_details}"
-            except:
-                return [], f"HTTP Error {response.status_code}"
-
-        data = response.json()
         albums = []
-        if 'albums' in data:
-            for a in data['albums']:
-                albums.append({
-                    "id": a['id'],
-                    "title": a['title'],
-                    "items_count": int(a.get('mediaItemsCount', 0))
-                })
+        for a in iter_albums(get_api_client(), headers):
+            albums.append({
+                "id": a['id'],
+                "title": a['title'],
+                "items_count": int(a.get('mediaItemsCount', 0))
+            })
         return albums, None
 
+    except PhotosApiError as e:
+        logging.error(f"API Error ({e.status_code}): {e.message}")
+        return [], str(e)
     except Exception as e:
         logging.error(f"Connection Error: {e}")
         return [], f"Connection Failed: {str(e)}"
 
-def download_file(url, folder_path, filename):
-    if not os.path.exists(folder_path):
-        os.makedirs(folder_path)
-    full_path = os.path.join(folder_path, filename)
-    if os.path.exists(full_path):
-        return 
-    try:
-        download_url = f"{url}=d" 
-        r = requests.get(download_url, stream=True)
-        if r.status_code == 200:
-            with open(full_path, 'wb') as f:
-                for chunk in r.iter_content(1024):
-                    f.write(chunk)
-            logging.info(f"Downloaded: {filename}")
-    except Exception as e:
-        logging.error(f"Failed to download {filename}: {e}")
-
-def sync_album_content(album_id, album_name, headers):
-    logging.info(f"Syncing Album: {album_name}")
+def get_download_engine():
+    """Shared engine so every album reuses the same pooled connections."""
+    global download_engine
+    if download_engine is None:
+        rate_fn = lambda: scheduled_rate(config)
+        media_quota = config.get("daily_media_quota", DEFAULT_MEDIA_QUOTA)
+        download_engine = DownloadEngine(
+            workers=config.get("download_workers", DEFAULT_WORKERS),
+            per_host=config.get("max_connections_per_host", DEFAULT_PER_HOST),
+            # Worker processes of a multi-account sync all draw on the coordinator's budget
+            limiter=shared_budget.token_bucket(rate_fn) if shared_budget else TokenBucket(rate_fn=rate_fn),
+            quota=shared_budget.quota("media", media_quota) if shared_budget
+                  else DailyQuota("media", media_quota, get_quota_ledger()),
+            # Library API calls (batchGet) count against the API quota, not the media one
+            urls=BaseUrlRefresher(get_api_client(), get_headers,
+                                  max_age=config.get("base_url_max_age", DEFAULT_BASE_URL_MAX_AGE)),
+            part_suffix=part_suffix,
+        )
+    return download_engine
+
+def get_album_cache():
+    """
+    Persisted album list for the current local_folder, indexed by id and
+    title. A new api_key (possibly another Google account) drops the list.
+    """
+    global album_cache
+    path = os.path.join(state_dir(config["local_folder"]), ALBUM_CACHE_FILE)
+    owner = token_fingerprint(config.get("api_key", "").strip())
+    if album_cache is None or album_cache.path != path:
+        album_cache = AlbumCache(path, fetch_real_remote_albums,
+                                 ttl=config.get("album_cache_ttl", DEFAULT_ALBUM_TTL), owner=owner)
+    else:
+        album_cache.set_owner(owner)
+    return album_cache
+
+def get_sync_state():
+    """Manifest for the current local_folder; reopened if the folder changes."""
+    global sync_state
+    folder = config["local_folder"]
+    if sync_state is None or sync_state.local_folder != folder:
+        if sync_state is not None:
+            sync_state.close()
+        sync_state = SyncState(folder)
+    return sync_state
+
+def get_thumbnailer():
+    """Thumbnail process pool for the current local_folder, or None if disabled."""
+    global thumbnailer
+    if not config.get("generate_thumbnails", True):
+        return None
+    folder = config["local_folder"]
+    if thumbnailer is None or thumbnailer.local_folder != folder:
+        if thumbnailer is not None:
+            thumbnailer.close()
+        thumbnailer = ThumbnailPipeline(folder, workers=config.get("thumbnail_workers"))
+    return thumbnailer
+
+def get_deduper():
+    """Near-duplicate index for the current local_folder, or None if disabled."""
+    global deduper
+    if not config.get("detect_duplicates", True):
+        return None
+    folder = config["local_folder"]
+    if deduper is None or deduper.local_folder != folder:
+        if deduper is not None:
+            deduper.close()
+        deduper = DuplicateIndex(folder, workers=config.get("thumbnail_workers"),
+                                 max_distance=config.get("duplicate_max_distance", DEFAULT_MAX_DISTANCE))
+        # Hash anything synced before detection was enabled; current hashes are skipped
+        for media_id, local_path in get_sync_state().downloaded():
+            deduper.submit(media_id, local_path)
+    return deduper
+
+def get_metadata_index():
+    """Searchable metadata (mediaMetadata + EXIF) for the current local_folder, or None if disabled."""
+    global metadata_index
+    if not config.get("index_metadata", True):
+        return None
+    folder = config["local_folder"]
+    if metadata_index is None or metadata_index.local_folder != folder:
+        if metadata_index is not None:
+            metadata_index.close()
+        metadata_index = MetadataIndex(folder, workers=config.get("exif_workers", DEFAULT_EXIF_WORKERS))
+    return metadata_index
+
+def sync_album_content(album_id, album_name, headers, preview=False):
+    """
+    Downloads an album's new and changed items, plus the originals of any
+    that only have a preview so far. With `preview`, new photos are fetched
+    as previews instead and everything else is left for a later full pass
+    (counted in the returned batch's `deferred`).
+    """
+    logging.info(f"Syncing Album: {album_name}{' (previews)' if preview else ''}")
     album_path = os.path.join(config["local_folder"], album_name)
-    payload = {"albumId": album_id, "pageSize": 50}
+    engine = get_download_engine()
+    state = get_sync_state()
+    blobs = BlobStore(config["local_folder"])
+    thumbnailer = get_thumbnailer()
+    deduper = get_deduper()
+    metadata = get_metadata_index()
+    batch = DownloadBatch(album_name)
+
+    def recorder(item, full_path, previous_path, variant):
+        def on_done(written):
+            # The blob is stored once; each album just links to it
+            blobs.link(item['id'], full_path)
+            if written and (variant == PREVIEW or previous_path is not None):
+                state.mark_preview(item['id'], variant == PREVIEW)
+                # A replaced blob is a new file; the other albums still link to the old one
+                for path in state.paths_for(item['id']):
+                    if path != full_path:
+                        blobs.link(item['id'], path)
+            if previous_path and previous_path != full_path and os.path.lexists(previous_path):
+                os.remove(previous_path)
+            state.record(item, album_id, full_path, os.path.getsize(full_path))
+            if thumbnailer:
+                thumbnailer.submit(full_path)
+            if deduper:
+                deduper.submit(item['id'], full_path)
+            if metadata:
+                metadata.record_remote(item, album_name, full_path)
+                metadata.submit(full_path)
+        return on_done
+
     try:
-        resp = requests.post('https://photoslibrary.googleapis.com/v1/mediaItems:search', headers=headers, json=payload)
-        if resp.status_code != 200:
-             logging.error(f"Error syncing album {album_name}: {resp.text}")
-             return
-
-        data = resp.json()
-        if 'mediaItems' in data:
-            for item in data['mediaItems']:
-                filename = item['filename']
-                base_url = item['baseUrl']
-                download_file(base_url, album_path, filename)
+        # Items are queued as each page arrives; the engine applies backpressure
+        # so listing never runs far ahead of the downloads. Items already in the
+        # manifest are filtered out one page at a time.
+        items = iter_media_items(get_api_client(), album_id, headers)
+        refetch = () if preview else state.preview_ids(album_id)
+        pending = order_items(state.pending_items(album_id, items, refetch), config.get("sync_order"))
+        with metrics.span("list_and_queue", album=album_name):
+            for item, previous_path in pending:
+                if stop_event.is_set():
+                    break
+                if engine.client.quota.exhausted:
+                    logging.warning("Daily download quota reached; resuming in a later cycle.")
+                    break
+                if preview and (previous_path is not None or not item.get('mimeType', '').startswith('image/')):
+                    # Videos have no preview, and a changed item already has a file
+                    batch.deferred += 1
+                    continue
+                variant = PREVIEW if preview else ORIGINAL
+                full_path = state.claim_path(item['id'], album_path, item['filename'])
+                if previous_path is None and os.path.exists(full_path):
+                    # Downloaded before the blob store existed
+                    blobs.adopt(item['id'], full_path)
+                # Items already fetched for another album are skipped by the engine
+                engine.submit(batch, item['baseUrl'], blobs.path_for(item['id']),
+                              overwrite=previous_path is not None,
+                              on_done=recorder(item, full_path, previous_path, variant), item=item,
+                              variant=variant, name=os.path.relpath(full_path, config["local_folder"]))
+    except PhotosApiError as e:
+        batch.error = e.message
+        logging.error(f"Error syncing album {album_name}: {e.message}")
     except Exception as e:
+        batch.error = str(e)
         logging.error(f"Error syncing album content: {e}")
+    finally:
+        with metrics.span("drain_downloads", album=album_name):
+            batch.wait()
+        state.clear_claims()
+        logging.info(batch.summary())
+    return batch
 
 # --- Background Sync Logic ---
+# Config keys that change what is synced or when; other edits (e.g. token pushes) keep the backoff
+SCHEDULE_KEYS = ("local_folder", "auto_sync", "selected_albums", "pinned_albums",
+                 "min_sync_interval", "max_sync_interval", "accounts")
+
 def sync_worker():
     global sync_thread_active
     sync_thread_active = True
+    schedule = None
+    config_changed.set()
+    config_store.subscribe(on_config_changed)
+    # Snapshots land in <local_folder>/.gemini_sync/metrics for the local host's /metrics
+    metrics.start_dumping("cloud_sync", lambda: config.get("local_folder"))
     while not stop_event.is_set():
-        # Reload config every iteration to check for updates from Web App
-        load_config()
-        
-        if config["auto_sync"] and config["local_folder"] and config["api_key"]:
-            selected_names = config.get("selected_albums", [])
-            if selected_names:
-                logging.info(f"Auto-Sync Active. Albums to sync: {selected_names}")
-                headers = get_headers()
-                if headers:
-                    albums, err = fetch_real_remote_albums()
-                    if not err:
-                        for name in selected_names:
-                            album = next((a for a in albums if a['title'] == name), None)
-                            if album:
-                                sync_album_content(album['id'], album['title'], headers)
-            else:
-                logging.info("Auto-sync is on, but no albums selected in config.")
-        time.sleep(60) 
+        # Config edits from the Web App / local host arrive via the store subscription
+        if config_changed.is_set():
+            config_changed.clear()
+            load_config()
+            current = {key: config.get(key) for key in SCHEDULE_KEYS}
+            if current != schedule:
+                schedule = current
+                scheduler.min_interval = config.get("min_sync_interval", DEFAULT_MIN_INTERVAL)
+                scheduler.max_interval = max(scheduler.min_interval,
+                                             config.get("max_sync_interval", DEFAULT_MAX_INTERVAL))
+                if config.get("accounts"):
+                    try:
+                        get_coordinator().set_shards(plan_account_shards())
+                    except ValueError as e:
+                        logging.error(f"Not syncing accounts: {e}")
+                        get_coordinator().set_shards({})
+                else:
+                    scheduler.set_albums(config.get("selected_albums", []))
+                scheduler.reset()
+
+        if config.get("accounts"):
+            # Each account (or album shard) syncs in a worker process; see sync_shard
+            if config["auto_sync"]:
+                get_coordinator().dispatch()
+            scheduler.wait(get_coordinator().seconds_until_due() if config["auto_sync"] else None)
+            continue
+
+        active = config["auto_sync"] and config["local_folder"] and config["api_key"]
+        due = scheduler.due() if active else []
+        if due:
+            logging.info(f"Auto-Sync Active. Albums due: {due}")
+            headers = get_headers()
+            cache = get_album_cache()
+            with metrics.span("list_albums"):
+                albums, err = cache.albums()
+                # A selected title missing from the cache may be a new album; refresh once
+                if not err and any(cache.find(name) is None for name in due) and cache.age > scheduler.min_interval:
+                    albums, err = cache.refresh()
+            results = {} if err else sync_listed_albums([cache.find(name) for name in due], headers)
+            # Albums that could not be listed are retried at the quiet-album pace instead of hammering the API
+            for name in due:
+                album = cache.find(name)
+                scheduler.record(name, changed=album is not None and results.get(album['id'], (0,))[0] > 0)
+        elif active and not config.get("selected_albums"):
+            logging.info("Auto-sync is on, but no albums selected in config.")
+
+        # Sleep until the next album is due; config changes wake us early
+        scheduler.wait(scheduler.seconds_until_due() if active else None)
     sync_thread_active = False
 
 def start_sync_thread():
@@ -165,9 +393,147 @@ def start_sync_thread():
         stop_event.clear()
         t = threading.Thread(target=sync_worker, daemon=True)
         t.start()
+        return t
+
+def sync_albums(names):
+    """
+    One pass over the albums titled `names`, regardless of auto_sync and the
+    schedule. Returns (items queued, True if every album was listed and fully downloaded).
+    """
+    headers = get_headers()
+    if not headers:
+        logging.error("No API Token in the config; nothing to sync.")
+        return 0, False
+    if not names:
+        logging.info("No albums selected in config.")
+        return 0, True
+    cache = get_album_cache()
+    with metrics.span("list_albums"):
+        albums, err = cache.albums()
+        if not err and any(cache.find(name) is None for name in names):
+            albums, err = cache.refresh()
+    if err:
+        logging.error(f"Could not list albums: {err}")
+        return 0, False
+    missing = [name for name in names if cache.find(name) is None]
+    for name in missing:
+        logging.warning(f"Selected album not found: {name}")
+    results = sync_listed_albums([cache.find(name) for name in names], headers)
+    queued = sum(result[0] for result in results.values())
+    ok = not missing and all(result[1] for result in results.values())
+    return queued, ok
+
+def sync_listed_albums(albums, headers):
+    """
+    Syncs listed albums (None entries are skipped), pinned albums first.
+    With progressive_sync every album first gets previews of its new photos,
+    then a second pass fetches the originals and videos behind them.
+    Returns {album id: (items queued, True if listed and fully downloaded)}.
+    """
+    albums = order_albums([album for album in albums if album], config.get("pinned_albums"),
+                          title=lambda album: album['title'])
+    progressive = config.get("progressive_sync", False)
+    results, deferred = {}, {}
+    for album in albums:
+        if stop_event.is_set():
+            break
+        with metrics.span("sync_album", album=album['title']):
+            batch = sync_album_content(album['id'], album['title'], headers, preview=progressive)
+        results[album['id']] = (batch.submitted, batch.error is None and not batch.failed)
+        deferred[album['id']] = batch.deferred
+    if not progressive:
+        return results
+    state = get_sync_state()
+    for album in albums:
+        if stop_event.is_set() or album['id'] not in results:
+            break
+        if not deferred[album['id']] and not state.preview_ids(album['id']):
+            continue
+        with metrics.span("backfill_originals", album=album['title']):
+            batch = sync_album_content(album['id'], album['title'], headers)
+        queued, ok = results[album['id']]
+        results[album['id']] = (queued + batch.submitted, ok and batch.error is None and not batch.failed)
+    return results
+
+def sync_once():
+    """One pass over every selected album of every account. Returns True if nothing failed."""
+    if config.get("accounts"):
+        try:
+            shards = plan_account_shards()
+        except ValueError as e:
+            logging.error(f"Not syncing accounts: {e}")
+            return False
+        coordinator = get_coordinator()
+        coordinator.set_shards(shards)
+        return coordinator.run_once()
+    return sync_albums(config.get("selected_albums", []))[1]
+
+# --- Multi-account sync ---
+def get_coordinator():
+    """Worker-process pool for the `accounts` list; every worker shares one bandwidth and quota budget."""
+    global coordinator
+    if coordinator is None:
+        coordinator = SyncCoordinator(sync_shard, init_shard_worker, scheduler,
+                                      workers=config.get("account_workers"),
+                                      ledger_folder=config.get("local_folder"))
+    return coordinator
+
+def plan_account_shards():
+    accounts = expand_accounts(config)
+    # Split the CPUs between the workers' thumbnail and hashing pools instead of each taking all of them
+    per_worker = max(1, (os.cpu_count() or 1) // get_coordinator().workers)
+    for account in accounts:
+        account["thumbnail_workers"] = account.get("thumbnail_workers") or per_worker
+    return plan_shards(accounts)
+
+def init_shard_worker(budget):
+    """Runs once in each coordinator worker process."""
+    global shared_budget, stop_event
+    shared_budget = budget
+    stop_event = budget.stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C is the coordinator's to handle
+
+def sync_shard(account, shard, names):
+    """
+    Worker-process side of a multi-account sync: one pass over `names` for
+    one account. Returns (items queued, ok) like sync_albums.
+    """
+    global part_suffix, api_client, album_cache
+    config.update(account)
+    part_suffix = PART_SUFFIX if shard is None else f".s{shard}{PART_SUFFIX}"
+    # The previous shard in this process may have been another account's
+    api_client = album_cache = None
+    logging.info(f"[{account['name']}] syncing {len(names)} album(s) in process {os.getpid()}")
+    # A worker runs shards of any account in turn: start each from zero and dump it under its own name
+    metrics.reset()
+    process = "cloud_sync-" + "".join(c if c.isalnum() else "_" for c in account['name'])
+    if shard is not None:
+        process += f"-s{shard}"
+    try:
+        return sync_albums(names)
+    finally:
+        shutdown(wait=True)
+        metrics.dump(config["local_folder"], process)
+
+def shutdown(wait=False):
+    """
+    Closes the engines, so the next sync reopens them for the current
+    config; with `wait`, queued thumbnails, hashes and EXIF reads finish first.
+    """
+    global download_engine, thumbnailer, deduper, metadata_index, sync_state
+    if download_engine is not None:
+        download_engine.close()
+    for pipeline in (thumbnailer, deduper, metadata_index):
+        if pipeline is not None:
+            pipeline.close(wait=wait)
+    if sync_state is not None:
+        sync_state.close()
+    download_engine = thumbnailer = deduper = metadata_index = sync_state = None
 
 # --- GUI Settings Window (Runs on Main Thread) ---
 def show_settings_gui():
+    import tkinter as tk
+    from tkinter import filedialog, messagebox, ttk
     try:
         root = tk.Tk()
         root.title("Gemini Sync Configuration")
@@ -188,11 +554,12 @@ def show_settings_gui():
             if folder_selected:
                 folder_var.set(folder_selected)
 
-        def fetch_albums_ui():
+        def fetch_albums_ui(force=True):
             # Update global config immediately so get_headers uses new token
             config["api_key"] = token_var.get().strip()
             
-            albums, error = fetch_real_remote_albums()
+            # Cached list on first open; the Fetch button forces a refresh
+            albums, error = get_album_cache().albums(force=force)
             
             # Clear existing list
             for widget in list_frame_ref[0].winfo_children():
@@ -218,12 +585,16 @@ def show_settings_gui():
             for aid, data in album_vars.items():
                 if data["var"].get():
                     new_selection.append(data["title"])
-            config["local_folder"] = folder_var.get()
-            config["auto_sync"] = auto_sync_var.get()
-            config["selected_albums"] = new_selection
-            config["api_key"] = token_var.get().strip()
-            save_config()
+            save_config({
+                "local_folder": folder_var.get(),
+                "auto_sync": auto_sync_var.get(),
+                "selected_albums": new_selection,
+                "api_key": token_var.get().strip(),
+            })
             messagebox.showinfo("Saved", f"Configuration updated.\nSelected {len(new_selection)} albums.")
+            # "Sync Now" even if nothing in SCHEDULE_KEYS changed and the thread is already running
+            scheduler.reset()
+            scheduler.wake()
             start_sync_thread()
             root.destroy()
 
@@ -260,7 +631,7 @@ def show_settings_gui():
         
         # Initial Load
         if config.get("api_key"):
-            root.after(500, fetch_albums_ui)
+            root.after(500, lambda: fetch_albums_ui(force=False))
         
         ttk.Checkbutton(frame, text="Enable Background Auto-Sync", variable=auto_sync_var).pack(anchor=tk.W, pady=10)
         ttk.Button(frame, text="Save & Sync Now", command=save_settings).pack(fill=tk.X, pady=5)
@@ -285,6 +656,9 @@ def quit_app(icon, item):
     icon.stop()
 
 def run_tray():
+    from pystray import Icon, MenuItem as item, Menu
+    from PIL import Image, ImageDraw
+
     image = Image.new('RGB', (64, 64), color=(33, 150, 243)) 
     d = ImageDraw.Draw(image)
     d.ellipse([16, 16, 48, 48], fill=(255, 255, 255))
@@ -302,8 +676,29 @@ def run_tray():
 
 # --- Main Entry Point ---
 def main():
+    args = parse_args("Downloads the selected Google Photos albums into the local folder.")
     load_config()
-    start_sync_thread()
+    if args.once:
+        report_startup("Cloud sync", STARTED)
+        ok = sync_once()
+        shutdown(wait=True)
+        if coordinator is not None:
+            coordinator.close()
+        metrics.dump(config["local_folder"], "cloud_sync")
+        sys.exit(0 if ok else 1)
+
+    sync_thread = start_sync_thread()
+    report_startup("Cloud sync", STARTED)
+    if args.daemon:
+        wait_for_signal()
+        # Stops queueing; downloads already in flight finish and are recorded
+        stop_event.set()
+        scheduler.wake()
+        sync_thread.join()
+        shutdown()
+        if coordinator is not None:
+            coordinator.close()
+        return
 
     # Run Tray in a separate thread so Main Thread is free for Tkinter
     tray_thread = threading.Thread(target=run_tray)
@@ -324,7 +719,10 @@ def main():
                 break
     finally:
         stop_event.set()
+        scheduler.wake()
         logging.info("Shutting down...")
+        if coordinator is not None:
+            coordinator.close(wait=False)
         os._exit(0)
 
 if __name__ == "__main__":
@@ -4,6 +4,11 @@ import threading
 import webbrowser
 import logging
 import json
+import hmac
+import mimetypes
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+from urllib.parse import urlsplit, parse_qs
 from http.server import SimpleHTTPRequestHandler, HTTPServer
 from socketserver import ThreadingMixIn
 
@@ -11,6 +16,17 @@ from socketserver import ThreadingMixIn
 from pystray import Icon, MenuItem as item, Menu
 from PIL import Image
 
+# Local modules
+from config_store import ConfigStore
+from static_files import StaticManifest, send_file
+from photo_library import PhotoLibrary, photo_id_for, DEFAULT_PAGE_SIZE, DEFAULT_REFRESH_INTERVAL
+from thumbnails import ThumbnailPipeline, THUMB_SIZES
+from vector_index import VectorIndex, DEFAULT_DIM, DEFAULT_K
+from metadata_index import MetadataIndex, DEFAULT_EXIF_WORKERS, DEFAULT_SEARCH_LIMIT
+from upload_receiver import UploadReceiver, MAX_REQUEST_BYTES
+from uploader import BATCH_PATH, SESSIONS_PATH
+import metrics
+
 # Configuration
 PORT = 3000
 APP_NAME = "Gemini Photo Sync (Local)"
@@ -18,22 +34,53 @@ ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
 BUILD_DIR = os.path.join(ROOT_DIR, 'dist')
 ICON_PATH = os.path.join(ROOT_DIR, 'public', 'favicon.ico')
 CONFIG_FILE = os.path.join(ROOT_DIR, "sync_config.json")
+MEDIA_CACHE_CONTROL = "private, no-cache"
+THUMB_CACHE_CONTROL = "private, max-age=86400"
 
 # Setup Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Global Config State
+config_store = ConfigStore(CONFIG_FILE)
 sync_config = {}
+static_manifest = None
+photo_library = None
+thumbnailer = None
+vector_index = None
+metadata_index = None
+upload_receiver = None
+library_lock = threading.Lock()
+library_generation = 0         # bumped each time open_library swaps the objects above
+library_users = Counter()      # generation -> requests still using its objects
+library_released = threading.Condition(library_lock)
+
+# What one request uses of the library; see using_library
+LibrarySnapshot = namedtuple('LibrarySnapshot', 'photos thumbs vectors metadata uploads')
 
 def load_config():
     global sync_config
-    if os.path.exists(CONFIG_FILE):
-        try:
-            with open(CONFIG_FILE, 'r') as f:
-                sync_config = json.load(f)
-                logging.info(f"Loaded config: {sync_config.get('local_folder', 'No folder set')}")
-        except Exception as e:
-            logging.error(f"Failed to load config: {e}")
+    sync_config = config_store.get()
+    logging.info(f"Loaded config: {sync_config.get('local_folder') or 'No folder set'}")
+
+@contextmanager
+def using_library():
+    """
+    The per-folder objects as of now, for the length of one request.
+    open_library closes objects it replaced only after every request that
+    took them has left this block.
+    """
+    with library_lock:
+        generation = library_generation
+        library_users[generation] += 1
+        snapshot = LibrarySnapshot(photo_library, thumbnailer, vector_index, metadata_index, upload_receiver)
+    try:
+        yield snapshot
+    finally:
+        with library_lock:
+            library_users[generation] -= 1
+            if not library_users[generation]:
+                del library_users[generation]
+                library_released.notify_all()
 
 class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
     """Handle requests in a separate thread."""
@@ -56,20 +103,131 @@ class ReactHandler(SimpleHTTPRequestHandler):
             self.send_header('Access-Control-Allow-Origin', '*')
             self.end_headers()
             
-            # Reload from disk to ensure freshness
-            if os.path.exists(CONFIG_FILE):
-                with open(CONFIG_FILE, 'r') as f:
-                    content = f.read()
-                    self.wfile.write(content.encode('utf-8'))
+            # Cached in memory; only re-read when the file changes on disk
+            self.wfile.write(config_store.get_bytes())
+            return
+
+        # Prometheus scrape: this process plus the snapshots the sync clients dump
+        if self.path == '/metrics':
+            body = metrics.collect(sync_config.get("local_folder"), process="local_host").encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        if self.route_library(head=False):
+            return
+        if self.path.startswith(SESSIONS_PATH + '/'):
+            self.route_uploads()
+            return
+        self.send_static(head=False)
+
+    def do_HEAD(self):
+        if self.route_library(head=True):
+            return
+        self.send_static(head=True)
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def route_library(self, head):
+        """Serves /api/photos, /api/photos/search, /media/<id> and /thumb/<id>; returns False for other paths."""
+        url = urlsplit(self.path)
+        if not (url.path in ('/api/photos', '/api/photos/search', '/api/vectors')
+                or url.path.startswith(('/media/', '/thumb/'))):
+            return False
+        with using_library() as lib:
+            if url.path == '/api/photos':
+                self.send_photo_page(lib, parse_qs(url.query))
+            elif url.path == '/api/photos/search':
+                self.send_photo_search(lib, parse_qs(url.query))
+            elif url.path.startswith('/media/'):
+                self.send_media(lib, url.path[len('/media/'):], head)
+            elif url.path.startswith('/thumb/'):
+                self.send_thumbnail(lib, url.path[len('/thumb/'):], parse_qs(url.query), head)
+            elif lib.vectors is None:
+                self.send_json(503, {"error": "No local folder configured"})
             else:
-                self.wfile.write(json.dumps({}).encode('utf-8'))
+                self.send_json(200, {"count": len(lib.vectors), "dim": lib.vectors.dim})
+        return True
+
+    def send_photo_page(self, lib, query):
+        library = lib.photos
+        if library is None:
+            self.send_json(503, {"error": "No local folder configured"})
             return
+        try:
+            rows, next_cursor = library.page(query.get('cursor', [None])[0],
+                                             query.get('limit', [DEFAULT_PAGE_SIZE])[0])
+        except ValueError:
+            self.send_json(400, {"error": "Invalid cursor or limit"})
+            return
+        self.send_json(200, {"photos": [library.describe(r) for r in rows], "next_cursor": next_cursor})
 
-        # Handle SPA routing: if file doesn't exist, serve index.html
-        path = self.translate_path(self.path)
-        if not os.path.exists(path) or os.path.isdir(path):
-            self.path = '/index.html'
-        super().do_GET()
+    def send_photo_search(self, lib, query):
+        """?q=text&from=2023-01-01&to=2023-12-31&camera=Pixel 7&album=Trips&limit=100&offset=0"""
+        library, metadata = lib.photos, lib.metadata
+        if library is None or metadata is None:
+            self.send_json(503, {"error": "No local folder configured"})
+            return
+        arg = lambda name, default=None: query.get(name, [default])[0]
+        try:
+            matches = metadata.search(text=arg('q'), start=arg('from'), end=arg('to'),
+                                      camera=arg('camera'), album=arg('album'),
+                                      limit=arg('limit', DEFAULT_SEARCH_LIMIT), offset=arg('offset', 0))
+        except ValueError:
+            self.send_json(400, {"error": "Invalid limit or offset"})
+            return
+        photos = []
+        for m in matches:
+            if m['size'] is None:
+                continue  # remote metadata recorded, file not scanned yet
+            row = (photo_id_for(library.local_folder, m['path']), m['path'], m['size'], m['mtime_ns'])
+            photo = library.describe(row)
+            photo["metadata"] = {k: v for k, v in m.items()
+                                 if v is not None and k not in ('path', 'size', 'mtime_ns')}
+            photos.append(photo)
+        self.send_json(200, {"photos": photos})
+
+    def send_media(self, lib, photo_id, head):
+        row = lib.photos.get(photo_id) if lib.photos else None
+        if row is None:
+            self.send_error(404)
+            return
+        path = row[1]
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        send_file(self, path, content_type, MEDIA_CACHE_CONTROL, head=head)
+
+    def send_thumbnail(self, lib, photo_id, query, head):
+        row = lib.photos.get(photo_id) if lib.photos else None
+        try:
+            size = int(query.get('size', [THUMB_SIZES[0]])[0])
+        except ValueError:
+            size = THUMB_SIZES[0]
+        thumb = lib.thumbs.lookup(row[1], size) if row and lib.thumbs else None
+        if thumb is None:
+            self.send_error(404)
+            return
+        # Thumbnails are named by content hash, so the name doubles as a strong ETag
+        etag = '"' + os.path.splitext(os.path.basename(thumb))[0] + '"'
+        send_file(self, thumb, 'image/jpeg', THUMB_CACHE_CONTROL, head=head, etag=etag)
+
+    def send_static(self, head):
+        # Resolved from the startup manifest; unknown paths fall back to index.html (SPA routing)
+        asset = static_manifest.resolve(self.path) if static_manifest else None
+        if asset is None:
+            self.send_error(404)
+            return
+        static_manifest.send(self, asset, head=head)
 
     def do_POST(self):
         # API: Update Config
@@ -79,21 +237,11 @@ class ReactHandler(SimpleHTTPRequestHandler):
             try:
                 new_data = json.loads(post_data.decode('utf-8'))
                 
-                # Load existing to preserve other keys like local_folder
-                current_config = {}
-                if os.path.exists(CONFIG_FILE):
-                    with open(CONFIG_FILE, 'r') as f:
-                        current_config = json.load(f)
-                
-                # Update allowed fields
-                if 'selected_albums' in new_data:
-                    current_config['selected_albums'] = new_data['selected_albums']
-                if 'api_key' in new_data:
-                    current_config['api_key'] = new_data['api_key']
+                # Update allowed fields; other keys like local_folder are preserved
+                changes = {key: new_data[key] for key in ('selected_albums', 'api_key') if key in new_data}
                 
-                # Save back to file
-                with open(CONFIG_FILE, 'w') as f:
-                    json.dump(current_config, f, indent=4)
+                # Locked read-modify-write, atomic on disk
+                current_config = config_store.update(changes)
 
                 self.send_response(200)
                 self.send_header('Content-type', 'application/json')
@@ -106,21 +254,160 @@ class ReactHandler(SimpleHTTPRequestHandler):
                 self.send_response(500)
                 self.end_headers()
             return
-            
+
+        if self.path in ('/api/search', '/api/vectors', '/api/vectors/delete'):
+            self.route_vectors()
+            return
+        if self.path in (BATCH_PATH, SESSIONS_PATH):
+            self.route_uploads()
+            return
+        self.send_error(404)
+
+    def do_PUT(self):
+        if self.path.startswith(SESSIONS_PATH + '/'):
+            self.route_uploads()
+            return
+        self.send_error(404)
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length).decode('utf-8'))
+
+    def route_vectors(self):
+        """
+        POST /api/vectors         {"items": [{"id", "vector"}]}      add or replace embeddings
+        POST /api/vectors/delete  {"ids": [...]}                      remove embeddings
+        POST /api/search          {"vector" | "vectors", "k", "min_score"}
+        """
+        with using_library() as lib:
+            self.send_vectors(lib.vectors)
+
+    def send_vectors(self, index):
+        if index is None:
+            self.send_json(503, {"error": "No local folder configured"})
+            return
+        try:
+            body = self.read_json()
+            if self.path == '/api/vectors':
+                items = body.get('items', [])
+                if items:
+                    index.add([str(i['id']) for i in items], [i['vector'] for i in items])
+                self.send_json(200, {"status": "success", "count": len(index)})
+            elif self.path == '/api/vectors/delete':
+                removed = index.delete([str(i) for i in body.get('ids', [])])
+                self.send_json(200, {"status": "success", "removed": removed, "count": len(index)})
+            else:
+                batched = 'vectors' in body
+                queries = body['vectors'] if batched else [body['vector']]
+                results = [[{"id": item_id, "score": score} for item_id, score in hits]
+                           for hits in index.search(queries, body.get('k', DEFAULT_K), body.get('min_score'))]
+                self.send_json(200, {"results": results if batched else results[0]})
+        except (KeyError, TypeError, ValueError) as e:
+            self.send_json(400, {"error": f"Invalid request: {e}"})
+
+    def route_uploads(self):
+        """
+        Receives run_app.py uploads (see uploader.py) into the local folder:
+        POST /api/uploads/batch           multipart: a JSON "manifest" part plus one part per file
+        POST /api/uploads/sessions        {"path", "size", "sha1", ...} -> {"upload_id", "offset"}
+        GET  /api/uploads/sessions/<id>   -> {"offset", "status"}
+        PUT  /api/uploads/sessions/<id>   one chunk, with Content-Range: bytes start-end/total
+        Every request must carry "Authorization: Bearer <api_key>". Browsers
+        cannot send that header cross-origin without a preflight, which
+        do_OPTIONS does not allow, so other web pages cannot write files here.
+        """
+        token = (sync_config.get("api_key") or "").strip()
+        sent = self.headers.get('Authorization') or ''
+        if not token or not hmac.compare_digest(sent.encode(), f"Bearer {token}".encode()):
+            self.close_connection = True  # the body, if any, is left unread
+            self.send_json(401, {"error": "missing or wrong upload token"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if not 0 <= length <= MAX_REQUEST_BYTES:
+            self.close_connection = True
+            self.send_json(413 if length > 0 else 400, {"error": f"Content-Length must be 0 to {MAX_REQUEST_BYTES}"})
+            return
+        body = b'' if self.command == 'GET' else self.rfile.read(length)
+        with using_library() as lib:
+            self.send_upload_result(lib.uploads, body)
+
+    def send_upload_result(self, receiver, body):
+        if receiver is None:
+            self.send_json(503, {"error": "No local folder configured"})
+            return
+        try:
+            if self.path == BATCH_PATH:
+                results = receiver.receive_batch(self.headers.get('Content-Type', ''), body)
+                self.send_json(200, {"results": results})
+            elif self.path == SESSIONS_PATH:
+                self.send_json(200, receiver.create_session(json.loads(body.decode('utf-8'))))
+            elif self.command == 'GET':
+                state = receiver.session_state(self.path[len(SESSIONS_PATH) + 1:])
+                if state is None:
+                    self.send_json(404, {"error": "unknown session"})
+                else:
+                    self.send_json(200, state)
+            else:
+                status, payload = receiver.put_chunk(self.path[len(SESSIONS_PATH) + 1:],
+                                                     self.headers.get('Content-Range'), body)
+                self.send_json(status, payload)
+        except (KeyError, TypeError, ValueError, StopIteration) as e:
+            self.send_json(400, {"error": f"Invalid upload: {e}"})
+
     def do_OPTIONS(self):
         # Handle CORS preflight
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
+        self.send_header('Access-Control-Allow-Methods', 'GET, POST, PUT, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
         self.end_headers()
 
+def open_library():
+    """Opens the photo index for the configured local_folder, reopening it if the folder changed."""
+    global photo_library, thumbnailer, vector_index, metadata_index, upload_receiver, library_generation
+    folder = sync_config.get("local_folder")
+    with library_lock:
+        if photo_library is not None and photo_library.local_folder == folder:
+            return
+        old, generation = (photo_library, thumbnailer, vector_index, metadata_index), library_generation
+        photo_library = thumbnailer = vector_index = metadata_index = upload_receiver = None
+        library_generation += 1
+        if folder and os.path.isdir(folder):
+            photo_library = PhotoLibrary(folder)
+            thumbnailer = ThumbnailPipeline(folder, workers=1)
+            vector_index = VectorIndex(folder, dim=sync_config.get("vector_dim", DEFAULT_DIM))
+            metadata_index = MetadataIndex(folder, workers=sync_config.get("exif_workers", DEFAULT_EXIF_WORKERS))
+            upload_receiver = UploadReceiver(folder)
+            # After each rescan, read EXIF for files that are new or changed
+            index = metadata_index
+            photo_library.start_background_refresh(
+                sync_config.get("library_refresh_interval", DEFAULT_REFRESH_INTERVAL),
+                on_refresh=lambda library: index.sync_paths(library.entries()))
+        # New requests get the new objects; the old ones close once the requests using them finish
+        while library_users[generation]:
+            library_released.wait()
+    if old[0] is not None:
+        for closable in old:
+            closable.close()
+
+def on_config_changed(new_config):
+    global sync_config
+    sync_config = new_config
+    open_library()
+
 def start_server():
     """Starts the web server."""
+    global static_manifest
     if not os.path.exists(BUILD_DIR):
         logging.error(f"Build directory not found at {BUILD_DIR}")
         return
 
+    # Indexed once; restart the server after rebuilding the web app
+    static_manifest = StaticManifest(BUILD_DIR)
+
     server = ThreadingHTTPServer(('localhost', PORT), ReactHandler)
     logging.info(f"Serving React app locally at http://localhost:{PORT}")
     server.serve_forever()
@@ -129,7 +416,7 @@ def open_browser(icon, item):
     webbrowser.open(f'http://localhost:{PORT}')
 
 def open_sync_folder(icon, item):
-    # Reload config in case it changed
+    # Cheap: only re-parsed if the file changed
     load_config()
     folder = sync_config.get("local_folder")
     if folder and os.path.exists(folder):
@@ -143,8 +430,10 @@ def quit_app(icon, item):
     os._exit(0)
 
 def main():
-    # 0. Load Config
+    # 0. Load Config and the local photo index
     load_config()
+    open_library()
+    config_store.subscribe(on_config_changed)
 
     # 1. Start Web Server
     server_thread = threading.Thread(target=start_server, daemon=True)
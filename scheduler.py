@@ -0,0 +1,72 @@
+import threading
+import time
+
+DEFAULT_MIN_INTERVAL = 60     # seconds; albums with fresh changes are rechecked this often
+DEFAULT_MAX_INTERVAL = 3600   # seconds; quiet albums back off to this
+
+
+class SyncScheduler:
+    """
+    Per-album adaptive sync intervals. An album that produced new items is
+    rechecked after `min_interval`; each quiet check doubles its interval up
+    to `max_interval`. `wake()` interrupts `wait()` immediately, e.g. when
+    the config changes.
+    """
+    def __init__(self, min_interval=DEFAULT_MIN_INTERVAL, max_interval=DEFAULT_MAX_INTERVAL):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self._albums = {}  # title -> {"interval": seconds, "next_due": monotonic time}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+
+    def set_albums(self, titles):
+        """Tracks exactly `titles`; newly selected albums are due immediately."""
+        now = time.monotonic()
+        with self._lock:
+            for title in list(self._albums):
+                if title not in titles:
+                    del self._albums[title]
+            for title in titles:
+                self._albums.setdefault(title, {"interval": self.min_interval, "next_due": now})
+
+    def reset(self):
+        """Makes every album due now with its shortest interval."""
+        now = time.monotonic()
+        with self._lock:
+            for entry in self._albums.values():
+                entry["interval"] = self.min_interval
+                entry["next_due"] = now
+
+    def due(self):
+        now = time.monotonic()
+        with self._lock:
+            return [title for title, entry in self._albums.items() if entry["next_due"] <= now]
+
+    def record(self, title, changed):
+        """Reschedules `title` after a sync; `changed` is whether it had new or updated items."""
+        with self._lock:
+            entry = self._albums.get(title)
+            if entry is None:
+                return
+            if changed:
+                entry["interval"] = self.min_interval
+            else:
+                entry["interval"] = min(self.max_interval, entry["interval"] * 2)
+            entry["next_due"] = time.monotonic() + entry["interval"]
+
+    def seconds_until_due(self, exclude=()):
+        """Seconds until the next album not in `exclude` is due, or None if nothing is scheduled."""
+        with self._lock:
+            pending = [entry["next_due"] for title, entry in self._albums.items() if title not in exclude]
+        if not pending:
+            return None
+        return max(0.0, min(pending) - time.monotonic())
+
+    def wake(self):
+        self._wake.set()
+
+    def wait(self, timeout=None):
+        """Sleeps until `timeout` elapses or `wake()` is called; returns True if woken."""
+        woken = self._wake.wait(timeout)
+        self._wake.clear()
+        return woken
@@ -9,7 +9,8 @@ const SIMILARITY_THRESHOLD = 0.25;
  * Service managing Vector Database connections.
  * Supports:
  * 1. In-Memory (for pure browser demo)
- * 2. External (Qdrant/Milvus/Chroma via REST API)
+ * 2. Local Host (persistent NumPy index served by run_local_host.py)
+ * 3. External (Qdrant/Milvus/Chroma via REST API)
  */
 class VectorDatabase {
   private memoryIndex: Map<string, number[]> = new Map();
@@ -57,6 +58,17 @@ class VectorDatabase {
 
     if (config.vectorDB === VectorDBType.IN_MEMORY) {
        this.memoryIndex.set(photo.id, embedding);
+    } else if (config.vectorDB === VectorDBType.LOCAL_HOST) {
+       this.memoryIndex.set(photo.id, embedding);
+       try {
+         await fetch('/api/vectors', {
+           method: 'POST',
+           headers: { 'Content-Type': 'application/json' },
+           body: JSON.stringify({ items: [{ id: photo.id, vector: embedding }] })
+         });
+       } catch (e) {
+         console.warn('[VectorDB] Local host index unavailable, using memory index', e);
+       }
     } else {
        // --- EXTERNAL DB INTEGRATION ---
        // Here we would perform the specific REST call for the selected DB
@@ -85,6 +97,13 @@ class VectorDatabase {
 
     if (config.vectorDB === VectorDBType.IN_MEMORY) {
         return this.performMemorySearch(searchVector);
+    } else if (config.vectorDB === VectorDBType.LOCAL_HOST) {
+        try {
+          return await this.performLocalHostSearch(searchVector);
+        } catch (e) {
+          console.warn('[VectorDB] Local host search failed, using memory index', e);
+          return this.performMemorySearch(searchVector);
+        }
     } else {
         console.log(`[VectorDB] Searching external DB: ${config.vectorDB}`);
         // In real app: return await this.performExternalSearch(searchVector, config);
@@ -105,6 +124,17 @@ class VectorDatabase {
     return results.sort((a, b) => b.score - a.score).map(r => r.id);
   }
 
+  private async performLocalHostSearch(searchVector: number[]): Promise<string[]> {
+    const response = await fetch('/api/search', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ vector: searchVector, k: 200, min_score: SIMILARITY_THRESHOLD })
+    });
+    if (!response.ok) throw new Error(`HTTP ${response.status}`);
+    const data: { results: { id: string, score: number }[] } = await response.json();
+    return data.results.map(r => r.id);
+  }
+
   public learnUserPreference(textContext: string) {
     const experienceVector = this.generateEmbedding(textContext);
     this.userContextVector = this.userContextVector.map((val, i) => {
@@ -0,0 +1,254 @@
+import os
+import re
+import gzip
+import hashlib
+import logging
+import mimetypes
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import unquote, urlsplit
+
+# Vite emits content-hashed names like assets/index-4f2a9c1b.js; those never change.
+HASHED_ASSET = re.compile(r'[-.][A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$')
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+SENDFILE_THRESHOLD = 64 * 1024        # larger bodies go out via socket.sendfile
+INLINE_GZIP_MAX = 4 * 1024 * 1024     # compress text assets in memory up to this size
+COMPRESSIBLE = ('text/', 'application/javascript', 'application/json', 'image/svg+xml',
+                'application/manifest+json', 'application/wasm')
+VARIANT_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+
+def quote_etag(digest):
+    return f'"{digest}"'
+
+
+def etag_matches(header, etag):
+    """True if an If-None-Match header value matches `etag` (weak comparison)."""
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    tags = [t.strip() for t in header.split(',')]
+    return etag in tags or f"W/{etag}" in tags
+
+
+def accepted_encodings(header):
+    """Content codings the client accepts, ignoring those with q=0."""
+    accepted = set()
+    for part in (header or '').split(','):
+        name, _, params = part.strip().partition(';')
+        if params.replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        if name:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def write_file_body(handler, path, offset=0, length=None):
+    """Streams a file (or a slice of it) to the client, via sendfile for large bodies."""
+    with open(path, 'rb') as f:
+        if length is None:
+            length = os.fstat(f.fileno()).st_size - offset
+        if length >= SENDFILE_THRESHOLD:
+            handler.wfile.flush()
+            handler.connection.sendfile(f, offset, length)
+        else:
+            f.seek(offset)
+            handler.wfile.write(f.read(length))
+
+
+def parse_range(header, size):
+    """
+    Parses a single 'bytes=' range against a body of `size` bytes.
+    Returns (start, end) inclusive, None when absent or not a single range,
+    or False when the range cannot be satisfied.
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    spec = header[len('bytes='):].strip()
+    first, _, last = spec.partition('-')
+    try:
+        if not first:
+            suffix = int(last)
+            if suffix <= 0:
+                return False
+            return max(0, size - suffix), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+def not_modified_since(header, mtime):
+    try:
+        return int(mtime) <= parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
+def send_file(handler, path, content_type, cache_control, head=False, etag=None):
+    """
+    Serves a file from disk with conditional GET (If-None-Match /
+    If-Modified-Since) and single-range requests (Range / If-Range), so
+    media players can seek without downloading the whole file.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        handler.send_error(404)
+        return
+    size = st.st_size
+    etag = etag or quote_etag(f"{size:x}-{st.st_mtime_ns:x}")
+    last_modified = formatdate(st.st_mtime, usegmt=True)
+    headers = handler.headers
+
+    if_none_match = headers.get('If-None-Match')
+    if (etag_matches(if_none_match, etag) or
+            (not if_none_match and not_modified_since(headers.get('If-Modified-Since'), st.st_mtime))):
+        handler.send_response(304)
+        handler.send_header('ETag', etag)
+        handler.send_header('Cache-Control', cache_control)
+        handler.end_headers()
+        return
+
+    byte_range = parse_range(headers.get('Range'), size)
+    if_range = headers.get('If-Range')
+    if byte_range and if_range and if_range != etag and if_range != last_modified:
+        byte_range = None  # the client's copy is outdated: send it all
+    if byte_range is False:
+        handler.send_response(416)
+        handler.send_header('Content-Range', f'bytes */{size}')
+        handler.send_header('Content-Length', '0')
+        handler.end_headers()
+        return
+
+    if byte_range:
+        start, end = byte_range
+        handler.send_response(206)
+        handler.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+    else:
+        start, end = 0, size - 1
+        handler.send_response(200)
+    length = end - start + 1
+    handler.send_header('Content-Type', content_type)
+    handler.send_header('Accept-Ranges', 'bytes')
+    handler.send_header('Cache-Control', cache_control)
+    handler.send_header('ETag', etag)
+    handler.send_header('Last-Modified', last_modified)
+    handler.send_header('Content-Length', str(length))
+    handler.end_headers()
+    if not head and length > 0:
+        write_file_body(handler, path, start, length)
+
+
+class StaticAsset:
+    def __init__(self, path, url_path):
+        st = os.stat(path)
+        self.path = path
+        self.size = st.st_size
+        self.last_modified = formatdate(st.st_mtime, usegmt=True)
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        immutable = url_path.startswith('/assets/') and HASHED_ASSET.search(url_path)
+        self.cache_control = IMMUTABLE if immutable else REVALIDATE
+
+        small = self.size < SENDFILE_THRESHOLD
+        compressible = self.content_type.startswith(COMPRESSIBLE)
+        data = None
+        if small or (compressible and self.size <= INLINE_GZIP_MAX):
+            with open(path, 'rb') as f:
+                data = f.read()
+            self.etag = quote_etag(hashlib.sha1(data).hexdigest()[:20])
+        else:
+            self.etag = quote_etag(f"{st.st_size:x}-{st.st_mtime_ns:x}")
+        self.body = data if small else None
+
+        # Precompressed siblings from the build win; otherwise gzip text in memory once.
+        self.variants = {}  # coding -> (bytes or None, path or None, size)
+        for coding, suffix in VARIANT_SUFFIXES.items():
+            variant = path + suffix
+            if os.path.exists(variant):
+                vsize = os.path.getsize(variant)
+                vbody = None
+                if vsize < SENDFILE_THRESHOLD:
+                    with open(variant, 'rb') as f:
+                        vbody = f.read()
+                self.variants[coding] = (vbody, variant, vsize)
+        if 'gzip' not in self.variants and compressible and data is not None and self.size > 1024:
+            packed = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(packed) < self.size:
+                self.variants['gzip'] = (packed, None, len(packed))
+
+    def pick_variant(self, accept_encoding):
+        accepted = accepted_encodings(accept_encoding)
+        for coding in ('br', 'gzip'):
+            if coding in self.variants and coding in accepted:
+                return coding, self.variants[coding]
+        return None, None
+
+
+class StaticManifest:
+    """
+    In-memory index of the built web app, made once at startup so requests
+    never touch the filesystem to resolve a path or decide on the SPA fallback.
+    """
+    def __init__(self, root):
+        self.root = root
+        self.assets = {}
+        for folder, _, files in os.walk(root):
+            for name in files:
+                full = os.path.join(folder, name)
+                if name.endswith(('.br', '.gz')) and os.path.exists(full[:-3]):
+                    continue  # a variant of another file
+                url_path = '/' + os.path.relpath(full, root).replace(os.sep, '/')
+                try:
+                    self.assets[url_path] = StaticAsset(full, url_path)
+                except OSError as e:
+                    logging.warning(f"Skipping {full}: {e}")
+        self.index = self.assets.get('/index.html')
+        logging.info(f"Static manifest: {len(self.assets)} files from {root}")
+
+    def resolve(self, request_path):
+        """The asset for a request path, falling back to index.html for SPA routes."""
+        path = unquote(urlsplit(request_path).path)
+        if path.endswith('/'):
+            path += 'index.html'
+        return self.assets.get(path) or self.index
+
+    def send(self, handler, asset, head=False):
+        """Writes a full response for `asset`, honouring If-None-Match and Accept-Encoding."""
+        coding, variant = asset.pick_variant(handler.headers.get('Accept-Encoding'))
+        if coding:
+            body, path, size = variant
+            etag = asset.etag[:-1] + f'-{coding}"'
+        else:
+            body, path, size = asset.body, asset.path, asset.size
+            etag = asset.etag
+
+        if etag_matches(handler.headers.get('If-None-Match'), etag):
+            handler.send_response(304)
+            handler.send_header('ETag', etag)
+            handler.send_header('Cache-Control', asset.cache_control)
+            handler.end_headers()
+            return
+
+        handler.send_response(200)
+        handler.send_header('Content-Type', asset.content_type)
+        handler.send_header('Cache-Control', asset.cache_control)
+        handler.send_header('Last-Modified', asset.last_modified)
+        handler.send_header('ETag', etag)
+        if asset.variants:
+            handler.send_header('Vary', 'Accept-Encoding')
+        if coding:
+            handler.send_header('Content-Encoding', coding)
+        handler.send_header('Content-Length', str(size))
+        handler.end_headers()
+        if head:
+            return
+        if body is not None:
+            handler.wfile.write(body)
+        else:
+            write_file_body(handler, path)
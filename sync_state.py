@@ -0,0 +1,221 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import date
+
+import metrics
+
+# All local sync bookkeeping lives next to the photos it describes.
+STATE_DIR_NAME = ".gemini_sync"
+DB_NAME = "sync_state.db"
+DIFF_BATCH_SIZE = 100
+
+LISTED_ITEMS = metrics.counter("gemini_listed_items_total", "Media items seen while listing albums, by outcome (new, changed, refetch, unchanged).")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS media_items (
+    media_id      TEXT NOT NULL,
+    album_id      TEXT NOT NULL,
+    filename      TEXT NOT NULL,
+    size          INTEGER,
+    creation_time TEXT,
+    local_path    TEXT NOT NULL,
+    synced_at     REAL NOT NULL,
+    PRIMARY KEY (media_id, album_id)
+);
+CREATE INDEX IF NOT EXISTS idx_media_items_path ON media_items(local_path);
+-- Blobs that hold a downscaled preview (progressive sync) until the original replaces them
+CREATE TABLE IF NOT EXISTS preview_blobs (
+    media_id   TEXT PRIMARY KEY,
+    fetched_at REAL NOT NULL
+);
+"""
+
+
+def state_dir(local_folder):
+    path = os.path.join(local_folder, STATE_DIR_NAME)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def open_db(local_folder):
+    """Opens the shared state database; safe to use from several threads behind a lock."""
+    db = sqlite3.connect(os.path.join(state_dir(local_folder), DB_NAME),
+                         timeout=30, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    return db
+
+
+QUOTA_SCHEMA = """
+CREATE TABLE IF NOT EXISTS daily_quota (
+    name TEXT PRIMARY KEY,   -- "api" or "media"
+    day  TEXT NOT NULL,      -- UTC date of the count
+    used INTEGER NOT NULL
+);
+"""
+
+
+class QuotaLedger:
+    """
+    Per-day request counts behind photos_api.DailyQuota. Each request is
+    counted in the database, so processes sharing a folder share the count.
+    """
+    def __init__(self, local_folder):
+        self.local_folder = local_folder
+        self.db = open_db(local_folder)
+        self.db.executescript(QUOTA_SCHEMA)
+        self.lock = threading.Lock()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def load(self, name):
+        """(day, used) last recorded for `name`, or (None, 0)."""
+        with self.lock:
+            row = self.db.execute("SELECT day, used FROM daily_quota WHERE name = ?", (name,)).fetchone()
+        return (date.fromisoformat(row[0]), row[1]) if row else (None, 0)
+
+    def add(self, name, day):
+        """Counts one request on `day`; returns that day's total."""
+        with self.lock:
+            self.db.execute(
+                "INSERT INTO daily_quota (name, day, used) VALUES (?, ?, 1) ON CONFLICT(name) DO UPDATE SET "
+                "used = CASE WHEN day = excluded.day THEN used + 1 ELSE 1 END, day = excluded.day",
+                (name, day.isoformat()))
+            used = self.db.execute("SELECT used FROM daily_quota WHERE name = ?", (name,)).fetchone()[0]
+            self.db.commit()
+        return used
+
+
+def _creation_time(item):
+    return item.get('mediaMetadata', {}).get('creationTime')
+
+
+class SyncState:
+    """
+    Manifest of downloaded media items, keyed by (mediaItem id, album id).
+    Deciding what to download is one indexed query per listing page rather
+    than a stat() per file.
+    """
+    def __init__(self, local_folder):
+        self.local_folder = local_folder
+        self.db = open_db(local_folder)
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self._claimed = set()  # paths handed out but not yet recorded
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def pending_items(self, album_id, items, refetch=()):
+        """
+        Filters a stream of media items down to the ones that are new or
+        changed, plus any unchanged ones whose id is in `refetch`.
+        """
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= DIFF_BATCH_SIZE:
+                yield from self._diff(album_id, batch, refetch)
+                batch = []
+        if batch:
+            yield from self._diff(album_id, batch, refetch)
+
+    def _diff(self, album_id, batch, refetch):
+        ids = [item['id'] for item in batch]
+        marks = ",".join("?" * len(ids))
+        with self.lock:
+            rows = self.db.execute(
+                f"SELECT media_id, filename, creation_time, local_path FROM media_items "
+                f"WHERE album_id = ? AND media_id IN ({marks})",
+                [album_id, *ids],
+            ).fetchall()
+        known = {row[0]: row[1:] for row in rows}
+        for item in batch:
+            previous = known.get(item['id'])
+            if previous is None:
+                LISTED_ITEMS.inc(outcome="new")
+                yield item, None
+            elif previous[0] != item['filename'] or previous[1] != _creation_time(item):
+                LISTED_ITEMS.inc(outcome="changed")
+                yield item, previous[2]
+            elif item['id'] in refetch:
+                LISTED_ITEMS.inc(outcome="refetch")
+                yield item, previous[2]
+            else:
+                LISTED_ITEMS.inc(outcome="unchanged")
+
+    def claim_path(self, media_id, folder_path, filename):
+        """
+        Picks the local path for an item, disambiguating when another media
+        item already owns `filename` in the same folder.
+        """
+        path = os.path.join(folder_path, filename)
+        with self.lock:
+            owner = self.db.execute(
+                "SELECT media_id FROM media_items WHERE local_path = ? LIMIT 1", (path,)
+            ).fetchone()
+            if (owner and owner[0] != media_id) or path in self._claimed:
+                stem, ext = os.path.splitext(filename)
+                path = os.path.join(folder_path, f"{stem} ({media_id[-8:]}){ext}")
+            self._claimed.add(path)
+        return path
+
+    def record(self, item, album_id, local_path, size):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO media_items "
+                "(media_id, album_id, filename, size, creation_time, local_path, synced_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (item['id'], album_id, item['filename'], size, _creation_time(item),
+                 local_path, time.time()),
+            )
+            self.db.commit()
+            self._claimed.discard(local_path)
+
+    def clear_claims(self):
+        """Forgets paths claimed by downloads that never completed."""
+        with self.lock:
+            self._claimed.clear()
+
+    def mark_preview(self, media_id, preview=True):
+        """Records whether the stored blob of `media_id` is a preview or, once replaced, the original."""
+        with self.lock:
+            if preview:
+                self.db.execute("INSERT OR REPLACE INTO preview_blobs (media_id, fetched_at) VALUES (?, ?)",
+                                (media_id, time.time()))
+            else:
+                self.db.execute("DELETE FROM preview_blobs WHERE media_id = ?", (media_id,))
+            self.db.commit()
+
+    def preview_ids(self, album_id):
+        """Ids of the items in an album whose original has not been fetched yet."""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT m.media_id FROM media_items m JOIN preview_blobs p ON p.media_id = m.media_id "
+                "WHERE m.album_id = ?", (album_id,)).fetchall()
+        return {row[0] for row in rows}
+
+    def paths_for(self, media_id):
+        """Every local path (one per album) that links to the blob of `media_id`."""
+        with self.lock:
+            return [row[0] for row in self.db.execute(
+                "SELECT local_path FROM media_items WHERE media_id = ?", (media_id,))]
+
+    def downloaded(self):
+        """(media_id, local_path) once per media item, whichever album it was synced into."""
+        with self.lock:
+            return self.db.execute(
+                "SELECT media_id, MIN(local_path) FROM media_items GROUP BY media_id").fetchall()
+
+    def count(self, album_id=None):
+        with self.lock:
+            if album_id is None:
+                return self.db.execute("SELECT COUNT(*) FROM media_items").fetchone()[0]
+            return self.db.execute(
+                "SELECT COUNT(*) FROM media_items WHERE album_id = ?", (album_id,)
+            ).fetchone()[0]
@@ -0,0 +1,177 @@
+import os
+import hashlib
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from sync_state import open_db, state_dir
+
+THUMBS_DIR = "thumbs"
+THUMB_SIZES = (256, 512, 1600)  # longest edge in pixels: grid, large grid, lightbox
+JPEG_QUALITY = 82
+THUMBNAIL_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.gif', '.tif', '.tiff', '.heic')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS thumbnails (
+    path        TEXT PRIMARY KEY,
+    size        INTEGER NOT NULL,
+    mtime_ns    INTEGER NOT NULL,
+    content_key TEXT NOT NULL      -- '' when the source could not be decoded
+) WITHOUT ROWID;
+"""
+
+
+def file_digest(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def thumb_path(cache_root, key, size):
+    """Sharded location of one rendition: thumbs/ab/cd/<key>_<size>.jpg."""
+    return os.path.join(cache_root, key[:2], key[2:4], f"{key}_{size}.jpg")
+
+
+def render_thumbnails(path, cache_root, sizes):
+    """
+    Process-pool worker: renders every size of `path` into the cache and
+    returns its content key. Identical content (e.g. the same photo in two
+    albums) maps to the same key and is only rendered once.
+    """
+    key = file_digest(path)
+    targets = {size: thumb_path(cache_root, key, size) for size in sizes}
+    if all(os.path.exists(t) for t in targets.values()):
+        return key
+
+    from PIL import Image, ImageOps
+    with Image.open(path) as img:
+        # JPEG draft mode decodes at 1/2, 1/4 or 1/8 scale straight from the DCT
+        largest = max(sizes)
+        img.draft('RGB', (largest, largest))
+        img = ImageOps.exif_transpose(img).convert('RGB')
+        os.makedirs(os.path.dirname(targets[largest]), exist_ok=True)
+        # Largest first, each rendition shrinking the previous one
+        for size in sorted(sizes, reverse=True):
+            img.thumbnail((size, size), Image.BICUBIC, reducing_gap=2.0)
+            tmp = targets[size] + '.tmp'
+            img.save(tmp, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+            os.replace(tmp, targets[size])
+    return key
+
+
+class ThumbnailPipeline:
+    """
+    Generates multi-resolution thumbnails in a process pool after files land
+    locally. Tracks (path, size, mtime) -> content key in the sync-state
+    database so unchanged sources are skipped without being read.
+    """
+    def __init__(self, local_folder, workers=None, sizes=THUMB_SIZES):
+        self.local_folder = local_folder
+        self.sizes = tuple(sizes)
+        self.cache_root = os.path.join(state_dir(local_folder), THUMBS_DIR)
+        self.db = open_db(local_folder)
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        # Spawned, not forked: the sync clients run many threads by the time the pool starts
+        self._pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        self._in_flight = set()
+        self._drained = threading.Condition(self.lock)  # notified as each queued render's callback finishes
+
+    def _cached_key(self, path, st):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT size, mtime_ns, content_key FROM thumbnails WHERE path = ?", (path,)
+            ).fetchone()
+        if row and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            return row[2]
+        return None
+
+    def submit(self, path):
+        """Queues `path` unless its thumbnails are already current."""
+        if not path.lower().endswith(THUMBNAIL_EXTENSIONS):
+            return
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        key = self._cached_key(path, st)
+        if key == '' or (key and os.path.exists(thumb_path(self.cache_root, key, self.sizes[0]))):
+            return
+        with self.lock:
+            if path in self._in_flight:
+                return
+            self._in_flight.add(path)
+        try:
+            future = self._pool.submit(render_thumbnails, path, self.cache_root, self.sizes)
+        except RuntimeError:
+            with self.lock:
+                self._in_flight.discard(path)  # pool already shut down
+                self._drained.notify_all()
+            return
+        future.add_done_callback(lambda f: self._done(path, st, f))
+
+    def _done(self, path, st, future):
+        # Cancelled by close() or lost with a dead worker: not a verdict on the file, so nothing is recorded
+        key = None
+        if not future.cancelled():
+            try:
+                key = future.result()
+            except BrokenProcessPool as e:
+                logging.debug(f"Thumbnail for {path} not rendered: {e}")
+            except Exception as e:
+                logging.debug(f"No thumbnail for {path}: {e}")
+                key = ''
+        with self.lock:
+            self._in_flight.discard(path)
+            if key is not None:
+                self.db.execute("INSERT OR REPLACE INTO thumbnails VALUES (?, ?, ?, ?)",
+                                (path, st.st_size, st.st_mtime_ns, key))
+                self.db.commit()
+            self._drained.notify_all()
+
+    def render_now(self, path):
+        """Renders `path` synchronously in the calling thread; returns its content key or None."""
+        try:
+            st = os.stat(path)
+            key = render_thumbnails(path, self.cache_root, self.sizes)
+        except Exception as e:
+            logging.debug(f"No thumbnail for {path}: {e}")
+            return None
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO thumbnails VALUES (?, ?, ?, ?)",
+                            (path, st.st_size, st.st_mtime_ns, key))
+            self.db.commit()
+        return key
+
+    def lookup(self, path, size):
+        """
+        Path of the cached rendition closest to `size` (at least as large),
+        rendering it now if it is missing or the source changed; None if the
+        source cannot be decoded.
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        key = self._cached_key(path, st)
+        best = next((s for s in sorted(self.sizes) if s >= size), max(self.sizes))
+        if key is None or (key and not os.path.exists(thumb_path(self.cache_root, key, best))):
+            key = self.render_now(path)
+        return thumb_path(self.cache_root, key, best) if key else None
+
+    def close(self, wait=False):
+        """
+        Stops the pool; with `wait`, queued work is finished first (e.g. at
+        the end of a one-shot sync). Otherwise queued work is cancelled and
+        only renders already running are waited for, so their results are
+        recorded before the database closes.
+        """
+        self._pool.shutdown(wait=wait, cancel_futures=not wait)
+        with self.lock:
+            while self._in_flight:
+                self._drained.wait()
+            self.db.close()
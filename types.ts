@@ -49,6 +49,7 @@ export enum SearchMode {
 
 export enum VectorDBType {
   IN_MEMORY = 'In-Memory (Simple)',
+  LOCAL_HOST = 'Local Host (NumPy)',
   CHROMA = 'ChromaDB',
   QDRANT = 'Qdrant',
   MILVUS = 'Milvus'
@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+import email.parser
+import email.policy
+
+from sync_state import state_dir, STATE_DIR_NAME
+
+UPLOADS_DIR_NAME = "uploads"
+MAX_REQUEST_BYTES = 64 * 1024 * 1024   # a batch or chunk from uploader.py is at most 16 MB plus framing
+COMPLETE_SESSION_TTL = 60 * 60         # seconds a finished session still answers the client's status check
+ABANDONED_SESSION_TTL = 7 * 24 * 60 * 60  # seconds without a chunk before an unfinished session is dropped
+
+
+def parse_multipart(content_type, body):
+    """[(name, filename, bytes)] for each part of a multipart/form-data body."""
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body)
+    return [(part.get_param('name', header='content-disposition'), part.get_filename(),
+             part.get_payload(decode=True)) for part in message.iter_parts()]
+
+
+def _sha1_file(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class UploadReceiver:
+    """
+    Server side of run_app.py's upload pipeline (uploader.py) for the local
+    host. Files are written into local_folder at the path they were sent
+    with; one that is already there with the same SHA-1 is left alone, so a
+    run_app.py watching this same folder does not upload in a loop.
+    Resumable sessions live in .gemini_sync/uploads and survive restarts;
+    finished and abandoned ones are removed after a while (see expire).
+    """
+    def __init__(self, local_folder):
+        self.local_folder = os.path.abspath(local_folder)
+        self.sessions_dir = os.path.join(state_dir(local_folder), UPLOADS_DIR_NAME)
+        os.makedirs(self.sessions_dir, exist_ok=True)
+        self.lock = threading.Lock()
+
+    def target(self, rel):
+        """Absolute path for an uploaded file's relative path; ValueError if it leaves the folder."""
+        path = os.path.normpath(os.path.join(self.local_folder, rel))
+        inside = os.path.relpath(path, self.local_folder)
+        if inside.startswith(os.pardir) or os.path.isabs(inside) or inside.split(os.sep)[0] == STATE_DIR_NAME:
+            raise ValueError(f"invalid upload path: {rel}")
+        return path
+
+    def _place(self, tmp, meta):
+        """Moves a verified temp file to its target, or drops it if the target already has that content."""
+        path = self.target(meta["path"])
+        if os.path.exists(path) and os.path.getsize(path) == meta["size"] and _sha1_file(path) == meta["sha1"]:
+            os.remove(tmp)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp, path)
+
+    def receive_batch(self, content_type, body):
+        """Stores each file of a multi-file POST. Returns [{"path", "status"}] in manifest order."""
+        parts = parse_multipart(content_type, body)
+        manifest = json.loads(next(data for name, _, data in parts if name == 'manifest'))
+        blobs = [data for name, _, data in parts if name != 'manifest']
+        if len(blobs) != len(manifest):
+            raise ValueError(f"{len(manifest)} files in the manifest but {len(blobs)} sent")
+        results = []
+        for meta, data in zip(manifest, blobs):
+            self.target(meta["path"])
+            if len(data) != meta["size"] or hashlib.sha1(data).hexdigest() != meta["sha1"]:
+                results.append({"path": meta["path"], "status": "checksum_mismatch"})
+                continue
+            tmp = os.path.join(self.sessions_dir, uuid.uuid4().hex + ".part")
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            self._place(tmp, meta)
+            results.append({"path": meta["path"], "status": "ok"})
+        return results
+
+    def _session_paths(self, upload_id):
+        if not upload_id or not upload_id.isalnum():
+            return None
+        base = os.path.join(self.sessions_dir, upload_id)
+        return base + ".json", base + ".part"
+
+    def create_session(self, meta):
+        """Starts a resumable upload of `meta` ({"path", "size", "sha1", ...})."""
+        self.target(meta["path"])
+        self.expire()
+        upload_id = uuid.uuid4().hex
+        meta_path, part_path = self._session_paths(upload_id)
+        open(part_path, 'wb').close()
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump(dict(meta, status="active"), f)
+        return {"upload_id": upload_id, "offset": 0}
+
+    def session_state(self, upload_id):
+        """{"offset", "status"} of a session, or None if it is unknown (or already cleaned up)."""
+        paths = self._session_paths(upload_id)
+        if paths is None or not os.path.exists(paths[0]):
+            return None
+        with open(paths[0], encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta["status"] == "complete":
+            return {"offset": meta["size"], "status": "complete"}
+        return {"offset": os.path.getsize(paths[1]), "status": meta["status"]}
+
+    def expire(self, now=None):
+        """
+        Deletes finished sessions older than COMPLETE_SESSION_TTL and
+        unfinished ones idle for ABANDONED_SESSION_TTL. A client that comes
+        back later gets a 404 and opens a new session.
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            # Batch temp files have no .json; they only outlive a crash mid-request
+            for upload_id in {os.path.splitext(name)[0] for name in os.listdir(self.sessions_dir)}:
+                if not upload_id.isalnum():
+                    continue
+                meta_path, part_path = self._session_paths(upload_id)
+                try:
+                    complete = False
+                    if os.path.exists(meta_path):
+                        with open(meta_path, encoding='utf-8') as f:
+                            complete = json.load(f).get("status") == "complete"
+                    touched = os.path.getmtime(meta_path if complete else part_path)
+                except (OSError, ValueError):
+                    complete, touched = False, 0
+                if now - touched > (COMPLETE_SESSION_TTL if complete else ABANDONED_SESSION_TTL):
+                    for path in (part_path, meta_path):
+                        if os.path.exists(path):
+                            os.remove(path)
+
+    def put_chunk(self, upload_id, content_range, data):
+        """
+        Appends one chunk (Content-Range: bytes start-end/total). Returns
+        (HTTP status, payload): 409 with the expected offset if `start` is
+        not where the session left off, 422 if the finished file does not
+        match its SHA-1.
+        """
+        with self.lock:
+            state = self.session_state(upload_id)
+            if state is None:
+                return 404, {"error": "unknown session"}
+            meta_path, part_path = self._session_paths(upload_id)
+            if state["status"] == "complete":
+                return 200, state
+            if not content_range:
+                return 400, {"error": "missing Content-Range header"}
+            try:
+                span, _, total = content_range[len('bytes '):].partition('/')
+                start = int(span.split('-')[0])
+                total = int(total)
+            except ValueError:
+                return 400, {"error": f"invalid Content-Range: {content_range}"}
+            if start != state["offset"] or not data:
+                return 409, {"offset": state["offset"]}
+            with open(part_path, 'ab') as f:
+                f.write(data)
+            offset = state["offset"] + len(data)
+            if offset < total:
+                return 200, {"offset": offset, "status": "active"}
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            if offset != meta["size"] or _sha1_file(part_path) != meta["sha1"]:
+                os.remove(part_path)
+                os.remove(meta_path)
+                return 422, {"error": "checksum mismatch"}
+            self._place(part_path, meta)
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump(dict(meta, status="complete"), f)
+            return 200, {"offset": offset, "status": "complete"}
@@ -0,0 +1,416 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from photos_api import backoff_delay, retry_after_seconds
+from sync_state import open_db
+
+DEFAULT_UPLOAD_WORKERS = 4
+BATCH_MAX_FILES = 25
+BATCH_MAX_BYTES = 16 * 1024 * 1024
+LARGE_FILE_BYTES = 16 * 1024 * 1024   # at or above this, files go through a resumable session
+CHUNK_BYTES = 8 * 1024 * 1024
+MAX_BACKOFF = 300.0                   # seconds between attempts for a failing file
+
+# Endpoints on web_app_url
+BATCH_PATH = "/api/uploads/batch"
+SESSIONS_PATH = "/api/uploads/sessions"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS upload_outbox (
+    path        TEXT PRIMARY KEY,
+    action      TEXT NOT NULL,
+    size        INTEGER NOT NULL,
+    mtime_ns    INTEGER NOT NULL,
+    upload_id   TEXT,              -- resumable session for large files
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    next_try    REAL NOT NULL,     -- unix time
+    enqueued_at REAL NOT NULL,
+    error       TEXT               -- set when the server rejected the file for good; not retried
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_upload_outbox_due ON upload_outbox(next_try);
+"""
+
+UPLOADED = metrics.counter("gemini_uploads_total", "Finished uploads by result (uploaded, failed, rejected, vanished).")
+UPLOAD_BYTES = metrics.counter("gemini_upload_bytes_total", "Bytes sent to the web app.")
+OUTBOX_DEPTH = metrics.gauge("gemini_upload_outbox_depth", "Files waiting in the persistent upload outbox.")
+
+
+class UploadError(Exception):
+    def __init__(self, message, retry_after=None, permanent=False, status=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.permanent = permanent  # the server refused the file itself; retrying cannot help
+        self.status = status
+
+
+def file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _check(response):
+    """
+    Raises UploadError for anything but 2xx, carrying Retry-After for
+    429/503. Other 4xx responses are permanent, except 408 and the
+    401/403 of a wrong api_key, which is not the file's fault.
+    """
+    status = response.status_code
+    if status < 300:
+        return response
+    raise UploadError(f"HTTP {status}: {response.text[:200]}",
+                      retry_after_seconds(response.headers.get("Retry-After")),
+                      permanent=400 <= status < 500 and status not in (401, 403, 408, 429), status=status)
+
+
+class Outbox:
+    """
+    Persistent queue of files waiting to be uploaded, in the sync-state
+    database, so a restart mid-import picks up where it stopped (including
+    the offset of a half-sent large file).
+    """
+    def __init__(self, local_folder):
+        self.local_folder = local_folder
+        self.db = open_db(local_folder)
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def add(self, path, action):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        now = time.time()
+        with self.lock:
+            # A changed file restarts its upload (even if it was rejected); an unchanged one keeps its session
+            self.db.execute(
+                "INSERT INTO upload_outbox (path, action, size, mtime_ns, next_try, enqueued_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(path) DO UPDATE SET "
+                "upload_id = CASE WHEN size = excluded.size AND mtime_ns = excluded.mtime_ns "
+                "            THEN upload_id ELSE NULL END, "
+                "size = excluded.size, mtime_ns = excluded.mtime_ns, attempts = 0, next_try = excluded.next_try, "
+                "error = CASE WHEN size = excluded.size AND mtime_ns = excluded.mtime_ns THEN error ELSE NULL END",
+                (path, action, st.st_size, st.st_mtime_ns, now, now))
+            self.db.commit()
+        return True
+
+    def due(self, exclude, limit=500):
+        """Rows ready for an attempt: (path, action, size, mtime_ns, upload_id, attempts), oldest first."""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT path, action, size, mtime_ns, upload_id, attempts FROM upload_outbox "
+                "WHERE next_try <= ? AND error IS NULL ORDER BY enqueued_at LIMIT ?",
+                (time.time(), limit + len(exclude))).fetchall()
+        return [r for r in rows if r[0] not in exclude][:limit]
+
+    def next_due_in(self):
+        with self.lock:
+            row = self.db.execute("SELECT MIN(next_try) FROM upload_outbox WHERE error IS NULL").fetchone()
+        return None if row[0] is None else max(0.0, row[0] - time.time())
+
+    def set_session(self, path, upload_id):
+        with self.lock:
+            self.db.execute("UPDATE upload_outbox SET upload_id = ? WHERE path = ?", (upload_id, path))
+            self.db.commit()
+
+    def remove(self, paths, size_mtime=None):
+        """Drops finished rows; with `size_mtime`, only if the file was not re-queued meanwhile."""
+        with self.lock:
+            if size_mtime:
+                self.db.executemany(
+                    "DELETE FROM upload_outbox WHERE path = ? AND size = ? AND mtime_ns = ?",
+                    ((p, *size_mtime[p]) for p in paths))
+            else:
+                self.db.executemany("DELETE FROM upload_outbox WHERE path = ?", ((p,) for p in paths))
+            self.db.commit()
+
+    def retry_later(self, path, delay):
+        with self.lock:
+            self.db.execute("UPDATE upload_outbox SET attempts = attempts + 1, next_try = ? WHERE path = ?",
+                            (time.time() + delay, path))
+            self.db.commit()
+
+    def reject(self, path, error):
+        """Keeps the row, marked with the server's reason, until the file changes."""
+        with self.lock:
+            self.db.execute("UPDATE upload_outbox SET attempts = attempts + 1, error = ? WHERE path = ?",
+                            (error, path))
+            self.db.commit()
+
+    def count(self):
+        """Files still to upload; rejected ones are not counted."""
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM upload_outbox WHERE error IS NULL").fetchone()[0]
+
+    def rejected(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM upload_outbox WHERE error IS NOT NULL").fetchone()[0]
+
+
+class UploadPipeline:
+    """
+    Drains the outbox to the web app. Small files are packed into
+    multi-file POSTs; large ones use a resumable session, sent in chunks
+    with Content-Range so an interrupted transfer continues from the
+    server's offset. At most `workers` requests are in flight, and failures
+    back off per file without holding up the rest of the queue.
+    `on_uploaded(path)` runs after each file is confirmed.
+    """
+    def __init__(self, local_folder, base_url, token=None, workers=DEFAULT_UPLOAD_WORKERS,
+                 batch_files=BATCH_MAX_FILES, batch_bytes=BATCH_MAX_BYTES,
+                 large_file=LARGE_FILE_BYTES, chunk=CHUNK_BYTES, on_uploaded=None):
+        self.local_folder = local_folder
+        self.base_url = base_url.rstrip('/')
+        self.workers = max(1, int(workers))
+        self.batch_files = batch_files
+        self.batch_bytes = batch_bytes
+        self.large_file = large_file
+        self.chunk = chunk
+        self.on_uploaded = on_uploaded
+        self.outbox = Outbox(local_folder)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+        self.uploaded = 0
+        self.failed = 0
+        self._claimed = set()
+        self._slots = threading.BoundedSemaphore(self.workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="upload")
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, daemon=True, name="upload-dispatch")
+        self._dispatcher.start()
+        pending = self.outbox.count()
+        if pending:
+            logging.info(f"Resuming {pending} upload(s) left in the outbox")
+
+    def enqueue(self, path, action="Created"):
+        if self.outbox.add(path, action):
+            self._wake.set()
+
+    def pending(self):
+        return self.outbox.count()
+
+    def rejected(self):
+        """Files the web app refused (4xx); they are retried only once they change."""
+        return self.outbox.rejected()
+
+    def wait_idle(self, poll=0.2):
+        """
+        Blocks until nothing is uploading or due now. Returns True if the
+        outbox is empty; files backing off after a failure stay in it.
+        """
+        while True:
+            with self._lock:
+                busy = bool(self._claimed)
+            if not busy:
+                wait = self.outbox.next_due_in()
+                if wait is None:
+                    return True
+                if wait > 0:
+                    return False
+            time.sleep(poll)
+
+    def stop(self, wait=True):
+        """Stops dispatching; unfinished work stays in the outbox for the next start."""
+        self._stop.set()
+        self._wake.set()
+        self._dispatcher.join()
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+        if wait:
+            self.session.close()
+            self.outbox.close()
+
+    # --- Dispatch ---
+    def _dispatch_loop(self):
+        while not self._stop.is_set():
+            with self._lock:
+                claimed = set(self._claimed)
+            rows = self.outbox.due(claimed)
+            OUTBOX_DEPTH.set(self.outbox.count())
+            if not rows:
+                # Claimed rows are still due; a finishing job wakes us instead
+                wait = 1.0 if claimed else self.outbox.next_due_in()
+                self._wake.wait(None if wait is None else max(wait, 0.05))
+                self._wake.clear()
+                continue
+            for job in self._plan(rows):
+                self._slots.acquire()  # bounded concurrency: blocks while every worker is busy
+                if self._stop.is_set():
+                    self._slots.release()
+                    return
+                with self._lock:
+                    self._claimed.update(r[0] for r in job)
+                self._executor.submit(self._run, job)
+
+    def _plan(self, rows):
+        """Groups due rows into jobs: one per large file, packed batches for the rest."""
+        batch, batch_size = [], 0
+        for row in rows:
+            size = row[2]
+            if size >= self.large_file:
+                yield [row]
+                continue
+            if batch and (len(batch) >= self.batch_files or batch_size + size > self.batch_bytes):
+                yield batch
+                batch, batch_size = [], 0
+            batch.append(row)
+            batch_size += size
+        if batch:
+            yield batch
+
+    def _run(self, job):
+        paths = [r[0] for r in job]
+        try:
+            present = [r for r in job if self._unchanged(r)]
+            if present:
+                with metrics.span("upload", files=len(present)):
+                    if len(present) == 1 and present[0][2] >= self.large_file:
+                        if not self._upload_resumable(present[0]):
+                            present = []  # changed mid-upload; re-queued with its new size
+                    else:
+                        self._upload_batch(present)
+                self.outbox.remove([r[0] for r in present], {r[0]: (r[2], r[3]) for r in present})
+                for r in present:
+                    UPLOADED.inc(result="uploaded")
+                    UPLOAD_BYTES.inc(r[2])
+                    with self._lock:
+                        self.uploaded += 1
+                    if self.on_uploaded:
+                        try:
+                            self.on_uploaded(r[0])
+                        except Exception as e:
+                            logging.error(f"Post-upload step failed for {r[0]}: {e}")
+        except UploadError as e:
+            if not e.permanent:
+                self._retry(job, e)
+            else:
+                for r in job:
+                    self.outbox.reject(r[0], str(e))
+                    UPLOADED.inc(result="rejected")
+                with self._lock:
+                    self.failed += len(job)
+                logging.error(f"Upload of {len(job)} file(s) rejected ({e}); not retrying until they change")
+        except (requests.RequestException, OSError) as e:
+            self._retry(job, e)
+        finally:
+            with self._lock:
+                self._claimed.difference_update(paths)
+            self._slots.release()
+            self._wake.set()
+
+    def _retry(self, job, e):
+        for r in job:
+            delay = getattr(e, 'retry_after', None)
+            delay = min(MAX_BACKOFF, delay if delay is not None else 1 + backoff_delay(r[5]))
+            self.outbox.retry_later(r[0], delay)
+            UPLOADED.inc(result="failed")
+        with self._lock:
+            self.failed += len(job)
+        logging.warning(f"Upload of {len(job)} file(s) failed ({e}); retrying")
+
+    def _unchanged(self, row):
+        """False (and the row dropped or refreshed) if the file vanished or changed since it was queued."""
+        path, action, size, mtime_ns = row[:4]
+        try:
+            st = os.stat(path)
+        except OSError:
+            self.outbox.remove([path])
+            UPLOADED.inc(result="vanished")
+            return False
+        if st.st_size != size or st.st_mtime_ns != mtime_ns:
+            self.outbox.add(path, action)  # re-queued with the new size; a stale session is dropped
+            return False
+        return True
+
+    def _describe(self, path, size, action, sha1):
+        rel = os.path.relpath(path, self.local_folder)
+        return {"name": os.path.basename(path), "path": rel.replace(os.sep, '/'),
+                "album": os.path.dirname(rel).replace(os.sep, '/'), "size": size,
+                "sha1": sha1, "action": action}
+
+    # --- Transfers ---
+    def _upload_batch(self, rows):
+        manifest, files = [], []
+        try:
+            for i, (path, action, size, *_) in enumerate(rows):
+                with open(path, 'rb') as f:
+                    data = f.read()
+                manifest.append(self._describe(path, size, action, hashlib.sha1(data).hexdigest()))
+                files.append((f"file{i}", (os.path.basename(path), data, 'application/octet-stream')))
+            response = _check(self.session.post(
+                self.base_url + BATCH_PATH, timeout=120,
+                files=[("manifest", (None, json.dumps(manifest), 'application/json'))] + files))
+        finally:
+            files.clear()
+        results = response.json().get("results", [])
+        rejected = [r.get("path") for r in results if r.get("status") != "ok"]
+        if rejected:
+            raise UploadError(f"server rejected {len(rejected)} file(s): {rejected[:3]}")
+
+    def _upload_resumable(self, row):
+        path, action, size, _, upload_id, _ = row
+        offset, status = None, None
+        if upload_id:
+            response = self.session.get(f"{self.base_url}{SESSIONS_PATH}/{upload_id}", timeout=30)
+            if response.status_code == 200:
+                state = response.json()
+                offset, status = state.get("offset", 0), state.get("status")
+        if offset is None:
+            meta = self._describe(path, size, action, file_sha1(path))
+            data = _check(self.session.post(self.base_url + SESSIONS_PATH, json=meta, timeout=30)).json()
+            upload_id, offset = data["upload_id"], data.get("offset", 0)
+            self.outbox.set_session(path, upload_id)
+        elif offset:
+            logging.info(f"Resuming upload of {os.path.basename(path)} at {offset}/{size} bytes")
+
+        url = f"{self.base_url}{SESSIONS_PATH}/{upload_id}"
+        with open(path, 'rb') as f:
+            while offset < size:
+                f.seek(offset)
+                data = f.read(self.chunk)
+                if not data:
+                    # Shorter than when it was queued (re-exported or truncated); start over
+                    logging.info(f"{os.path.basename(path)} changed during upload; re-queued")
+                    self.outbox.add(path, action)
+                    return False
+                end = offset + len(data) - 1
+                response = self.session.put(
+                    url, data=data, timeout=120,
+                    headers={"Content-Range": f"bytes {offset}-{end}/{size}",
+                             "Content-Type": "application/octet-stream"})
+                if response.status_code == 404:
+                    # The server dropped the session; the next attempt opens a new one
+                    self.outbox.set_session(path, None)
+                    raise UploadError(f"session {upload_id} expired on the server")
+                if response.status_code == 409:
+                    # Out of step with the server; continue from its offset
+                    expected = response.json()["offset"]
+                    if expected == offset:
+                        raise UploadError(f"session {upload_id} refused the chunk at {offset}")
+                    offset = expected
+                    continue
+                state = _check(response).json()
+                offset, status = state.get("offset", end + 1), state.get("status")
+        if status != "complete":
+            raise UploadError(f"session {upload_id} not completed by the server")
+        return True
@@ -0,0 +1,171 @@
+import os
+import logging
+import threading
+
+import numpy as np
+
+from sync_state import open_db, state_dir
+
+DEFAULT_DIM = 64           # matches EMBEDDING_DIMENSION in services/vectorService.ts
+VECTORS_FILE = "vectors.f32"
+MIN_CAPACITY = 1024
+DEFAULT_K = 50
+MAX_K = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS vector_rows (
+    item_id TEXT PRIMARY KEY,
+    row     INTEGER NOT NULL UNIQUE
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS vector_meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class VectorIndex:
+    """
+    Cosine-similarity index over unit-normalised float32 embeddings stored in
+    one contiguous matrix, memory-mapped from disk so a restart only re-reads
+    the id -> row table. Deleted rows are zeroed and reused by later adds.
+    """
+    def __init__(self, local_folder, dim=DEFAULT_DIM):
+        self.local_folder = local_folder
+        self.path = os.path.join(state_dir(local_folder), VECTORS_FILE)
+        self.db = open_db(local_folder)
+        self.db.executescript(SCHEMA)
+        self.lock = threading.RLock()
+
+        row = self.db.execute("SELECT value FROM vector_meta WHERE key = 'dim'").fetchone()
+        if row:
+            self.dim = int(row[0])
+        else:
+            self.dim = dim
+            self.db.execute("INSERT INTO vector_meta VALUES ('dim', ?)", (str(dim),))
+            self.db.commit()
+
+        self.matrix = None
+        self._map(max(MIN_CAPACITY, self._file_rows()))
+        capacity = len(self.matrix)
+        self.ids = [None] * capacity
+        self.row_of = {}
+        self.valid = np.zeros(capacity, dtype=bool)
+        for item_id, r in self.db.execute("SELECT item_id, row FROM vector_rows"):
+            self.ids[r] = item_id
+            self.row_of[item_id] = r
+            self.valid[r] = True
+        self.size = max(self.row_of.values(), default=-1) + 1  # high-water mark
+        self.free = [r for r in range(self.size) if not self.valid[r]]
+        logging.info(f"Vector index: {len(self.row_of)} embeddings (dim {self.dim})")
+
+    def _file_rows(self):
+        if not os.path.exists(self.path):
+            return 0
+        return os.path.getsize(self.path) // (self.dim * 4)
+
+    def _map(self, capacity):
+        """(Re)maps the backing file, growing it to `capacity` rows."""
+        if self.matrix is not None:
+            self.matrix.flush()
+            del self.matrix
+        with open(self.path, 'ab') as f:
+            if f.tell() < capacity * self.dim * 4:
+                f.truncate(capacity * self.dim * 4)
+        self.matrix = np.memmap(self.path, dtype=np.float32, mode='r+', shape=(capacity, self.dim))
+
+    def _grow(self, needed):
+        capacity = len(self.matrix)
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2)
+        self._map(new_capacity)
+        self.ids.extend([None] * (new_capacity - capacity))
+        self.valid = np.concatenate([self.valid, np.zeros(new_capacity - capacity, dtype=bool)])
+
+    def __len__(self):
+        return len(self.row_of)
+
+    def add(self, ids, vectors):
+        """Inserts or replaces embeddings for `ids`."""
+        vectors = normalize(vectors)
+        if vectors.shape != (len(ids), self.dim):
+            raise ValueError(f"Expected {len(ids)} vectors of dimension {self.dim}")
+        with self.lock:
+            new = sum(1 for i in ids if i not in self.row_of)
+            self._grow(self.size + max(0, new - len(self.free)))
+            rows = []
+            for item_id in ids:
+                r = self.row_of.get(item_id)
+                if r is None:
+                    if self.free:
+                        r = self.free.pop()
+                    else:
+                        r = self.size
+                        self.size += 1
+                    self.row_of[item_id] = r
+                    self.ids[r] = item_id
+                    self.valid[r] = True
+                rows.append(r)
+            self.matrix[rows] = vectors
+            self.matrix.flush()
+            self.db.executemany("INSERT OR REPLACE INTO vector_rows VALUES (?, ?)", zip(ids, rows))
+            self.db.commit()
+
+    def delete(self, ids):
+        """Removes embeddings; returns how many existed."""
+        with self.lock:
+            rows = [self.row_of.pop(i) for i in ids if i in self.row_of]
+            if not rows:
+                return 0
+            self.matrix[rows] = 0.0
+            self.matrix.flush()
+            self.valid[rows] = False
+            for r in rows:
+                self.ids[r] = None
+            self.free.extend(rows)
+            self.db.executemany("DELETE FROM vector_rows WHERE item_id = ?", ((i,) for i in ids))
+            self.db.commit()
+            return len(rows)
+
+    def search(self, queries, k=DEFAULT_K, min_score=None):
+        """
+        Top-k cosine search for a batch of query vectors. Returns one list of
+        (id, score) pairs per query, best first.
+        """
+        queries = normalize(queries)
+        if queries.shape[1] != self.dim:
+            raise ValueError(f"Expected query vectors of dimension {self.dim}")
+        k = max(1, min(int(k), MAX_K))
+        with self.lock:
+            n = self.size
+            if not len(self.row_of):
+                return [[] for _ in queries]
+            scores = self.matrix[:n] @ queries.T          # (n, batch)
+            scores[~self.valid[:n]] = -np.inf
+            # Copied while locked: add/delete reuse rows in place, and scores must keep matching their ids
+            ids = self.ids[:n]
+        results = []
+        for column in scores.T:
+            top = min(k, len(column))
+            idx = np.argpartition(-column, top - 1)[:top] if top < len(column) else np.arange(len(column))
+            idx = idx[np.argsort(-column[idx])]
+            hits = [(ids[r], float(column[r])) for r in idx if np.isfinite(column[r])]
+            if min_score is not None:
+                hits = [h for h in hits if h[1] >= min_score]
+            results.append(hits)
+        return results
+
+    def close(self):
+        with self.lock:
+            self.matrix.flush()
+            self.db.close()
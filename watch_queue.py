@@ -0,0 +1,134 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+DEFAULT_DEBOUNCE = 2.0  # seconds a path must stay quiet before it is processed
+DEFAULT_WORKERS = 4
+
+WATCH_EVENTS = metrics.counter("gemini_watch_events_total", "Watcher totals by kind (events, coalesced, processed, failed).")
+
+
+class CoalescingQueue:
+    """
+    Collapses bursts of filesystem events into one job per path.
+    Each event (re)starts a quiet-period timer for its path; once the path has
+    been quiet for `debounce` seconds it is handed to a bounded worker pool.
+    Events for a path that is still being processed are held back and run
+    once it finishes. `handler(path, action)` does the actual work.
+    """
+    def __init__(self, handler, debounce=DEFAULT_DEBOUNCE, workers=DEFAULT_WORKERS, on_change=None):
+        self.handler = handler
+        self.debounce = debounce
+        self.on_change = on_change  # called with stats() whenever the depth changes
+        self._pending = {}          # path -> (last event time, action); oldest first
+        self._in_flight = set()     # handed to the pool: queued or running
+        self._running = 0
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sync")
+        self._slots = threading.BoundedSemaphore(workers)
+        self._stopped = False
+        self.events = 0
+        self.coalesced = 0
+        self.processed = 0
+        self.failed = 0
+        self.max_depth = 0
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, path, action):
+        with self._cond:
+            self.events += 1
+            WATCH_EVENTS.inc(kind="events")
+            previous = self._pending.pop(path, None)
+            if previous is not None:
+                self.coalesced += 1
+                WATCH_EVENTS.inc(kind="coalesced")
+                action = previous[1]  # keep the first action, e.g. "Created"
+            self._pending[path] = (time.monotonic(), action)
+            self.max_depth = max(self.max_depth, len(self._pending))
+            self._cond.notify_all()
+
+    def _take_ready(self):
+        """Pops every path whose quiet period has elapsed. Returns (ready, seconds to next)."""
+        now = time.monotonic()
+        ready, wait = [], None
+        for path, (stamp, action) in list(self._pending.items()):
+            remaining = stamp + self.debounce - now
+            if remaining > 0:
+                wait = remaining
+                break  # entries are ordered by last event, so the rest are newer
+            if path in self._in_flight:
+                continue
+            del self._pending[path]
+            ready.append((path, action))
+        return ready, wait
+
+    def _dispatch_loop(self):
+        while True:
+            with self._cond:
+                ready, wait = self._take_ready()
+                while not ready and not self._stopped:
+                    self._cond.wait(wait)
+                    ready, wait = self._take_ready()
+                if self._stopped:
+                    return
+                self._in_flight.update(path for path, _ in ready)
+            for path, action in ready:
+                self._slots.acquire()
+                self._executor.submit(self._run, path, action)
+            self._changed()
+
+    def _run(self, path, action):
+        with self._cond:
+            self._running += 1
+        try:
+            self.handler(path, action)
+            ok = True
+        except Exception as e:
+            ok = False
+            logging.error(f"Failed to sync {path}: {e}")
+        finally:
+            self._slots.release()
+            with self._cond:
+                self._in_flight.discard(path)
+                self._running -= 1
+                if ok:
+                    self.processed += 1
+                else:
+                    self.failed += 1
+                WATCH_EVENTS.inc(kind="processed" if ok else "failed")
+                self._cond.notify_all()
+            self._changed()
+
+    def _changed(self):
+        if self.on_change:
+            self.on_change(self.stats())
+
+    def stats(self):
+        """Queue-depth metrics: debouncing, queued for a worker, running, and totals."""
+        with self._cond:
+            return {
+                "pending": len(self._pending),
+                "queued": len(self._in_flight) - self._running,
+                "running": self._running,
+                "max_depth": self.max_depth,
+                "events": self.events,
+                "coalesced": self.coalesced,
+                "processed": self.processed,
+                "failed": self.failed,
+            }
+
+    def join(self):
+        """Blocks until every submitted path has been processed."""
+        with self._cond:
+            while self._pending or self._in_flight:
+                self._cond.wait()
+
+    def stop(self, wait=True):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._executor.shutdown(wait=wait)